@@ -0,0 +1,288 @@
+import json
+import math
+
+import numpy as np
+
+from instrumentation import stage
+from prefix_builder import haversine_np
+from vehicle_profiles import G, get_profile
+
+# ==============================
+# CONFIG
+# ==============================
+
+REFERENCE_STEP_M = 50     # resolution the adaptive sampler is measured against
+MAX_STEP_M = 1000         # never leave a gap longer than this
+MAX_HEADING_CHANGE_DEG = 15
+
+# Vehicle terms used to turn the energy bound into an elevation bound
+VEHICLE = get_profile()
+MASS_KG = VEHICLE["mass_kg"]
+REGEN_EFF = VEHICLE["regen_eff"]
+
+# Allowed cumulative energy error at ANY point of the route, compared
+# with the 50 m reference: 1 % SOC of the pack (450 Wh for 45 kWh).
+# Missed bumps always under-count energy, so the error only grows along
+# the route; a per-km average would hide a large one-sided miss.
+MAX_SOC_ERROR_PCT = 1.0
+MAX_ERROR_WH = VEHICLE["battery_kwh"] * 1000 * MAX_SOC_ERROR_PCT / 100
+
+# Per-span tolerance the refinement splits on. It does not bound the
+# route error by itself: midpoint probes miss narrow bumps and the
+# misses add up. On the sample route (1639 km, 19292 reference points)
+# 3 Wh/km keeps 14333 points but is 6681 Wh short by the end; holding
+# MAX_ERROR_WH takes ~0.2 Wh/km, which keeps almost every point (see
+# `python adaptive_sampling.py`). Adaptive sampling only pays off on
+# smoother elevation data than this.
+SPLIT_TOLERANCE_WH_PER_KM = 3.0
+TIGHTEN_FACTOR = 0.75
+
+
+# ==============================
+# Bearings along the reference
+# ==============================
+
+def bearings_deg(lat, lng):
+    lat1, lat2 = np.radians(lat[:-1]), np.radians(lat[1:])
+    dlon = np.radians(lng[1:] - lng[:-1])
+
+    x = np.sin(dlon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+
+    return (np.degrees(np.arctan2(x, y)) + 360) % 360
+
+
+# ==============================
+# STEP 1: Geometric keypoints (no API calls)
+# ==============================
+
+def select_geometric_keypoints(lat, lng, max_step_m=MAX_STEP_M,
+                               max_heading_change_deg=MAX_HEADING_CHANGE_DEG):
+    """
+    Indices of reference points to keep from geometry alone: a new point
+    whenever the accumulated heading change or the distance since the
+    last kept point exceeds its limit.
+    """
+    n = len(lat)
+    if n <= 2:
+        return list(range(n))
+
+    seg_m = haversine_np(lat[:-1], lng[:-1], lat[1:], lng[1:])
+    bearing = bearings_deg(lat, lng)
+
+    turn = np.abs((np.diff(bearing) + 180) % 360 - 180)
+
+    keep = [0]
+    acc_turn = 0.0
+    acc_dist = 0.0
+
+    for i in range(1, n - 1):
+        acc_dist += seg_m[i - 1]
+        acc_turn += turn[i - 1]
+
+        if acc_turn >= max_heading_change_deg or acc_dist + seg_m[i] > max_step_m:
+            keep.append(i)
+            acc_turn = 0.0
+            acc_dist = 0.0
+
+    keep.append(n - 1)
+    return keep
+
+
+# ==============================
+# STEP 2: Grade refinement (batched elevation lookups)
+# ==============================
+
+def elevation_tolerance_m(span_m, max_error_wh_per_km=SPLIT_TOLERANCE_WH_PER_KM):
+    """
+    A bump of height d missed between two kept points under-counts both
+    ascent and descent by d, i.e. an energy error of m·g·d·(1 − regen).
+    Returns the d that stays within the per-km error budget for the span.
+    """
+    budget_j = max_error_wh_per_km * (span_m / 1000) * 3600
+    return budget_j / (MASS_KG * G * (1 - REGEN_EFF))
+
+
+def sample_route_adaptive(reference_points, elevation_fn,
+                          max_step_m=MAX_STEP_M,
+                          max_heading_change_deg=MAX_HEADING_CHANGE_DEG,
+                          max_error_wh_per_km=SPLIT_TOLERANCE_WH_PER_KM):
+    """
+    Picks a subset of the 50 m reference positions (list of (lat, lng))
+    that is dense where heading or grade changes and sparse elsewhere.
+
+    `elevation_fn(list_of_latlng) -> list_of_elevations` is called once
+    per refinement round with every point that still needs a height, so
+    it maps directly onto batched Elevation API requests.
+
+    max_error_wh_per_km is the per-span split tolerance, checked at one
+    midpoint probe per span: bumps narrower than the probe spacing can
+    still be missed, so the route error is NOT bounded here (see
+    SPLIT_TOLERANCE_WH_PER_KM). sample_route_within_bound() enforces
+    MAX_ERROR_WH where the 50 m elevations are known.
+
+    Returns [{"lat", "lng", "elevation"}, ...] in route order.
+    """
+    ref = np.asarray(reference_points, dtype=float)
+    lat, lng = ref[:, 0], ref[:, 1]
+
+    seg_m = haversine_np(lat[:-1], lng[:-1], lat[1:], lng[1:])
+    cum_m = np.concatenate(([0.0], np.cumsum(seg_m)))
+
+    with stage("sample_route_adaptive", reference_points=len(ref)) as span:
+
+        keep = select_geometric_keypoints(lat, lng, max_step_m, max_heading_change_deg)
+
+        elevation = {}
+        for i, e in zip(keep, elevation_fn([tuple(ref[i]) for i in keep])):
+            elevation[i] = e
+
+        kept = set(keep)
+
+        spans = list(zip(keep[:-1], keep[1:]))
+        rounds = 1
+
+        while spans:
+            mids = [(a + b) // 2 for a, b in spans if b - a >= 2]
+            if not mids:
+                break
+
+            for i, e in zip(mids, elevation_fn([tuple(ref[i]) for i in mids])):
+                elevation[i] = e
+            rounds += 1
+
+            next_spans = []
+            for a, b in spans:
+                if b - a < 2:
+                    continue
+
+                mid = (a + b) // 2
+                t = (cum_m[mid] - cum_m[a]) / max(cum_m[b] - cum_m[a], 1e-9)
+                expected = elevation[a] + t * (elevation[b] - elevation[a])
+
+                tolerance = elevation_tolerance_m(cum_m[b] - cum_m[a], max_error_wh_per_km)
+
+                if abs(elevation[mid] - expected) > tolerance:
+                    kept.add(mid)
+                    next_spans.append((a, mid))
+                    next_spans.append((mid, b))
+
+            spans = next_spans
+
+        # Midpoints of spans that passed the test were only probes
+        kept = sorted(kept)
+
+        span.set("elevation_lookups", len(elevation))
+        span.set("kept_points", len(kept))
+        span.set("elevation_rounds", rounds)
+
+    return [
+        {"lat": float(lat[i]), "lng": float(lng[i]), "elevation": float(elevation[i])}
+        for i in kept
+    ]
+
+
+# ==============================
+# Error vs. the 50 m reference
+# ==============================
+
+def route_energy_wh(points, base_wh_per_km=VEHICLE["base_wh_per_km"]):
+    """
+    Cumulative route energy (Wh) at every point, same model as
+    energy_to_detour.energy_to_index.
+    """
+    lat = np.array([p["lat"] for p in points])
+    lng = np.array([p["lng"] for p in points])
+    elev = np.array([p["elevation"] for p in points])
+
+    d = haversine_np(lat[:-1], lng[:-1], lat[1:], lng[1:])
+    dh = np.diff(elev)
+
+    step = (
+        d / 1000 * base_wh_per_km
+        + MASS_KG * G * np.where(dh > 0, dh, 0) / 3600
+        - MASS_KG * G * np.where(dh < 0, -dh, 0) / 3600 * REGEN_EFF
+    )
+
+    return np.concatenate(([0.0], np.cumsum(step)))
+
+
+def energy_error_report(adaptive_points, reference_points):
+    """
+    Compares cumulative energy at every adaptive point with the 50 m
+    reference (both lists of {"lat", "lng", "elevation"}).
+    """
+    ref_energy = route_energy_wh(reference_points)
+    ada_energy = route_energy_wh(adaptive_points)
+
+    ref_lookup = {(p["lat"], p["lng"]): i for i, p in enumerate(reference_points)}
+    ref_idx = np.array([ref_lookup[(p["lat"], p["lng"])] for p in adaptive_points])
+
+    error = ada_energy - ref_energy[ref_idx]
+
+    lat = np.array([p["lat"] for p in reference_points])
+    lng = np.array([p["lng"] for p in reference_points])
+    total_km = float(np.sum(haversine_np(lat[:-1], lng[:-1], lat[1:], lng[1:]))) / 1000
+
+    return {
+        "reference_points": len(reference_points),
+        "adaptive_points": len(adaptive_points),
+        "reduction": round(len(reference_points) / len(adaptive_points), 2),
+        "route_km": round(total_km, 3),
+        "max_abs_error_wh": round(float(np.max(np.abs(error))), 2),
+        "final_error_wh": round(float(error[-1]), 2),
+        "final_error_wh_per_km": round(float(error[-1]) / max(total_km, 1e-9), 3),
+    }
+
+
+def sample_route_within_bound(reference_points, max_error_wh=MAX_ERROR_WH,
+                              tolerance=SPLIT_TOLERANCE_WH_PER_KM, max_rounds=20):
+    """
+    Adaptive sampling of a 50 m route with known elevations, tightening
+    the split tolerance by TIGHTEN_FACTOR until the cumulative energy
+    error at every kept point is within max_error_wh. Returns (points,
+    report); report adds the tolerance used and the elevation lookups of
+    the final run.
+    """
+    lookup = {(p["lat"], p["lng"]): p["elevation"] for p in reference_points}
+    positions = [(p["lat"], p["lng"]) for p in reference_points]
+
+    for _ in range(max_rounds):
+        calls = []
+
+        def elevation_from_reference(batch):
+            calls.append(len(batch))
+            return [lookup[pt] for pt in batch]
+
+        adaptive = sample_route_adaptive(positions, elevation_from_reference,
+                                         max_error_wh_per_km=tolerance)
+
+        report = energy_error_report(adaptive, reference_points)
+        report["split_tolerance_wh_per_km"] = round(tolerance, 3)
+        report["elevation_lookups"] = sum(calls)
+        report["elevation_api_calls"] = sum(math.ceil(c / 400) for c in calls)
+        report["within_bound"] = report["max_abs_error_wh"] <= max_error_wh
+
+        if report["within_bound"]:
+            break
+
+        tolerance *= TIGHTEN_FACTOR
+
+    return adaptive, report
+
+
+# ==============================
+# MAIN: evaluate against an existing 50 m route
+# ==============================
+
+if __name__ == "__main__":
+
+    with open("sampled_with_elevation_50m.json") as f:
+        reference = json.load(f)
+
+    adaptive, report = sample_route_within_bound(reference)
+    report["lookup_reduction"] = round(len(reference) / report["elevation_lookups"], 2)
+
+    print("✅" if report["within_bound"] else "❌",
+          f"Adaptive sampling vs 50 m reference (bound {MAX_ERROR_WH:.0f} Wh at any point):")
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,17 @@
+import os
+
+# ==============================
+# EXTERNAL API BASE URLS
+# ==============================
+# Every fetcher builds its URL from these, so the whole pipeline can be
+# pointed at replay_server.py (or any stand-in) without live keys:
+#   EVJ_GOOGLE_MAPS_URL=http://127.0.0.1:8765 EVJ_OPENWEATHER_URL=http://127.0.0.1:8765 python main.py
+
+GOOGLE_MAPS_BASE_URL = os.environ.get("EVJ_GOOGLE_MAPS_URL", "https://maps.googleapis.com").rstrip("/")
+OPENWEATHER_BASE_URL = os.environ.get("EVJ_OPENWEATHER_URL", "https://api.openweathermap.org").rstrip("/")
+
+DIRECTIONS_URL = GOOGLE_MAPS_BASE_URL + "/maps/api/directions/json"
+ELEVATION_URL = GOOGLE_MAPS_BASE_URL + "/maps/api/elevation/json"
+
+WEATHER_URL = OPENWEATHER_BASE_URL + "/data/2.5/weather"
+FORECAST_URL = OPENWEATHER_BASE_URL + "/data/2.5/forecast"   # 3-hourly, 5 days
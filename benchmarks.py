@@ -0,0 +1,541 @@
+import argparse
+import contextlib
+import csv
+import io
+import json
+import math
+import os
+import platform
+import runpy
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# ==============================
+# CONFIG
+# ==============================
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+RESULTS_FILE = "benchmark_results.json"
+
+# Default sizes keep a run under a few minutes; use --scale full for
+# the national-scale sizes (2M route points, 1M stations).
+SCALES = {
+    "small": {"route_points": [10_000], "stations": [10_000]},
+    "medium": {"route_points": [10_000, 200_000], "stations": [10_000, 100_000]},
+    "full": {"route_points": [10_000, 200_000, 2_000_000], "stations": [10_000, 100_000, 1_000_000]},
+}
+
+# A stage fails the regression check when it is this much slower
+# than the baseline run (0.25 → 25 % slower).
+DEFAULT_TOLERANCE = 0.25
+
+# Mumbai, the origin of the reference route
+ORIGIN = (19.1103, 72.9256)
+STEP_M = 50
+
+STATION_COLUMNS = [
+    "id", "name", "type", "latitude", "longitude", "network_id",
+    "ratings", "city", "status", "updated_at", "elevation",
+]
+
+
+# ==============================
+# SYNTHETIC ROUTES
+# ==============================
+
+def synthetic_elevation(distance_m, rng):
+    """
+    Coastal plain → ghat climb → rolling plateau, plus short-wave noise.
+    Mirrors the Mumbai → Pune profile (0 → ~600 m).
+    """
+    km = distance_m / 1000
+    total_km = max(km[-1], 1.0)
+
+    # Ghat climb over ~15 km, a third of the way in (capped for long routes)
+    ghat_start = min(total_km / 3, 60)
+    climb = 550 / (1 + np.exp(-(km - ghat_start - 7) / 2.5))
+
+    # Rolling hills on the plateau
+    phase = rng.uniform(0, 2 * math.pi, 3)
+    rolling = (
+        40 * np.sin(2 * math.pi * km / 23 + phase[0])
+        + 15 * np.sin(2 * math.pi * km / 4.7 + phase[1])
+        + 4 * np.sin(2 * math.pi * km / 0.9 + phase[2])
+    )
+
+    noise = np.cumsum(rng.normal(0, 0.15, len(km)))
+    noise -= np.linspace(0, noise[-1], len(km))   # keep it bounded
+
+    return np.maximum(climb + rolling + noise + 20, 0)
+
+
+def synthetic_route(n_points, seed=0):
+    """
+    Route of `n_points` sampled every 50 m with a meandering heading
+    and a realistic elevation profile. Same schema as
+    sampled_with_elevation_wind.json.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Heading drifts slowly (highway) with occasional sharper bends
+    turn = rng.normal(0, 0.6, n_points) + rng.normal(0, 12, n_points) * (rng.random(n_points) < 0.01)
+    heading = np.radians(135 + np.cumsum(turn) * 0.1)
+
+    dlat = STEP_M * np.cos(heading) / 111_320
+    dlng = STEP_M * np.sin(heading) / (111_320 * math.cos(math.radians(ORIGIN[0])))
+
+    lat = ORIGIN[0] + np.concatenate(([0.0], np.cumsum(dlat[1:])))
+    lng = ORIGIN[1] + np.concatenate(([0.0], np.cumsum(dlng[1:])))
+
+    elevation = synthetic_elevation(np.arange(n_points) * STEP_M, rng)
+
+    return [
+        {
+            "lat": float(a),
+            "lng": float(b),
+            "elevation": float(e),
+            "wind_speed": 3.38,
+            "wind_direction": 268,
+        }
+        for a, b, e in zip(lat, lng, elevation)
+    ]
+
+
+def synthetic_polyline(route):
+    """
+    Irregular raw polyline (like a decoded Directions response) that
+    resamples back to roughly `len(route)` points at 50 m.
+    """
+    rng = np.random.default_rng(len(route))
+    keep = np.flatnonzero(rng.random(len(route)) < 0.3)
+    keep = np.unique(np.concatenate(([0], keep, [len(route) - 1])))
+
+    return [(route[i]["lat"], route[i]["lng"]) for i in keep]
+
+
+# ==============================
+# SYNTHETIC STATIONS
+# ==============================
+
+def synthetic_stations(n_stations, route, seed=1):
+    """
+    Half the stations scattered within ~8 km of the corridor, the rest
+    spread over the route's bounding box (the "national" background).
+    """
+    rng = np.random.default_rng(seed)
+
+    lat = np.array([p["lat"] for p in route])
+    lng = np.array([p["lng"] for p in route])
+
+    n_near = n_stations // 2
+    anchor = rng.integers(0, len(route), n_near)
+    near_lat = lat[anchor] + rng.normal(0, 0.035, n_near)
+    near_lng = lng[anchor] + rng.normal(0, 0.035, n_near)
+
+    n_far = n_stations - n_near
+    far_lat = rng.uniform(lat.min() - 1, lat.max() + 1, n_far)
+    far_lng = rng.uniform(lng.min() - 1, lng.max() + 1, n_far)
+
+    all_lat = np.concatenate((near_lat, far_lat))
+    all_lng = np.concatenate((near_lng, far_lng))
+    elevation = rng.uniform(0, 700, n_stations)
+    has_elevation = rng.random(n_stations) < 0.8
+
+    rows = []
+    for i in range(n_stations):
+        rows.append({
+            "id": str(100000 + i),
+            "name": f"Synthetic Station {i}",
+            "type": "PUBLIC",
+            "latitude": f"{all_lat[i]:.6f}",
+            "longitude": f"{all_lng[i]:.6f}",
+            "network_id": str(int(rng.integers(1, 40))),
+            "ratings": f"{rng.uniform(0, 5):.1f}",
+            "city": "Synthetic",
+            "status": "1",
+            "updated_at": "2025-12-23 19:09:22",
+            "elevation": f"{elevation[i]:.3f}" if has_elevation[i] else "",
+        })
+
+    return rows
+
+
+def write_stations_csv(rows, filename):
+    with open(filename, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=STATION_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+# ==============================
+# STAGE RUNNERS
+# ==============================
+
+@contextlib.contextmanager
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    with quiet():
+        result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def run_script(name, workdir):
+    """
+    Runs a stage script exactly as the pipeline does (it reads and writes
+    its artifacts in the working directory) and returns elapsed seconds.
+    """
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        elapsed, _ = timed(runpy.run_path, os.path.join(REPO_DIR, name), {}, "__main__")
+    finally:
+        os.chdir(cwd)
+
+    return elapsed
+
+
+def bench_route_stages(route):
+    """
+    Stages that depend only on the route.
+    """
+    import main
+    import prefix_builder
+    import energy_model_with_wind
+
+    results = []
+    raw = synthetic_polyline(route)
+
+    seconds, sampled = timed(main.sample_route, raw, STEP_M)
+    results.append({"stage": "sample_route", "seconds": seconds, "items": len(sampled)})
+
+    seconds, _ = timed(prefix_builder.build_prefix_arrays, route)
+    results.append({"stage": "build_prefix_arrays", "seconds": seconds, "items": len(route)})
+
+    seconds, _ = timed(prefix_builder.build_prefix_arrays_np, route)
+    results.append({"stage": "build_prefix_arrays_np", "seconds": seconds, "items": len(route)})
+
+    seconds, profile = timed(energy_model_with_wind.simulate_energy, route)
+    results.append({"stage": "simulate_energy", "seconds": seconds, "items": len(profile)})
+
+    return results
+
+
+def bench_station_stages(route, n_stations, workdir):
+    """
+    Station stages, chained through their on-disk artifacts.
+    """
+    import prefix_builder
+
+    with open(os.path.join(workdir, "sampled_with_elevation_50m.json"), "w") as f:
+        json.dump(route, f)
+
+    cum_distance, cum_ascent, cum_descent = prefix_builder.build_prefix_arrays_np(route)
+    with open(os.path.join(workdir, "prefix_arrays.json"), "w") as f:
+        json.dump({
+            "cum_distance_m": cum_distance.tolist(),
+            "cum_ascent_m": cum_ascent.tolist(),
+            "cum_descent_m": cum_descent.tolist(),
+        }, f)
+
+    write_stations_csv(synthetic_stations(n_stations, route), os.path.join(workdir, "stations.csv"))
+
+    results = []
+
+    results.append({"stage": "filter_stations", "seconds": run_script("filter_stations.py", workdir)})
+
+    # candidates.py reads the 5 km corridor file under its older name
+    os.replace(
+        os.path.join(workdir, "filtered_stations.json"),
+        os.path.join(workdir, "relevant_stations_5km.json"),
+    )
+    with open(os.path.join(workdir, "relevant_stations_5km.json")) as f:
+        results[-1]["items"] = len(json.load(f))
+
+    for stage, script in [
+        ("candidates", "candidates.py"),
+        ("energy_to_detour", "energy_to_detour.py"),
+        ("detour_energy", "detour_energy.py"),
+        ("best_station_soc", "best_station_soc.py"),
+    ]:
+        results.append({"stage": stage, "seconds": run_script(script, workdir)})
+
+    return results
+
+
+# ==============================
+# NUMERICAL EQUIVALENCE
+# ==============================
+
+def check_prefix_arrays(route):
+    import prefix_builder
+
+    reference = prefix_builder.build_prefix_arrays(route)
+    fast = prefix_builder.build_prefix_arrays_np(route)
+
+    return max(
+        float(np.max(np.abs(np.asarray(ref) - got)))
+        for ref, got in zip(reference, fast)
+    )
+
+
+def _max_diff(reference, fast):
+    reference = np.asarray(reference, dtype=float)
+    fast = np.asarray(fast, dtype=float)
+
+    if reference.shape != fast.shape:
+        return math.inf
+    return float(np.max(np.abs(reference - fast))) if reference.size else 0.0
+
+
+def check_jit_sample_route(route):
+    import jit_kernels
+    import main
+
+    if not jit_kernels.available():
+        return None
+
+    raw = synthetic_polyline(route)
+
+    with jit_kernels.python_only():
+        reference = main.sample_route(raw, STEP_M)
+    fast = main.sample_route(raw, STEP_M)
+
+    return _max_diff(reference, fast)
+
+
+def check_jit_simulate_energy(route):
+    import energy_model_with_wind
+    import jit_kernels
+
+    if not jit_kernels.available():
+        return None
+
+    with quiet():
+        with jit_kernels.python_only():
+            reference = energy_model_with_wind.simulate_energy(route)
+        fast = energy_model_with_wind.simulate_energy(route)
+
+    return _max_diff(
+        [(r["distance_m"], r["soc"]) for r in reference],
+        [(r["distance_m"], r["soc"]) for r in fast],
+    )
+
+
+def check_jit_side_of_route(route):
+    """Number of stations whose side differs (0 when equivalent)."""
+    import filter_stations
+    import jit_kernels
+
+    if not jit_kernels.available():
+        return None
+
+    rows = synthetic_stations(5000, route)
+    with quiet():
+        with jit_kernels.python_only():
+            reference = filter_stations.filter_stations(route, rows, side="left")
+            reference += filter_stations.filter_stations(route, rows, side="right")
+        fast = filter_stations.filter_stations(route, rows, side="left")
+        fast += filter_stations.filter_stations(route, rows, side="right")
+
+    key = lambda r: (r["id"], r["side"])
+    return float(len(set(map(key, reference)) ^ set(map(key, fast))))
+
+
+# name → fn(route) returning the max absolute difference between the
+# fast path and the scalar reference implementation (None = not
+# available here, e.g. numba missing)
+EQUIVALENCE_CHECKS = {
+    "build_prefix_arrays_np": check_prefix_arrays,
+    "jit_sample_route": check_jit_sample_route,
+    "jit_simulate_energy": check_jit_simulate_energy,
+    "jit_side_of_route": check_jit_side_of_route,
+}
+
+EQUIVALENCE_ATOL = 1e-6
+
+
+def run_equivalence(route, checks=None):
+    report = []
+
+    for name, check in EQUIVALENCE_CHECKS.items():
+        if checks is not None and name not in checks:
+            continue
+
+        max_diff = check(route)
+        report.append({
+            "check": name,
+            "max_abs_diff": max_diff,
+            "ok": max_diff is None or max_diff <= EQUIVALENCE_ATOL,
+        })
+
+    return report
+
+
+def print_equivalence(equivalence):
+    for e in equivalence:
+        if e["max_abs_diff"] is None:
+            print(f"⏭️  {e['check']}: skipped (not available here)")
+        else:
+            print(f"{'✅' if e['ok'] else '❌'} {e['check']}: max |Δ| = {e['max_abs_diff']:.3g}")
+
+
+def jit_equivalence(n_points=10_000):
+    """Compiled kernels vs their Python references; exit code."""
+    sys.path.insert(0, REPO_DIR)
+
+    equivalence = run_equivalence(
+        synthetic_route(n_points, seed=7),
+        [name for name in EQUIVALENCE_CHECKS if name.startswith("jit_")]
+    )
+    print_equivalence(equivalence)
+
+    return 0 if all(e["ok"] for e in equivalence) else 1
+
+
+# ==============================
+# REGRESSION THRESHOLDS
+# ==============================
+
+def result_key(r):
+    return f"{r['stage']}@{r['route_points']}x{r.get('stations', 0)}"
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Returns the list of stages slower than baseline × (1 + tolerance).
+    """
+    reference = {result_key(r): r["seconds"] for r in baseline["results"]}
+    regressions = []
+
+    for r in results:
+        key = result_key(r)
+        if key not in reference:
+            continue
+
+        limit = reference[key] * (1 + tolerance)
+        if r["seconds"] > limit:
+            regressions.append({
+                "key": key,
+                "seconds": r["seconds"],
+                "baseline_seconds": reference[key],
+                "limit_seconds": limit,
+            })
+
+    return regressions
+
+
+# ==============================
+# MAIN
+# ==============================
+
+def run(scale, repeat=1):
+    sizes = SCALES[scale]
+    results = []
+
+    for n_points in sizes["route_points"]:
+        route = synthetic_route(n_points)
+        print(f"🚀 Route stages @ {n_points} points")
+
+        for _ in range(repeat):
+            for r in bench_route_stages(route):
+                r["route_points"] = n_points
+                results.append(r)
+
+        for n_stations in sizes["stations"]:
+            print(f"🚀 Station stages @ {n_points} points × {n_stations} stations")
+
+            for _ in range(repeat):
+                with tempfile.TemporaryDirectory() as workdir:
+                    for r in bench_station_stages(route, n_stations, workdir):
+                        r["route_points"] = n_points
+                        r["stations"] = n_stations
+                        results.append(r)
+
+    # Keep the best of `repeat` runs per stage
+    best = {}
+    for r in results:
+        key = result_key(r)
+        if key not in best or r["seconds"] < best[key]["seconds"]:
+            best[key] = r
+
+    return list(best.values())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stage-level benchmarks on synthetic routes")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", default=RESULTS_FILE)
+    parser.add_argument("--baseline", help="previous results JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--skip-equivalence", action="store_true")
+    parser.add_argument("--equivalence-only", action="store_true",
+                        help="only compare fast paths with their references, no timings")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, REPO_DIR)
+
+    if args.equivalence_only:
+        equivalence = run_equivalence(synthetic_route(SCALES[args.scale]["route_points"][0], seed=7))
+        print_equivalence(equivalence)
+        return 0 if all(e["ok"] for e in equivalence) else 1
+
+    results = run(args.scale, args.repeat)
+
+    equivalence = []
+    if not args.skip_equivalence:
+        print("🔍 Checking fast paths against scalar references...")
+        equivalence = run_equivalence(synthetic_route(SCALES[args.scale]["route_points"][0], seed=7))
+
+    report = {
+        "meta": {
+            "scale": args.scale,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+        "equivalence": equivalence,
+    }
+
+    failed = False
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        report["regressions"] = compare_to_baseline(results, baseline, args.tolerance)
+        failed = bool(report["regressions"])
+
+    if any(not e["ok"] for e in equivalence):
+        failed = True
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for r in sorted(results, key=result_key):
+        print(f"{result_key(r):45s} {r['seconds'] * 1000:10.1f} ms")
+
+    print_equivalence(equivalence)
+
+    for reg in report.get("regressions", []):
+        print(f"❌ REGRESSION {reg['key']}: {reg['seconds']:.3f}s > {reg['limit_seconds']:.3f}s")
+
+    print(f"\n✅ Results saved → {args.output}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,12 @@
 import json
+import os
+from instrumentation import traced
+from vehicle_profiles import get_profile
 
-BATTERY_CAPACITY_KWH = 45.0
+BATTERY_CAPACITY_KWH = float(get_profile()["battery_kwh"])
+
+# Monte Carlo arrival SOC spread (soc_ensemble.py); 0 turns it off
+ENSEMBLE_SAMPLES = int(os.environ.get("EVJ_ENSEMBLE_SAMPLES", "4000"))
 
 
 # -----------------------------
@@ -24,12 +30,17 @@ def compute_arrival_soc(total_energy_kwh):
 # -----------------------------
 # BUILD MAP OUTPUT JSON
 # -----------------------------
+@traced("best_station_soc")
 def build_map_ready_output(stations, route_points):
 
     output = []
 
     for station in stations:
 
+        # No route point within reach → nothing to detour from
+        if not station["candidate_detours"]:
+            continue
+
         best = choose_best_candidate(station)
 
         idx = best["route_idx"]
@@ -69,18 +80,95 @@ def build_map_ready_output(stations, route_points):
     return output
 
 
+# -----------------------------
+# STEP 10: BEST CANDIDATE TABLE
+# -----------------------------
+def step10_build_best_dataframe(stations):
+    """
+    One row per station (its best detour candidate), sorted by energy.
+    Returns a pandas DataFrame.
+    """
+    import pandas as pd
+
+    rows = []
+
+    for station in stations:
+
+        if not station["candidate_detours"]:
+            continue
+
+        best = choose_best_candidate(station)
+
+        rows.append({
+            "station_id": station["id"],
+            "station_name": station["name"],
+            "distance_to_route_km": station.get("distance_to_route_km"),
+            "best_route_idx": best["route_idx"],
+            "energy_used_kWh": round(best["total_energy_to_station_kwh"], 3),
+            "arrival_SOC_%": compute_arrival_soc(best["total_energy_to_station_kwh"]),
+        })
+
+    df = pd.DataFrame(rows, columns=[
+        "station_id", "station_name", "distance_to_route_km",
+        "best_route_idx", "energy_used_kWh", "arrival_SOC_%"
+    ])
+
+    return df.sort_values("energy_used_kWh").reset_index(drop=True)
+
+
 # -----------------------------
 # RUN SCRIPT
 # -----------------------------
-with open("stations_with_total_energy.json") as f:
-    stations = json.load(f)
+if __name__ == "__main__":
+
+    with open("stations_with_total_energy.json") as f:
+        stations = json.load(f)
+
+    with open("sampled_with_elevation_50m.json") as f:
+        route_points = json.load(f)
+
+    map_data = build_map_ready_output(stations, route_points)
+
+    # P10/P50/P90 arrival SOC and reach probability next to the point estimate
+    if ENSEMBLE_SAMPLES:
+        from soc_ensemble import ensemble_arrival_soc
+
+        prefix = None
+        if os.path.exists("prefix_arrays.json"):
+            with open("prefix_arrays.json") as f:
+                prefix = json.load(f)
+
+        # A stale or missing prefix file is rebuilt from the route instead
+        if prefix is None or len(prefix["cum_distance_m"]) != len(route_points):
+            from prefix_builder import build_prefix_arrays_np
+
+            print("⚠️  prefix_arrays.json missing or not for this route, rebuilding it for the SOC ensemble")
+            cum_distance, cum_ascent, cum_descent = build_prefix_arrays_np(route_points)
+            prefix = {
+                "cum_distance_m": cum_distance.tolist(),
+                "cum_ascent_m": cum_ascent.tolist(),
+                "cum_descent_m": cum_descent.tolist(),
+            }
+
+        ensemble = ensemble_arrival_soc(stations, route_points, prefix, samples=ENSEMBLE_SAMPLES)
+        for row in map_data:
+            row.update(ensemble.get(row["station_id"], {}))
+    else:
+        print("ℹ️  SOC ensemble off (EVJ_ENSEMBLE_SAMPLES=0)")
+
+    with open("map_visualization.json", "w") as f:
+        json.dump(map_data, f, indent=2)
+
+    print("✅ Saved map_visualization.json with source_to_detour_km included")
 
-with open("sampled_with_elevation_50m.json") as f:
-    route_points = json.load(f)
+    # Cache the result for this corridor so station deltas can patch/invalidate it
+    from station_store import STATION_STORE_FILE
 
-map_data = build_map_ready_output(stations, route_points)
+    if os.path.exists(STATION_STORE_FILE):
+        from station_store import StationStore
 
-with open("map_visualization.json", "w") as f:
-    json.dump(map_data, f, indent=2)
+        store = StationStore(STATION_STORE_FILE)
+        corridor_id = store.register_corridor(route_points, map_data)
+        store.close()
 
-print("✅ Saved map_visualization.json with source_to_detour_km included")
+        print("✅ Corridor result cached:", corridor_id)
@@ -1,6 +1,15 @@
 import json
 import math
-from scipy.spatial import KDTree
+from instrumentation import stage
+from route_pyramid import build_route_pyramid, nearest_route_points
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+TOP_K = 5
+MAX_VALID_KM = 5.0  # safety cutoff
+PYRAMID_SLACK = 1.01  # rounding margin; haversine check decides
+
 
 # -----------------------------
 # HAVERSINE DISTANCE (km)
@@ -22,140 +31,130 @@ def haversine(lat1, lon1, lat2, lon2):
 
 
 # -----------------------------
-# Convert lat/lon → XY meters
+# STEP 7: Top-K Candidate Points
 # -----------------------------
-def latlon_to_xy(lat, lon, ref_lat):
+def find_candidates(route_points, cum_distance_m, stations, top_k=TOP_K,
+                    max_valid_km=MAX_VALID_KM, route_pyramid=None):
     """
-    Convert lat/lon degrees into local Cartesian meters
-    so KDTree works correctly.
+    Up to top_k nearby route points per station as detour candidates.
+    Returns copies of the stations with "candidate_detours" attached.
     """
-    R = 6371000  # Earth radius in meters
+    # Coarse-to-fine index (5 km → 500 m → 50 m) on the sphere, in meters
+    if route_pyramid is None:
+        route_pyramid = build_route_pyramid(
+            [p["lat"] for p in route_points],
+            [p["lng"] for p in route_points],
+            cum_distance_m
+        )
 
-    x = math.radians(lon) * R * math.cos(math.radians(ref_lat))
-    y = math.radians(lat) * R
+    output = []
 
-    return (x, y)
+    with stage("candidates", stations=len(stations)):
 
+        # Stations with no route point near enough are rejected at the
+        # coarse levels and simply get no candidates
+        survivors, _, nearest = nearest_route_points(
+            route_pyramid,
+            [float(s["latitude"]) for s in stations],
+            [float(s["longitude"]) for s in stations],
+            k=top_k,
+            max_distance_m=max_valid_km * 1000 * PYRAMID_SLACK
+        )
+        nearest_by_station = dict(zip(survivors.tolist(), nearest))
 
-# -----------------------------
-# LOAD ROUTE POINTS
-# -----------------------------
-with open("sampled_with_elevation_50m.json") as f:
-    route_points = json.load(f)
+        for pos, station in enumerate(stations):
 
-print("✅ Loaded route points:", len(route_points))
+            lat = float(station["latitude"])
+            lon = float(station["longitude"])
 
-# Reference latitude (for projection)
-ref_lat = route_points[0]["lat"]
+            indices = nearest_by_station.get(pos, [])
 
-# Build route coordinates in meters
-route_xy = [
-    latlon_to_xy(p["lat"], p["lng"], ref_lat)
-    for p in route_points
-]
+            candidates = []
 
-# KDTree built correctly in projected space
-route_kdtree = KDTree(route_xy)
+            for idx in indices:
 
-print("✅ Route KDTree built in METERS")
+                # Fewer than top_k points inside the search radius
+                if idx >= len(route_points):
+                    continue
 
+                route_lat = route_points[idx]["lat"]
+                route_lon = route_points[idx]["lng"]
 
-# -----------------------------
-# LOAD PREFIX ARRAYS
-# -----------------------------
-with open("prefix_arrays.json") as f:
-    prefix_data = json.load(f)
+                # -----------------------------
+                # (1) Station → Detour distance (off-route)
+                # -----------------------------
+                detour_to_station_km = haversine(lat, lon, route_lat, route_lon)
 
-cum_distance_m = prefix_data["cum_distance_m"]
+                if detour_to_station_km > max_valid_km:
+                    continue
 
-print("✅ Loaded prefix cumulative distance array")
+                # -----------------------------
+                # (2) Source → Detour distance (on-route, from prefix)
+                # -----------------------------
+                source_to_detour_km = cum_distance_m[idx] / 1000
 
+                # -----------------------------
+                # (3) Total distance estimate
+                # -----------------------------
+                total_km = source_to_detour_km + detour_to_station_km
 
-# -----------------------------
-# LOAD FILTERED STATIONS
-# -----------------------------
-with open("relevant_stations_5km.json") as f:
-    stations = json.load(f)
+                candidates.append({
+                    "route_idx": int(idx),
 
-print("✅ Loaded relevant stations:", len(stations))
+                    # Distance from station to route point
+                    "detour_to_station_km": round(detour_to_station_km, 3),
 
+                    # Distance from source to detour point (route-following)
+                    "source_to_detour_km": round(source_to_detour_km, 3),
 
-# -----------------------------
-# STEP 7: Top-K Candidate Points
-# -----------------------------
-TOP_K = 5
-MAX_VALID_KM = 5.0  # safety cutoff
-
-for station in stations:
-
-    lat = float(station["latitude"])
-    lon = float(station["longitude"])
-
-    # Convert station to XY meters
-    station_xy = latlon_to_xy(lat, lon, ref_lat)
-
-    # Query KDTree for nearest points
-    distances, indices = route_kdtree.query(station_xy, k=TOP_K)
-
-    candidates = []
-
-    for idx in indices:
+                    # Total travel distance
+                    "total_distance_km": round(total_km, 3)
+                })
 
-        route_lat = route_points[idx]["lat"]
-        route_lon = route_points[idx]["lng"]
+            # Attach candidate list
+            output.append({**station, "candidate_detours": candidates})
 
-        # -----------------------------
-        # (1) Station → Detour distance (off-route)
-        # -----------------------------
-        detour_to_station_km = haversine(lat, lon, route_lat, route_lon)
+    return output
 
-        if detour_to_station_km > MAX_VALID_KM:
-            continue
 
-        # -----------------------------
-        # (2) Source → Detour distance (on-route, from prefix)
-        # -----------------------------
-        source_to_detour_km = cum_distance_m[idx] / 1000
+# -----------------------------
+# MAIN
+# -----------------------------
+if __name__ == "__main__":
 
-        # -----------------------------
-        # (3) Total distance estimate
-        # -----------------------------
-        total_km = source_to_detour_km + detour_to_station_km
+    with open("sampled_with_elevation_50m.json") as f:
+        route_points = json.load(f)
 
-        candidates.append({
-            "route_idx": int(idx),
+    print("✅ Loaded route points:", len(route_points))
 
-            # Distance from station to route point
-            "detour_to_station_km": round(detour_to_station_km, 3),
+    with open("prefix_arrays.json") as f:
+        prefix_data = json.load(f)
 
-            # Distance from source to detour point (route-following)
-            "source_to_detour_km": round(source_to_detour_km, 3),
+    print("✅ Loaded prefix cumulative distance array")
 
-            # Total travel distance
-            "total_distance_km": round(total_km, 3)
-        })
+    with open("relevant_stations_5km.json") as f:
+        stations = json.load(f)
 
-    # Attach candidate list
-    station["candidate_detours"] = candidates
+    print("✅ Loaded relevant stations:", len(stations))
 
+    stations = find_candidates(route_points, prefix_data["cum_distance_m"], stations)
 
-# -----------------------------
-# SAVE OUTPUT
-# -----------------------------
-with open("stations_with_candidates.json", "w", encoding="utf-8") as f:
-    json.dump(stations, f, indent=2)
+    # -----------------------------
+    # SAVE OUTPUT
+    # -----------------------------
+    with open("stations_with_candidates.json", "w", encoding="utf-8") as f:
+        json.dump(stations, f, indent=2)
 
-print("\n✅ STEP 7 DONE (Upgraded with Prefix Distance)")
-print("Saved → stations_with_candidates.json")
+    print("\n✅ STEP 7 DONE (Upgraded with Prefix Distance)")
+    print("Saved → stations_with_candidates.json")
 
+    # -----------------------------
+    # DEBUG CHECK: route_idx=0 issue
+    # -----------------------------
+    count0 = 0
+    for s in stations:
+        for c in s["candidate_detours"]:
+            if c["route_idx"] == 0:
+                count0 += 1
 
-# -----------------------------
-# DEBUG CHECK: route_idx=0 issue
-# -----------------------------
-count0 = 0
-for s in stations:
-    for c in s["candidate_detours"]:
-        if c["route_idx"] == 0:
-            count0 += 1
-
-print("\n🔍 Stations containing route_idx=0 candidates:", count0)
+    print("\n🔍 Stations containing route_idx=0 candidates:", count0)
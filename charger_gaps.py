@@ -0,0 +1,243 @@
+import argparse
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fleet_energy import fleet_energy_kwh
+from instrumentation import stage
+from vehicle_profiles import DEFAULT_PROFILE, get_profile, profile_arrays
+
+# ==============================
+# CONFIG
+# ==============================
+
+PREFIX_FILE = "prefix_arrays.json"
+STATIONS_FILE = "filtered_stations.json"
+OUTPUT_FILE = "charger_gaps.json"
+
+# A route position x is covered by a station accessed at route position a
+# with off-route distance d when |x - a| + d <= REACH_KM.
+REACH_KM = 5
+TOP_N = 50
+
+
+# ==============================
+# ACCESS POINTS
+# ==============================
+
+def access_points(stations):
+    """
+    (route_idx, detour_km) of each station's closest access point.
+
+    Accepts any of the pipeline's station records: candidates
+    (candidate_detours), filter_stations (nearest_route_index) or
+    map_visualization rows (best_route_idx).
+    """
+    idx = []
+    detour_km = []
+
+    for s in stations:
+        if s.get("candidate_detours"):
+            best = min(s["candidate_detours"], key=lambda c: c["detour_to_station_km"])
+            idx.append(best["route_idx"])
+            detour_km.append(best["detour_to_station_km"])
+        elif "nearest_route_index" in s:
+            idx.append(s["nearest_route_index"])
+            detour_km.append(s["distance_to_route_km"])
+        elif "best_route_idx" in s:
+            idx.append(s["best_route_idx"])
+            detour_km.append(s["total_distance_km"] - s["source_to_detour_km"])
+
+    return np.array(idx, dtype=np.int64), np.array(detour_km, dtype=float)
+
+
+# ==============================
+# COVERAGE SWEEP
+# ==============================
+
+def coverage_gaps(route_length_m, access_m, reach_m):
+    """
+    Uncovered stretches of [0, route_length_m] given one coverage
+    interval [access - reach, access + reach] per station.
+
+    Sort by interval start (the only O(n log n) step), then a running
+    maximum of interval ends gives how far the route is covered before
+    each interval; an interval starting beyond that opens a gap.
+    Returns (gap_start_m, gap_end_m) arrays in route order.
+    """
+    access_m = np.asarray(access_m, dtype=float)
+    reach_m = np.asarray(reach_m, dtype=float)
+
+    # Stations out of reach cover nothing
+    keep = reach_m > 0
+    starts = np.clip(access_m[keep] - reach_m[keep], 0, route_length_m)
+    ends = np.clip(access_m[keep] + reach_m[keep], 0, route_length_m)
+
+    if len(starts) == 0:
+        return np.array([0.0]), np.array([float(route_length_m)])
+
+    order = np.argsort(starts, kind="stable")
+    starts = starts[order]
+    covered_to = np.maximum.accumulate(ends[order])
+
+    prev_end = np.concatenate(([0.0], covered_to[:-1]))
+    opens = starts > prev_end
+
+    gap_start = prev_end[opens]
+    gap_end = starts[opens]
+
+    # Stretch after the last covered position
+    if covered_to[-1] < route_length_m:
+        gap_start = np.append(gap_start, covered_to[-1])
+        gap_end = np.append(gap_end, route_length_m)
+
+    return gap_start, gap_end
+
+
+# ==============================
+# PER-CORRIDOR GAPS
+# ==============================
+
+def corridor_gaps(prefix, stations, reach_km=REACH_KM, vehicle=DEFAULT_PROFILE, corridor=None):
+    """
+    Gap segments of one corridor with their length, route indices,
+    climb and energy cost (energy_to_detour model, prefix arrays).
+    Longest first.
+    """
+    cum_distance = np.asarray(prefix["cum_distance_m"], dtype=float)
+    cum_ascent = np.asarray(prefix["cum_ascent_m"], dtype=float)
+    cum_descent = np.asarray(prefix["cum_descent_m"], dtype=float)
+
+    idx, detour_km = access_points(stations)
+    idx = np.clip(idx, 0, len(cum_distance) - 1)
+
+    gap_start, gap_end = coverage_gaps(
+        cum_distance[-1], cum_distance[idx], (reach_km - detour_km) * 1000
+    )
+
+    # Cumulative energy is linear in the prefix arrays
+    cum_energy = fleet_energy_kwh(
+        profile_arrays([vehicle]), cum_distance / 1000, cum_ascent, cum_descent
+    )[0]
+
+    energy = np.interp(gap_end, cum_distance, cum_energy) - np.interp(gap_start, cum_distance, cum_energy)
+    ascent = np.interp(gap_end, cum_distance, cum_ascent) - np.interp(gap_start, cum_distance, cum_ascent)
+
+    battery_kwh = get_profile(vehicle)["battery_kwh"]
+    start_idx = np.searchsorted(cum_distance, gap_start, side="left")
+    end_idx = np.searchsorted(cum_distance, gap_end, side="right") - 1
+
+    gaps = []
+    for i in np.argsort(gap_start - gap_end, kind="stable"):
+        gaps.append({
+            "corridor": corridor,
+            "start_km": round(float(gap_start[i]) / 1000, 3),
+            "end_km": round(float(gap_end[i]) / 1000, 3),
+            "length_km": round(float(gap_end[i] - gap_start[i]) / 1000, 3),
+            "start_idx": int(start_idx[i]),
+            "end_idx": int(end_idx[i]),
+            "ascent_m": round(float(ascent[i]), 1),
+            "energy_kwh": round(float(energy[i]), 3),
+            "soc_drop_pct": round(float(energy[i]) / battery_kwh * 100, 2),
+        })
+
+    return gaps
+
+
+# ==============================
+# BATCH (many corridors)
+# ==============================
+
+def load_corridor(entry):
+    from station_stream import read_records
+
+    with open(entry["prefix"]) as f:
+        prefix = json.load(f)
+
+    return prefix, list(read_records(entry["stations"]))
+
+
+def _corridor_job(args):
+    entry, reach_km, vehicle = args
+    prefix, stations = load_corridor(entry)
+    name = entry.get("name", entry["stations"])
+
+    return name, corridor_gaps(prefix, stations, reach_km, vehicle, corridor=name)
+
+
+def gap_report(corridors, reach_km=REACH_KM, vehicle=DEFAULT_PROFILE, top=TOP_N, workers=1):
+    """
+    corridors: [{"name", "prefix": file, "stations": file}, ...].
+    Every corridor is independent, so they are spread over worker
+    processes; the ranked top gaps are merged at the end.
+    """
+    jobs = [(entry, reach_km, vehicle) for entry in corridors]
+
+    with stage("charger_gaps", corridors=len(jobs)):
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_corridor_job, jobs, chunksize=16))
+        else:
+            results = [_corridor_job(job) for job in jobs]
+
+    summary = {}
+    all_gaps = []
+
+    for name, gaps in results:
+        summary[name] = {
+            "gaps": len(gaps),
+            "longest_gap_km": gaps[0]["length_km"] if gaps else 0.0,
+            "uncovered_km": round(sum(g["length_km"] for g in gaps), 3),
+        }
+        all_gaps.extend(gaps)
+
+    all_gaps.sort(key=lambda g: (-g["length_km"], -g["energy_kwh"]))
+
+    return {
+        "reach_km": reach_km,
+        "vehicle": vehicle,
+        "corridors": summary,
+        "gaps": all_gaps[:top],
+    }
+
+
+# ==============================
+# MAIN
+# ==============================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Longest stretches without a reachable charger")
+    parser.add_argument("--prefix", default=PREFIX_FILE)
+    parser.add_argument("--stations", default=STATIONS_FILE,
+                        help="station records with route indices (JSON or NDJSON)")
+    parser.add_argument("--manifest", help="NDJSON of {name, prefix, stations} per corridor")
+    parser.add_argument("--reach-km", type=float, default=REACH_KM)
+    parser.add_argument("--vehicle", default=DEFAULT_PROFILE)
+    parser.add_argument("--top", type=int, default=TOP_N)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--out", default=OUTPUT_FILE)
+    args = parser.parse_args(argv)
+
+    if args.manifest:
+        from station_stream import read_records
+
+        corridors = list(read_records(args.manifest))
+    else:
+        corridors = [{"name": "route", "prefix": args.prefix, "stations": args.stations}]
+
+    report = gap_report(corridors, args.reach_km, args.vehicle, args.top, args.workers)
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"✅ {len(corridors)} corridor(s), reach {args.reach_km} km → {args.out}")
+    for g in report["gaps"][:5]:
+        print(
+            f"   {g['corridor']}: {g['start_km']}–{g['end_km']} km "
+            f"({g['length_km']} km, {g['energy_kwh']} kWh)"
+        )
+
+
+if __name__ == "__main__":
+    main()
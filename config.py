@@ -0,0 +1,2 @@
+GOOGLE_MAPS_API_KEY="dummy"
+OPENWEATHER_API_KEY="dummy"
@@ -0,0 +1,148 @@
+import argparse
+import json
+import math
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+from energy_model_with_wind import BATTERY_CAPACITY_WH, CAR_SPEED, simulate_departures
+from wind_data import FORECAST_FILE, load_forecast
+
+# ==============================
+# CONFIG
+# ==============================
+
+ROUTE_FILE = "sampled_with_elevation_50m.json"
+PREFIX_FILE = "prefix_arrays.json"     # cum_time_s / segment_speed_ms
+OUTPUT_FILE = "departure_plan.json"
+
+SLOTS = 48
+SLOT_MINUTES = 30
+
+# Slots within this much of the best energy count as the same window
+WINDOW_TOLERANCE_PCT = 1.0
+
+
+# ==============================
+# DEPARTURE GRID
+# ==============================
+
+def departure_grid(start_s, slots=SLOTS, slot_minutes=SLOT_MINUTES):
+    return start_s + np.arange(slots) * slot_minutes * 60.0
+
+
+def next_slot(now_s, slot_minutes=SLOT_MINUTES):
+    step = slot_minutes * 60
+    return math.ceil(now_s / step) * step
+
+
+def best_window(energy_wh, feasible, tolerance_pct=WINDOW_TOLERANCE_PCT):
+    """
+    (best slot, first slot, last slot) of the contiguous run of feasible
+    slots around the lowest-energy one whose energy stays within
+    tolerance_pct of it. Infeasible slots (SOC below minimum) only win
+    when no slot is feasible.
+    """
+    ranked = np.where(feasible, energy_wh, np.inf) if feasible.any() else energy_wh
+    best = int(np.argmin(ranked))
+    limit = ranked[best] * (1 + tolerance_pct / 100)
+
+    lo = best
+    while lo > 0 and ranked[lo - 1] <= limit:
+        lo -= 1
+
+    hi = best
+    while hi < len(ranked) - 1 and ranked[hi + 1] <= limit:
+        hi += 1
+
+    return best, lo, hi
+
+
+def plan_departures(points, forecast, departures_s, speeds=None, cum_time_s=None,
+                    tolerance_pct=WINDOW_TOLERANCE_PCT):
+    result = simulate_departures(points, forecast, departures_s, speeds, cum_time_s)
+
+    feasible = np.isnan(result["charge_at_km"])
+    best, lo, hi = best_window(result["energy_wh"], feasible, tolerance_pct)
+
+    def stamp(s):
+        return datetime.fromtimestamp(s).isoformat(timespec="minutes")
+
+    slots = [
+        {
+            "departure": stamp(t),
+            "energy_kwh": round(float(e) / 1000, 3),
+            "min_soc_pct": round(float(m) * 100, 2),
+            "charge_at_km": None if np.isnan(c) else round(float(c), 2),
+        }
+        for t, e, m, c in zip(
+            departures_s, result["energy_wh"], result["min_soc"], result["charge_at_km"]
+        )
+    ]
+
+    return {
+        "best_departure": slots[best]["departure"],
+        "window": {"from": slots[lo]["departure"], "to": slots[hi]["departure"]},
+        "saving_vs_worst_kwh": round(
+            float(result["energy_wh"].max() - result["energy_wh"][best]) / 1000, 3
+        ),
+        "battery_kwh": BATTERY_CAPACITY_WH / 1000,
+        "slots": slots,
+    }
+
+
+# ==============================
+# MAIN
+# ==============================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Best departure time under a wind forecast")
+    parser.add_argument("--route", default=ROUTE_FILE)
+    parser.add_argument("--prefix", default=PREFIX_FILE)
+    parser.add_argument("--forecast", default=FORECAST_FILE)
+    parser.add_argument("--start", help="first departure, ISO local time (default: next slot)")
+    parser.add_argument("--slots", type=int, default=SLOTS)
+    parser.add_argument("--slot-minutes", type=int, default=SLOT_MINUTES)
+    parser.add_argument("--tolerance-pct", type=float, default=WINDOW_TOLERANCE_PCT)
+    parser.add_argument("--out", default=OUTPUT_FILE)
+    args = parser.parse_args(argv)
+
+    with open(args.route) as f:
+        points = json.load(f)
+
+    forecast = load_forecast(args.forecast)
+
+    speeds = None
+    cum_time_s = None
+    if os.path.exists(args.prefix):
+        with open(args.prefix) as f:
+            prefix = json.load(f)
+
+        if len(prefix["cum_distance_m"]) == len(points) and "cum_time_s" in prefix:
+            speeds = prefix["segment_speed_ms"]
+            cum_time_s = prefix["cum_time_s"]
+        else:
+            print(f"⚠️  {args.prefix} does not match this route, using {CAR_SPEED} m/s")
+
+    if args.start:
+        start_s = datetime.fromisoformat(args.start).timestamp()
+    else:
+        start_s = next_slot(time.time(), args.slot_minutes)
+
+    departures_s = departure_grid(start_s, args.slots, args.slot_minutes)
+
+    plan = plan_departures(points, forecast, departures_s, speeds, cum_time_s, args.tolerance_pct)
+
+    with open(args.out, "w") as f:
+        json.dump(plan, f, indent=2)
+
+    print("✅ Best departure:", plan["best_departure"],
+          f"(window {plan['window']['from']} → {plan['window']['to']},"
+          f" saves {plan['saving_vs_worst_kwh']} kWh vs worst)")
+    print("Saved →", args.out)
+
+
+if __name__ == "__main__":
+    main()
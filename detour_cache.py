@@ -0,0 +1,170 @@
+import os
+import sqlite3
+import time
+
+from instrumentation import cache_lookup, stage
+
+# ==============================
+# CONFIG
+# ==============================
+
+DETOUR_CACHE_FILE = os.environ.get("EVJ_DETOUR_CACHE", "detour_cache.sqlite")
+
+# Access points are snapped to a ~33 m grid, so the same stretch of
+# highway maps to the same key on every trip, whatever the 50 m sample
+# phase of the new route.
+ACCESS_GRID_DEG = 0.0003
+
+SQL_CHUNK = 500   # stay well under SQLite's bound-parameter limit
+
+
+def access_key(lat, lng, grid_deg=ACCESS_GRID_DEG):
+    return f"{round(lat / grid_deg)}:{round(lng / grid_deg)}"
+
+
+def station_version(station):
+    """
+    Anything that changes the detour result: coordinates, elevation and
+    the feed's updated_at stamp.
+    """
+    return "|".join(
+        str(station.get(field, "") or "")
+        for field in ("latitude", "longitude", "elevation", "updated_at")
+    )
+
+
+# ==============================
+# CACHE
+# ==============================
+
+class DetourCache:
+    """
+    Persistent detour geometry per (station id, access point, method).
+
+    Stored values are vehicle-independent (distance, ascent, descent), so
+    one cache serves every vehicle profile; energy is recomputed from
+    them, which is cheap. `method` is "road:<graph fingerprint>"
+    (road_graph.py) or "twist" (straight line × twist factor).
+    """
+
+    def __init__(self, filename=DETOUR_CACHE_FILE):
+        self.db = sqlite3.connect(filename)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS stations (
+                station_id TEXT PRIMARY KEY,
+                version    TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS detours (
+                station_id TEXT NOT NULL,
+                access_key TEXT NOT NULL,
+                method     TEXT NOT NULL,
+                detour_km  REAL NOT NULL,
+                ascent_m   REAL NOT NULL,
+                descent_m  REAL NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (station_id, access_key, method)
+            );
+        """)
+
+    def close(self):
+        self.db.close()
+
+    # -----------------------------
+    # Invalidation
+    # -----------------------------
+    def invalidate(self, station_ids):
+        station_ids = list(station_ids)
+
+        with self.db:
+            for i in range(0, len(station_ids), SQL_CHUNK):
+                chunk = station_ids[i:i + SQL_CHUNK]
+                marks = ",".join("?" * len(chunk))
+                self.db.execute(f"DELETE FROM detours WHERE station_id IN ({marks})", chunk)
+                self.db.execute(f"DELETE FROM stations WHERE station_id IN ({marks})", chunk)
+
+    def sync_stations(self, stations):
+        """
+        Drops cached detours of stations whose coordinates, elevation or
+        updated_at differ from the cached version. Returns their ids.
+        """
+        current = {str(s["id"]): station_version(s) for s in stations}
+        ids = list(current)
+        known = {}
+
+        # Only the given stations, so streamed chunks don't rescan the table
+        for i in range(0, len(ids), SQL_CHUNK):
+            chunk = ids[i:i + SQL_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            known.update(self.db.execute(
+                f"SELECT station_id, version FROM stations WHERE station_id IN ({marks})", chunk
+            ))
+
+        changed = [sid for sid, v in current.items() if sid in known and known[sid] != v]
+        self.invalidate(changed)
+
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO stations (station_id, version) VALUES (?, ?)",
+                current.items()
+            )
+
+        return changed
+
+    def drop_stale_road(self, method):
+        """Deletes routed detours computed on any other road graph."""
+        with self.db:
+            cur = self.db.execute(
+                "DELETE FROM detours WHERE method LIKE 'road%' AND method != ?", (method,)
+            )
+        return cur.rowcount
+
+    # -----------------------------
+    # Lookup / store
+    # -----------------------------
+    def get_many(self, keys, method):
+        """
+        keys: iterable of (station_id, access_key).
+        Returns {key: (detour_km, ascent_m, descent_m)} for the hits.
+        """
+        keys = set(keys)
+        station_ids = sorted({sid for sid, _ in keys})
+        found = {}
+
+        with stage("detour_cache_get", keys=len(keys)):
+            for i in range(0, len(station_ids), SQL_CHUNK):
+                chunk = station_ids[i:i + SQL_CHUNK]
+                marks = ",".join("?" * len(chunk))
+
+                rows = self.db.execute(
+                    f"SELECT station_id, access_key, detour_km, ascent_m, descent_m "
+                    f"FROM detours WHERE method = ? AND station_id IN ({marks})",
+                    [method, *chunk]
+                )
+
+                for sid, key, km, ascent, descent in rows:
+                    if (sid, key) in keys:
+                        found[(sid, key)] = (km, ascent, descent)
+
+        for key in keys:
+            cache_lookup("detour", key in found)
+
+        return found
+
+    def put_many(self, values, method):
+        """
+        values: {(station_id, access_key): (detour_km, ascent_m, descent_m)}
+        """
+        now = time.time()
+
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO detours "
+                "(station_id, access_key, method, detour_km, ascent_m, descent_m, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(sid, key, method, *geom, now) for (sid, key), geom in values.items()]
+            )
+
+    def stats(self):
+        stations, = self.db.execute("SELECT COUNT(*) FROM stations").fetchone()
+        detours, = self.db.execute("SELECT COUNT(*) FROM detours").fetchone()
+        return {"stations": stations, "detours": detours}
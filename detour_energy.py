@@ -1,21 +1,24 @@
+import hashlib
 import json
 import math
+import os
+from detour_cache import DETOUR_CACHE_FILE, DetourCache, access_key
+from instrumentation import stage
+from vehicle_profiles import G, get_profile
 
 # -----------------------------
 # VEHICLE CONSTANTS
 # -----------------------------
-BATTERY_KWH = 45
+VEHICLE = get_profile()   # vehicle_profiles.DEFAULT_PROFILE
 
-vehicle_mass = 2000
-passenger_mass = 120
-luggage_mass = 70
+BATTERY_KWH = VEHICLE["battery_kwh"]
 
-mass = vehicle_mass + passenger_mass + luggage_mass
+mass = VEHICLE["mass_kg"]
 
-g = 9.81
-regen_eff = 0.40
+g = G
+regen_eff = VEHICLE["regen_eff"]
 
-base_Wh_per_km = 30200 / 280  # ≈108 Wh/km
+base_Wh_per_km = VEHICLE["base_wh_per_km"]
 
 
 # -----------------------------
@@ -68,7 +71,13 @@ def compute_cumulative_distances(route_points):
 # -----------------------------
 # STEP 2: DETOUR ENERGY FUNCTION
 # -----------------------------
-def estimate_detour_energy(route_point, station):
+def detour_geometry(route_point, station, road_km=None):
+    """
+    (detour_km, ascent_m, descent_m) from a route point to a station.
+
+    road_km: routed access distance from road_graph.py, if available.
+    Otherwise straight-line distance × twist_factor.
+    """
 
     twist_factor = 1.3
 
@@ -81,16 +90,20 @@ def estimate_detour_energy(route_point, station):
 
     raw_elev = station.get("elevation", 0)
 
+    # Unknown → no climb; station_elevation.py backfills these from the DEM
     if raw_elev in ["", None]:
         S_elev = P_elev
     else:
         S_elev = float(raw_elev)
 
-    # Straight line distance
-    straight_km = haversine(P_lat, P_lon, S_lat, S_lon)
+    if road_km is not None:
+        detour_km = road_km
+    else:
+        # Straight line distance
+        straight_km = haversine(P_lat, P_lon, S_lat, S_lon)
 
-    # Approximate detour road twist
-    detour_km = straight_km * twist_factor
+        # Approximate detour road twist
+        detour_km = straight_km * twist_factor
 
     # Elevation delta
     delta_elev = S_elev - P_elev
@@ -103,6 +116,11 @@ def estimate_detour_energy(route_point, station):
     elif delta_elev < 0:
         descent_m = abs(delta_elev) * 0.85
 
+    return detour_km, ascent_m, descent_m
+
+
+def detour_energy_kwh(detour_km, ascent_m, descent_m):
+
     # Energy calculation
     E_flat = (detour_km * base_Wh_per_km) / 1000
     E_climb = (mass * g * ascent_m) / 3.6e6
@@ -112,76 +130,202 @@ def estimate_detour_energy(route_point, station):
     return round(max(E_detour, 0), 5)
 
 
+def estimate_detour_energy(route_point, station, road_km=None):
+    return detour_energy_kwh(*detour_geometry(route_point, station, road_km))
+
+
 # -----------------------------
-# LOAD ROUTE + STATIONS
+# DETOUR GEOMETRY (cached, road-routed if possible)
 # -----------------------------
-with open("sampled_with_elevation_50m.json") as f:
-    route_points = json.load(f)
+# With a preprocessed road graph (python road_graph.py build ...) the
+# access distances are routed in one batch; otherwise straight line ×
+# twist factor. Either way, results persist in detour_cache.sqlite keyed
+# by (station id, snapped access point), so repeated corridors only
+# compute detours for new or changed stations.
+#
+# Routed distances are cached under "road:<graph fingerprint>", so a
+# rebuilt graph starts from an empty road cache. Pairs the graph can't
+# connect fall back to the twist estimate, cached as "twist" and routed
+# again next run.
+ROAD_GRAPH_FILE = "road_graph_ch.npz"
 
-with open("stations_with_energy.json") as f:
-    stations = json.load(f)
 
+def graph_fingerprint(road_graph_file):
+    """Changes whenever the graph file is rebuilt (size + mtime)."""
+    st = os.stat(road_graph_file)
+    return hashlib.sha1(f"{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()[:12]
 
-# -----------------------------
-# BUILD SOURCE → ROUTE DISTANCES
-# -----------------------------
-print("⏳ Computing cumulative route distances...")
-cumulative_km = compute_cumulative_distances(route_points)
-print("✅ Done.")
 
+def load_router(road_graph_file=ROAD_GRAPH_FILE):
+    """RoadRouter over the preprocessed graph, or None without one."""
+    if not road_graph_file or not os.path.exists(road_graph_file):
+        return None
 
-# -----------------------------
-# APPLY TO EACH DETOUR CANDIDATE
-# -----------------------------
-for station in stations:
+    from road_graph import RoadRouter, load_hierarchy
 
-    for cand in station["candidate_detours"]:
+    router = RoadRouter(load_hierarchy(road_graph_file))
+    router.cache_method = "road:" + graph_fingerprint(road_graph_file)
 
-        idx = cand["route_idx"]
-        route_point = route_points[idx]
+    return router
 
-        # ✅ Accurate distance from source → detour point
-        source_to_detour = cumulative_km[idx]
-        cand["source_to_detour_km"] = round(source_to_detour, 3)
 
-        # Total distance = route travel + detour travel
-        cand["total_distance_km"] = round(
-            cand["source_to_detour_km"] + cand["detour_to_station_km"], 3
+def apply_detour_energy(stations, route_points, cumulative_km, cache, router=None):
+    """
+    Detour energy, total energy and arrival SOC for every candidate
+    detour of `stations` (in place), using an open DetourCache.
+    Works on any slice of the station list, so callers can stream
+    chunks through one cache and router.
+    """
+    changed = cache.sync_stations(stations)
+    if changed:
+        print(f"♻️  {len(changed)} station(s) changed since last run, cache entries dropped")
+
+    method = getattr(router, "cache_method", "road") if router else "twist"
+
+    if router:
+        stale = cache.drop_stale_road(method)
+        if stale:
+            print(f"🗑  Dropped {stale} detours routed on an older road graph")
+
+    pair_keys = {}
+    for s, station in enumerate(stations):
+        for cand in station["candidate_detours"]:
+            p = route_points[cand["route_idx"]]
+            pair_keys[(s, cand["route_idx"])] = (str(station["id"]), access_key(p["lat"], p["lng"]))
+
+    geometry = cache.get_many(pair_keys.values(), method)
+    misses = [pair for pair, key in pair_keys.items() if key not in geometry]
+
+    # Pairs whose distance really is routed (cached or computed now)
+    routed = {pair for pair, key in pair_keys.items() if key in geometry} if router else set()
+
+    print(f"🗄  Detour cache: {len(pair_keys) - len(misses)} hits, {len(misses)} to compute ({method})")
+
+    road_km = {}
+    if router and misses:
+        meters = router.pair_distances_m(
+            [route_points[idx]["lat"] for _, idx in misses],
+            [route_points[idx]["lng"] for _, idx in misses],
+            [float(stations[s]["latitude"]) for s, _ in misses],
+            [float(stations[s]["longitude"]) for s, _ in misses],
         )
 
-        # Detour energy
-        detour_energy = estimate_detour_energy(route_point, station)
-        cand["detour_energy_kwh"] = detour_energy
+        for pair, m in zip(misses, meters):
+            # Unreachable in the extract → straight-line estimate
+            if math.isfinite(m):
+                road_km[pair] = m / 1000
 
-        # Total energy
-        total_energy = cand["energy_from_source_kwh"] + detour_energy
-        cand["total_energy_to_station_kwh"] = round(total_energy, 4)
+    computed = {}
+    for pair in misses:
+        s, idx = pair
+        computed[pair] = detour_geometry(route_points[idx], stations[s], road_km.get(pair))
 
-        # SOC remaining
-        used_pct = (total_energy / BATTERY_KWH) * 100
-        cand["soc_remaining_at_station_pct"] = round(100 - used_pct, 2)
+    routed |= set(road_km)
 
+    cache.put_many({pair_keys[p]: geom for p, geom in computed.items() if p in road_km}, method)
+    cache.put_many({pair_keys[p]: geom for p, geom in computed.items() if p not in road_km}, "twist")
 
-# -----------------------------
-# SAVE FINAL OUTPUT
-# -----------------------------
-with open("stations_with_total_energy.json", "w", encoding="utf-8") as f:
-    json.dump(stations, f, indent=2)
+    # -----------------------------
+    # APPLY TO EACH DETOUR CANDIDATE
+    # -----------------------------
+    with stage("detour_energy", stations=len(stations)):
+
+        for s, station in enumerate(stations):
+
+            for cand in station["candidate_detours"]:
 
-print("\n✅ COMPLETE")
-print("Saved → stations_with_total_energy.json")
+                idx = cand["route_idx"]
+
+                # Computed this run, else cached for this access point
+                geom = computed.get((s, idx)) or geometry[pair_keys[(s, idx)]]
+
+                if (s, idx) in routed:
+                    cand["detour_road_km"] = round(geom[0], 3)
+
+                # ✅ Accurate distance from source → detour point
+                source_to_detour = cumulative_km[idx]
+                cand["source_to_detour_km"] = round(source_to_detour, 3)
+
+                # Total distance = route travel + detour travel
+                cand["total_distance_km"] = round(
+                    cand["source_to_detour_km"] + cand["detour_to_station_km"], 3
+                )
+
+                # Detour energy
+                detour_energy = detour_energy_kwh(*geom)
+                cand["detour_energy_kwh"] = detour_energy
+
+                # Total energy
+                total_energy = cand["energy_from_source_kwh"] + detour_energy
+                cand["total_energy_to_station_kwh"] = round(total_energy, 4)
+
+                # SOC remaining
+                used_pct = (total_energy / BATTERY_KWH) * 100
+                cand["soc_remaining_at_station_pct"] = round(100 - used_pct, 2)
+
+    return stations
+
+
+def route_cumulative_km(route_points):
+    print("⏳ Computing cumulative route distances...")
+    with stage("cumulative_distances", points=len(route_points)):
+        cumulative_km = compute_cumulative_distances(route_points)
+    print("✅ Done.")
+
+    return cumulative_km
+
+
+def add_detour_energy(stations, route_points, road_graph_file=ROAD_GRAPH_FILE,
+                      cache_file=DETOUR_CACHE_FILE):
+    """
+    Adds detour energy, total energy and arrival SOC to every candidate
+    detour (in place). cache_file=None skips the persistent cache.
+    Returns the stations.
+    """
+    cumulative_km = route_cumulative_km(route_points)
+
+    cache = DetourCache(cache_file or ":memory:")
+    try:
+        return apply_detour_energy(
+            stations, route_points, cumulative_km, cache, load_router(road_graph_file)
+        )
+    finally:
+        cache.close()
 
 
 # -----------------------------
-# SAMPLE CHECK
+# MAIN
 # -----------------------------
-print("\n🔍 Sample Check (First Station):")
-
-for c in stations[0]["candidate_detours"][:3]:
-    print(
-        "Idx:", c["route_idx"],
-        "| Source→Detour:", c["source_to_detour_km"], "km",
-        "| Detour:", c["detour_to_station_km"], "km",
-        "| Total:", c["total_distance_km"], "km",
-        "| SOC:", c["soc_remaining_at_station_pct"], "%"
-    )
+if __name__ == "__main__":
+
+    with open("sampled_with_elevation_50m.json") as f:
+        route_points = json.load(f)
+
+    with open("stations_with_energy.json") as f:
+        stations = json.load(f)
+
+    add_detour_energy(stations, route_points)
+
+    # -----------------------------
+    # SAVE FINAL OUTPUT
+    # -----------------------------
+    with open("stations_with_total_energy.json", "w", encoding="utf-8") as f:
+        json.dump(stations, f, indent=2)
+
+    print("\n✅ COMPLETE")
+    print("Saved → stations_with_total_energy.json")
+
+    # -----------------------------
+    # SAMPLE CHECK
+    # -----------------------------
+    if stations:
+        print("\n🔍 Sample Check (First Station):")
+
+        for c in stations[0]["candidate_detours"][:3]:
+            print(
+                "Idx:", c["route_idx"],
+                "| Source→Detour:", c["source_to_detour_km"], "km",
+                "| Detour:", c["detour_to_station_km"], "km",
+                "| Total:", c["total_distance_km"], "km",
+                "| SOC:", c["soc_remaining_at_station_pct"], "%"
+            )
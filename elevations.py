@@ -1,19 +1,16 @@
 import json
-import requests
-import time
-from config import GOOGLE_MAPS_API_KEY
+from api_endpoints import ELEVATION_URL
+from instrumentation import stage, http_call
+from quota import acquire
 
 # ==============================
 # CONFIG
 # ==============================
 
-ELEVATION_URL = "https://maps.googleapis.com/maps/api/elevation/json"
-
 INPUT_FILE = "sampled_route_50m.json"
 OUTPUT_FILE = "sampled_with_elevation_50m.json"
 
 BATCH_SIZE = 400   # Google allows max 512 locations per request
-SLEEP_TIME = 0.25  # Rate-limit safety
 
 
 # ==============================
@@ -36,6 +33,8 @@ def fetch_elevation_batch(batch_points):
     """
     Calls Google Elevation API for one batch of points.
     """
+    import requests
+    from config import GOOGLE_MAPS_API_KEY
 
     locations = "|".join(
         f"{lat},{lng}" for lat, lng in batch_points
@@ -46,11 +45,13 @@ def fetch_elevation_batch(batch_points):
         "key": GOOGLE_MAPS_API_KEY
     }
 
-    response = requests.get(ELEVATION_URL, params=params)
-    data = response.json()
+    acquire("google_elevation")   # shared budget, see quota.py
+    with http_call("google_elevation"):
+        response = requests.get(ELEVATION_URL, params=params)
+        data = response.json()
 
-    if data["status"] != "OK":
-        raise Exception(f"❌ Elevation API Error: {data}")
+        if data["status"] != "OK":
+            raise Exception(f"❌ Elevation API Error: {data}")
 
     return data["results"]
 
@@ -65,24 +66,26 @@ def enrich_with_elevation(points):
     total_batches = (len(points) // BATCH_SIZE) + 1
     batch_num = 1
 
-    for i in range(0, len(points), BATCH_SIZE):
+    with stage("fetch_elevations", points=len(points)) as span:
+
+        for i in range(0, len(points), BATCH_SIZE):
 
-        batch = points[i:i + BATCH_SIZE]
+            batch = points[i:i + BATCH_SIZE]
 
-        print(f"\n🌍 Fetching batch {batch_num}/{total_batches}...")
-        results = fetch_elevation_batch(batch)
+            print(f"\n🌍 Fetching batch {batch_num}/{total_batches}...")
+            results = fetch_elevation_batch(batch)
+            span.count("batches")
 
-        for pt, res in zip(batch, results):
-            enriched.append({
-                "lat": pt[0],
-                "lng": pt[1],
-                "elevation": res["elevation"]
-            })
+            for pt, res in zip(batch, results):
+                enriched.append({
+                    "lat": pt[0],
+                    "lng": pt[1],
+                    "elevation": res["elevation"]
+                })
 
-        print(f"✅ Batch {batch_num} done ({len(batch)} points)")
+            print(f"✅ Batch {batch_num} done ({len(batch)} points)")
 
-        batch_num += 1
-        time.sleep(SLEEP_TIME)
+            batch_num += 1
 
     print("\n🎉 Elevation fetched for all points!")
     return enriched
@@ -1,27 +1,53 @@
 import json
 import math
+import os
+
+import numpy as np
+
+from instrumentation import stage, traced
+from prefix_builder import haversine_np
+from vehicle_profiles import get_profile
 
 INPUT_FILE = "sampled_with_elevation_wind.json"
+PREFIX_FILE = "prefix_arrays.json"      # segment_speed_ms from speed_profile.py
 OUTPUT_FILE = "battery_profile.json"
 
 # -----------------------------
 # Vehicle Parameters
 # -----------------------------
-MASS = 1800               # kg
+# This model has its own vehicle, not the detour pipeline default
+VEHICLE = get_profile("sedan_60kwh")
+
+MASS = VEHICLE["mass_kg"]
 G = 9.81
-Crr = 0.01
-Cd = 0.29
-A = 2.2
+Crr = VEHICLE["crr"]
+Cd = VEHICLE["cd"]
+A = VEHICLE["area_m2"]
 RHO = 1.225
 
-CAR_SPEED = 25           # m/s (~90 km/h)
-BATTERY_CAPACITY_WH = 60000  # 60 kWh
+CAR_SPEED = 25           # m/s (~90 km/h), used when no speed profile exists
+BATTERY_CAPACITY_WH = VEHICLE["battery_kwh"] * 1000
 BATTERY_CAPACITY_J = BATTERY_CAPACITY_WH * 3600
 
 INITIAL_SOC = 1.0
-MIN_SOC = 0.20
+MIN_SOC = VEHICLE["min_soc_pct"] / 100
+
+SEGMENT_DISTANCE = 50  # meters (nominal; actual spacing is measured per segment)
+
+
+# -----------------------------
+# Haversine (meters)
+# -----------------------------
+def haversine(p1, p2):
+    lat1, lon1 = map(math.radians, p1)
+    lat2, lon2 = map(math.radians, p2)
+
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
 
-SEGMENT_DISTANCE = 50  # meters
+    return 2 * 6371000 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 
 
 # -----------------------------
@@ -44,22 +70,32 @@ def calculate_bearing(p1, p2):
 # -----------------------------
 # Wind-adjusted drag
 # -----------------------------
-def drag_energy(wind_speed, wind_dir, bearing):
+def drag_energy(wind_speed, wind_dir, bearing, distance=SEGMENT_DISTANCE, speed=CAR_SPEED):
     theta = math.radians(bearing - wind_dir)
     wind_along = wind_speed * math.cos(theta)
 
-    v_air = CAR_SPEED + wind_along
+    v_air = speed + wind_along
     if v_air < 0:
         v_air = 0
 
     Fd = 0.5 * RHO * Cd * A * v_air**2
-    return Fd * SEGMENT_DISTANCE
+    return Fd * distance
 
 
 # -----------------------------
 # Main energy loop
 # -----------------------------
-def simulate_energy(points):
+@traced("simulate_energy")
+def simulate_energy(points, speeds=None):
+    """
+    `speeds` (optional): m/s for each of the len(points) - 1 segments,
+    e.g. prefix_arrays.json["segment_speed_ms"]. Defaults to CAR_SPEED.
+    """
+    from jit_kernels import kernel
+
+    profile = kernel("soc_profile")
+    if profile is not None:
+        return _simulate_energy_jit(profile, points, speeds)
 
     soc = INITIAL_SOC
     battery_profile = []
@@ -76,26 +112,34 @@ def simulate_energy(points):
             (p2["lat"], p2["lng"])
         )
 
+        # Adaptive sampling gives uneven spacing, so measure each segment
+        segment_distance = haversine(
+            (p1["lat"], p1["lng"]),
+            (p2["lat"], p2["lng"])
+        )
+
         # Slope energy
         elevation_gain = p2["elevation"] - p1["elevation"]
         slope_energy = MASS * G * elevation_gain
 
         # Rolling resistance
         rolling_force = MASS * G * Crr
-        rolling_energy = rolling_force * SEGMENT_DISTANCE
+        rolling_energy = rolling_force * segment_distance
 
         # Drag
         drag = drag_energy(
             p1["wind_speed"],
             p1["wind_direction"],
-            bearing
+            bearing,
+            segment_distance,
+            speeds[i-1] if speeds is not None else CAR_SPEED
         )
 
         total_energy = slope_energy + rolling_energy + drag
 
         # Reduce SOC
         soc -= total_energy / BATTERY_CAPACITY_J
-        total_distance += SEGMENT_DISTANCE
+        total_distance += segment_distance
 
         battery_profile.append({
             "distance_m": total_distance,
@@ -110,6 +154,115 @@ def simulate_energy(points):
     return battery_profile
 
 
+def _simulate_energy_jit(profile, points, speeds):
+    n = len(points)
+    if speeds is None:
+        speeds = np.full(max(n - 1, 0), float(CAR_SPEED))
+
+    distance, soc = profile(
+        np.array([p["lat"] for p in points], dtype=float),
+        np.array([p["lng"] for p in points], dtype=float),
+        np.array([p["elevation"] for p in points], dtype=float),
+        np.array([p["wind_speed"] for p in points], dtype=float),
+        np.array([p["wind_direction"] for p in points], dtype=float),
+        np.asarray(speeds, dtype=float),
+        float(MASS), G, float(Crr), 0.5 * RHO * Cd * A,
+        float(BATTERY_CAPACITY_J), float(INITIAL_SOC), float(MIN_SOC),
+    )
+
+    if len(soc) and soc[-1] <= MIN_SOC:
+        print("⚡ Charging needed at",
+              round(distance[-1]/1000, 2), "km")
+
+    return [
+        {"distance_m": d, "soc": s}
+        for d, s in zip(distance.tolist(), soc.tolist())
+    ]
+
+
+# -----------------------------
+# Batched departures (time-indexed wind)
+# -----------------------------
+def segment_geometry(points):
+    """(bearing_deg, distance_m, elevation_gain_m) of every segment."""
+    lat = np.radians([p["lat"] for p in points])
+    lng = np.radians([p["lng"] for p in points])
+    elev = np.array([p["elevation"] for p in points], dtype=float)
+
+    dlon = lng[1:] - lng[:-1]
+    x = np.sin(dlon) * np.cos(lat[1:])
+    y = np.cos(lat[:-1]) * np.sin(lat[1:]) - np.sin(lat[:-1]) * np.cos(lat[1:]) * np.cos(dlon)
+    bearing = (np.degrees(np.arctan2(x, y)) + 360) % 360
+
+    distance = haversine_np(
+        np.degrees(lat[:-1]), np.degrees(lng[:-1]), np.degrees(lat[1:]), np.degrees(lng[1:])
+    )
+
+    return bearing, distance, np.diff(elev)
+
+
+def wind_components(forecast, t):
+    """
+    Forecast wind at times t (any shape) as (east, north) components of
+    the direction it blows from. Components interpolate cleanly where
+    angles would wrap; times outside the forecast take its end values.
+    """
+    times = np.asarray(forecast["time"], dtype=float)
+    speed = np.asarray(forecast["wind_speed"], dtype=float)
+    deg = np.radians(np.asarray(forecast["wind_deg"], dtype=float))
+
+    east = np.interp(t, times, speed * np.sin(deg))
+    north = np.interp(t, times, speed * np.cos(deg))
+
+    return east, north
+
+
+@traced("simulate_departures")
+def simulate_departures(points, forecast, departures_s, speeds=None, cum_time_s=None):
+    """
+    simulate_energy for many departure times in one (D, M) computation.
+
+    Each segment sees the forecast wind at departure + cum_time_s[i],
+    its time from the source along the route. Slope and rolling energy
+    don't depend on the departure and are computed once.
+
+    Returns per departure: energy used (Wh), minimum SOC and the km
+    where SOC first reaches MIN_SOC (nan if never).
+    """
+    bearing, distance, dh = segment_geometry(points)
+
+    speeds = np.full(len(distance), float(CAR_SPEED)) if speeds is None else np.asarray(speeds, dtype=float)
+    if cum_time_s is None:
+        cum_time_s = np.concatenate(([0.0], np.cumsum(distance / speeds)))
+
+    departures_s = np.asarray(departures_s, dtype=float)
+
+    with stage("simulate_departures", departures=len(departures_s), segments=len(distance)):
+        base_j = MASS * G * dh + MASS * G * Crr * distance                    # (M,)
+
+        t = departures_s[:, None] + np.asarray(cum_time_s, dtype=float)[None, :-1]   # (D, M)
+        east, north = wind_components(forecast, t)
+
+        b = np.radians(bearing)
+        wind_along = east * np.sin(b) + north * np.cos(b)
+
+        v_air = np.maximum(speeds + wind_along, 0)
+        drag_j = 0.5 * RHO * Cd * A * v_air ** 2 * distance
+
+        cum_j = np.cumsum(base_j + drag_j, axis=1)
+        soc = INITIAL_SOC - cum_j / BATTERY_CAPACITY_J
+
+        cum_km = np.cumsum(distance) / 1000
+        below = soc <= MIN_SOC
+        first = np.argmax(below, axis=1)
+
+    return {
+        "energy_wh": cum_j[:, -1] / 3600,
+        "min_soc": soc.min(axis=1),
+        "charge_at_km": np.where(below.any(axis=1), cum_km[first], np.nan),
+    }
+
+
 # -----------------------------
 # Run
 # -----------------------------
@@ -118,7 +271,16 @@ if __name__ == "__main__":
     with open(INPUT_FILE, "r") as f:
         points = json.load(f)
 
-    profile = simulate_energy(points)
+    speeds = None
+    if os.path.exists(PREFIX_FILE):
+        with open(PREFIX_FILE) as f:
+            speeds = json.load(f).get("segment_speed_ms")
+
+        if speeds is not None and len(speeds) != len(points) - 1:
+            print("⚠️  Speed profile does not match this route, using CAR_SPEED")
+            speeds = None
+
+    profile = simulate_energy(points, speeds)
 
     with open(OUTPUT_FILE, "w") as f:
         json.dump(profile, f, indent=2)
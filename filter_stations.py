@@ -1,7 +1,13 @@
 import csv
 import json
 import math
-from scipy.spatial import KDTree
+import os
+
+import numpy as np
+
+from instrumentation import stage
+from route_pyramid import build_route_pyramid, nearest_route_points
+from station_store import STATION_STORE_FILE
 
 # =====================================================
 # CONFIG
@@ -12,26 +18,11 @@ STATIONS_FILE = "stations.csv"
 OUTPUT_FILE = "filtered_stations.json"
 
 MAX_DISTANCE_KM = 5
+# Pyramid distances are great-circle on the haversine sphere; the slack
+# only absorbs rounding, and the haversine check below decides.
+PYRAMID_SLACK = 1.01
 USER_PREFERENCE = "left"   # "left" or "right"
 
-# =====================================================
-# LOAD ROUTE
-# ===========================================s==========
-
-with open(ROUTE_FILE) as f:
-    route_points = json.load(f)
-
-# IMPORTANT:
-# For geometry math:
-# x = longitude
-# y = latitude
-route_coords = [(p["lng"], p["lat"]) for p in route_points]
-
-route_kdtree = KDTree(route_coords)
-
-print("✅ Route KD-Tree loaded")
-print("Total route points:", len(route_coords))
-
 
 # =====================================================
 # HAVERSINE DISTANCE (km)
@@ -80,73 +71,188 @@ def get_side_of_route(prev_pt, next_pt, station_pt):
         return "on"
 
 
+def sides_of_route(route_coords, pending):
+    """
+    get_side_of_route for every (row, lat, lon, distance_km, nearest_idx)
+    in pending, against the route points either side of nearest_idx.
+    One compiled call when jit_kernels has numba, else one call each.
+    """
+    from jit_kernels import SIDE_NAMES, kernel
+
+    side_kernel = kernel("side_of_route")
+
+    if side_kernel is None:
+        return [
+            get_side_of_route(route_coords[idx - 1], route_coords[idx + 1], (lon, lat))
+            for _, lat, lon, _, idx in pending
+        ]
+
+    coords = np.asarray(route_coords, dtype=float).reshape(-1, 2)
+    idx = np.array([p[4] for p in pending], dtype=np.int64)
+
+    sides = side_kernel(
+        coords[idx - 1, 0], coords[idx - 1, 1],
+        coords[idx + 1, 0], coords[idx + 1, 1],
+        np.array([p[2] for p in pending], dtype=float),
+        np.array([p[1] for p in pending], dtype=float),
+    )
+    return [SIDE_NAMES[s] for s in sides.tolist()]
+
+
 # =====================================================
-# FILTER STATIONS
+# LOAD STATIONS
 # =====================================================
 
-relevant_stations = []
+def iter_station_rows(stations_file=STATIONS_FILE, store_file=STATION_STORE_FILE, route_points=None):
+    """
+    Active station rows from the delta-fed store (station_store.py) if
+    it exists, else from the CSV, one row at a time. With route_points
+    the store only yields those in grid cells within MAX_DISTANCE_KM of
+    the route.
+    """
+    if store_file and os.path.exists(store_file):
+        from station_store import StationStore, corridor_cells
 
-with open(STATIONS_FILE, newline="", encoding="utf-8") as f:
-    reader = csv.DictReader(f)
+        cells = corridor_cells(route_points, MAX_DISTANCE_KM) if route_points is not None else None
 
-    for row in reader:
+        store = StationStore(store_file)
+        print("✅ Stations from", store_file)
         try:
-            lat = float(row["latitude"])
-            lon = float(row["longitude"])
-        except:
-            continue  # skip invalid rows
+            yield from store.iter_rows(active_only=True, cells=cells)
+        finally:
+            store.close()
+        return
+
+    from station_store import is_active
+
+    with open(stations_file, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if is_active(row):
+                yield row
+
+
+def load_station_rows(stations_file=STATIONS_FILE, store_file=STATION_STORE_FILE, route_points=None):
+    return list(iter_station_rows(stations_file, store_file, route_points))
+
 
-        # KDTree query MUST use (lon, lat)
-        _, nearest_idx = route_kdtree.query((lon, lat))
+# =====================================================
+# FILTER STATIONS
+# =====================================================
+
+def filter_stations(route_points, station_rows, max_distance_km=MAX_DISTANCE_KM,
+                    side=USER_PREFERENCE, route_pyramid=None):
+    """
+    Stations within max_distance_km of the route on the preferred side.
+    Returns copies of the kept rows with distance_to_route_km,
+    nearest_route_index and side added; the inputs are not modified.
+    """
+    # IMPORTANT:
+    # For geometry math:
+    # x = longitude
+    # y = latitude
+    route_coords = [(p["lng"], p["lat"]) for p in route_points]
+
+    # Coarse-to-fine index (5 km → 500 m → 50 m); chord distances on the
+    # sphere, so it ranks and cuts off like haversine
+    if route_pyramid is None:
+        route_pyramid = build_route_pyramid(
+            [p["lat"] for p in route_points],
+            [p["lng"] for p in route_points]
+        )
 
-        route_lon, route_lat = route_coords[nearest_idx]
+    relevant_stations = []
 
-        # Accurate distance using haversine (lat, lon)
-        distance_km = haversine(lat, lon, route_lat, route_lon)
+    with stage("filter_stations") as span:
 
-        if distance_km > MAX_DISTANCE_KM:
-            continue
+        rows = []
 
-        # Avoid edge index issues
-        if nearest_idx <= 0 or nearest_idx >= len(route_coords) - 1:
-            continue
+        for row in station_rows:
+            try:
+                lat = float(row["latitude"])
+                lon = float(row["longitude"])
+            except:
+                continue  # skip invalid rows
 
-        prev_pt = route_coords[nearest_idx - 1]
-        next_pt = route_coords[nearest_idx + 1]
+            rows.append((row, lat, lon))
 
-        # Pass station as (lon, lat)
-        side = get_side_of_route(
-            prev_pt,
-            next_pt,
-            (lon, lat)
+        span.set("stations", len(rows))
+
+        # Reject far stations at the coarse levels, refine survivors at 50 m
+        survivors, _, nearest = nearest_route_points(
+            route_pyramid,
+            [lat for _, lat, _ in rows],
+            [lon for _, _, lon in rows],
+            k=1,
+            max_distance_m=max_distance_km * 1000 * PYRAMID_SLACK
         )
 
-        if side == USER_PREFERENCE:
-            row["distance_to_route_km"] = round(distance_km, 3)
-            row["nearest_route_index"] = int(nearest_idx)
-            row["side"] = side
-            relevant_stations.append(row)
+        # Within distance, side not yet known
+        pending = []
 
+        for pos, nearest_idx in zip(survivors, nearest[:, 0]):
+            row, lat, lon = rows[pos]
 
-# =====================================================
-# SAVE OUTPUT
-# =====================================================
+            if nearest_idx >= len(route_coords):
+                continue  # nothing within the pyramid's search radius
+
+            route_lon, route_lat = route_coords[nearest_idx]
+
+            # Accurate distance using haversine (lat, lon)
+            distance_km = haversine(lat, lon, route_lat, route_lon)
+
+            if distance_km > max_distance_km:
+                continue
+
+            # Avoid edge index issues
+            if nearest_idx <= 0 or nearest_idx >= len(route_coords) - 1:
+                continue
+
+            pending.append((row, lat, lon, distance_km, int(nearest_idx)))
+
+        for (row, lat, lon, distance_km, nearest_idx), station_side in zip(
+            pending, sides_of_route(route_coords, pending)
+        ):
+            if station_side == side:
+                row = dict(row)
+                row["distance_to_route_km"] = round(distance_km, 3)
+                row["nearest_route_index"] = nearest_idx
+                row["side"] = station_side
+                relevant_stations.append(row)
+
+        span.set("kept", len(relevant_stations))
+
+    return relevant_stations
 
-with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-    json.dump(relevant_stations, f, indent=2)
 
 # =====================================================
-# VERIFICATION
+# MAIN
 # =====================================================
 
-print("\n✅ FILTER COMPLETE")
-print("User preference:", USER_PREFERENCE)
-print("Stations within", MAX_DISTANCE_KM, "km:", len(relevant_stations))
-
-if relevant_stations:
-    print("\nSample station:")
-    s = relevant_stations[0]
-    print("Name:", s.get("name"))
-    print("City:", s.get("city"))
-    print("Distance to route (km):", s["distance_to_route_km"])
-    print("Side:", s["side"])
\ No newline at end of file
+if __name__ == "__main__":
+
+    with open(ROUTE_FILE) as f:
+        route_points = json.load(f)
+
+    print("✅ Route loaded")
+    print("Total route points:", len(route_points))
+
+    relevant_stations = filter_stations(route_points, load_station_rows(route_points=route_points))
+
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+        json.dump(relevant_stations, f, indent=2)
+
+    # =====================================================
+    # VERIFICATION
+    # =====================================================
+
+    print("\n✅ FILTER COMPLETE")
+    print("User preference:", USER_PREFERENCE)
+    print("Stations within", MAX_DISTANCE_KM, "km:", len(relevant_stations))
+
+    if relevant_stations:
+        print("\nSample station:")
+        s = relevant_stations[0]
+        print("Name:", s.get("name"))
+        print("City:", s.get("city"))
+        print("Distance to route (km):", s["distance_to_route_km"])
+        print("Side:", s["side"])
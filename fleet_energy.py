@@ -0,0 +1,248 @@
+import json
+
+import numpy as np
+
+from instrumentation import stage
+from prefix_builder import haversine_np
+from vehicle_profiles import G, load_profiles, profile_arrays
+
+# ==============================
+# CONFIG
+# ==============================
+
+ROUTE_FILE = "sampled_with_elevation_50m.json"
+STATIONS_FILE = "stations_with_total_energy.json"
+OUTPUT_FILE = "fleet_energy.json"
+
+FLEET = None            # None → every registered profile
+CHARGE_TO_PCT = 100
+
+# Detour approximation (same as detour_energy.estimate_detour_energy)
+TWIST_FACTOR = 1.3
+ASCENT_FACTOR = 1.15
+DESCENT_FACTOR = 0.85
+
+
+# ==============================
+# ROUTE → (M,) SEGMENT ARRAYS
+# ==============================
+
+def route_segments(points):
+    lat = np.array([p["lat"] for p in points])
+    lng = np.array([p["lng"] for p in points])
+    elev = np.array([p["elevation"] for p in points])
+
+    seg_km = haversine_np(lat[:-1], lng[:-1], lat[1:], lng[1:]) / 1000
+    dh = np.diff(elev)
+
+    return seg_km, np.where(dh > 0, dh, 0), np.where(dh < 0, -dh, 0)
+
+
+# ==============================
+# (N vehicles × M segments) ENERGY
+# ==============================
+
+def fleet_energy_kwh(vehicles, distance_km, ascent_m, descent_m):
+    """
+    energy_to_detour model for every vehicle at once. Inputs broadcast:
+    (N, 1) profile columns against (M,) route arrays → (N, M) kWh.
+    """
+    E_flat = distance_km * vehicles["base_wh_per_km"] / 1000
+    E_climb = vehicles["mass_kg"] * G * ascent_m / 3.6e6
+    E_regen = vehicles["mass_kg"] * G * descent_m / 3.6e6 * vehicles["regen_eff"]
+
+    return E_flat + E_climb - E_regen
+
+
+def fleet_cumulative_energy_kwh(vehicles, seg_km, ascent_m, descent_m):
+    """
+    (N, M + 1): energy from source → every route point, per vehicle.
+    """
+    segment = fleet_energy_kwh(vehicles, seg_km, ascent_m, descent_m)
+    zeros = np.zeros((segment.shape[0], 1))
+
+    return np.concatenate((zeros, np.cumsum(segment, axis=1)), axis=1)
+
+
+def soc_pct(vehicles, energy_kwh):
+    return 100 - energy_kwh / vehicles["battery_kwh"] * 100
+
+
+# ==============================
+# CHARGING POINTS
+# ==============================
+
+def charging_points(vehicles, cum_energy, charge_to_pct=CHARGE_TO_PCT):
+    """
+    Route indices where each vehicle must charge: the last point before
+    SOC would drop below its min_soc_pct, charging back to charge_to_pct.
+
+    Each pass finds the next stop for every vehicle in one vectorized
+    step, so the loop runs once per stop of the vehicle needing the most.
+
+    Returns (stops, stranded): a list of index lists per vehicle, and a
+    bool array of vehicles that cannot cover some segment even when full.
+    """
+    n, m = cum_energy.shape
+
+    start_usable = vehicles["battery_kwh"][:, 0] * (100 - vehicles["min_soc_pct"][:, 0]) / 100
+    full_usable = vehicles["battery_kwh"][:, 0] * (charge_to_pct - vehicles["min_soc_pct"][:, 0]) / 100
+
+    offset = np.zeros(n)
+    usable = start_usable
+    last_stop = np.zeros(n, dtype=int)
+
+    active = np.ones(n, dtype=bool)
+    stranded = np.zeros(n, dtype=bool)
+    stops = [[] for _ in range(n)]
+
+    while active.any():
+        over = cum_energy - offset[:, None] > usable[:, None]
+        needs_stop = active & over.any(axis=1)
+
+        first_over = np.argmax(over, axis=1)
+        stop = first_over - 1
+
+        stuck = needs_stop & (stop <= last_stop)
+        stranded |= stuck
+        needs_stop &= ~stuck
+
+        for v in np.flatnonzero(needs_stop):
+            stops[v].append(int(stop[v]))
+
+        offset = np.where(needs_stop, cum_energy[np.arange(n), stop], offset)
+        last_stop = np.where(needs_stop, stop, last_stop)
+        usable = np.where(needs_stop, full_usable, usable)
+        active = needs_stop
+
+    return stops, stranded
+
+
+# ==============================
+# PER-STATION ARRIVAL SOC
+# ==============================
+
+def station_arrival_soc(vehicles, cum_energy, points, stations):
+    """
+    (N, S) arrival SOC at every station, picking per vehicle the detour
+    candidate with the lowest total energy (best_station_soc rule).
+    Stations without candidates are skipped; their ids are not returned.
+    """
+    route_idx, s_lat, s_lon, s_elev, counts, ids = [], [], [], [], [], []
+
+    for station in stations:
+        cands = station.get("candidate_detours") or []
+        if not cands:
+            continue
+
+        raw_elev = station.get("elevation", "")
+
+        for cand in cands:
+            p = points[cand["route_idx"]]
+            route_idx.append(cand["route_idx"])
+            s_lat.append(float(station["latitude"]))
+            s_lon.append(float(station["longitude"]))
+            s_elev.append(p["elevation"] if raw_elev in ["", None] else float(raw_elev))
+
+        counts.append(len(cands))
+        ids.append(station["id"])
+
+    if not ids:
+        return [], np.empty((cum_energy.shape[0], 0))
+
+    route_idx = np.array(route_idx)
+    p_lat = np.array([points[i]["lat"] for i in route_idx])
+    p_lon = np.array([points[i]["lng"] for i in route_idx])
+    p_elev = np.array([points[i]["elevation"] for i in route_idx])
+
+    detour_km = haversine_np(p_lat, p_lon, np.array(s_lat), np.array(s_lon)) / 1000 * TWIST_FACTOR
+    delta = np.array(s_elev) - p_elev
+
+    detour = np.maximum(fleet_energy_kwh(
+        vehicles,
+        detour_km,
+        np.where(delta > 0, delta * ASCENT_FACTOR, 0),
+        np.where(delta < 0, -delta * DESCENT_FACTOR, 0),
+    ), 0)
+
+    total = cum_energy[:, route_idx] + detour                      # (N, C)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    best = np.minimum.reduceat(total, starts, axis=1)               # (N, S)
+
+    return ids, soc_pct(vehicles, best)
+
+
+# ==============================
+# ONE PASS FOR THE WHOLE FLEET
+# ==============================
+
+def evaluate_fleet(names, points, stations=None, profiles=None):
+    vehicles = profile_arrays(names, profiles)
+
+    with stage("fleet_energy", vehicles=len(names), points=len(points)):
+
+        seg_km, ascent, descent = route_segments(points)
+        cum_energy = fleet_cumulative_energy_kwh(vehicles, seg_km, ascent, descent)
+        soc = soc_pct(vehicles, cum_energy)
+
+        stops, stranded = charging_points(vehicles, cum_energy)
+
+        if stations is not None:
+            station_ids, arrival = station_arrival_soc(vehicles, cum_energy, points, stations)
+
+    cum_km = np.concatenate(([0.0], np.cumsum(seg_km)))
+
+    results = {}
+    for v, name in enumerate(names):
+        results[name] = {
+            "total_energy_kwh": round(float(cum_energy[v, -1]), 4),
+            "final_soc_pct": round(float(soc[v, -1]), 2),
+            "min_soc_pct": round(float(soc[v].min()), 2),
+            "stranded": bool(stranded[v]),
+            "charging_stops": [
+                {
+                    "route_idx": i,
+                    "distance_km": round(float(cum_km[i]), 3),
+                    "soc_pct": round(float(soc[v, i]), 2),
+                }
+                for i in stops[v]
+            ],
+        }
+
+        if stations is not None:
+            results[name]["station_arrival_soc_pct"] = {
+                sid: round(float(a), 2) for sid, a in zip(station_ids, arrival[v])
+            }
+
+    return results
+
+
+# ==============================
+# MAIN
+# ==============================
+
+if __name__ == "__main__":
+
+    profiles = load_profiles()
+    names = FLEET or list(profiles)
+
+    with open(ROUTE_FILE) as f:
+        points = json.load(f)
+
+    with open(STATIONS_FILE) as f:
+        stations = json.load(f)
+
+    results = evaluate_fleet(names, points, stations, profiles)
+
+    with open(OUTPUT_FILE, "w") as f:
+        json.dump(results, f, indent=2)
+
+    for name, r in results.items():
+        print(
+            f"🚗 {name}: {r['total_energy_kwh']} kWh,",
+            f"final SOC {r['final_soc_pct']}%,",
+            f"{len(r['charging_stops'])} charging stop(s)",
+            "(stranded)" if r["stranded"] else ""
+        )
+
+    print("\n✅ Saved →", OUTPUT_FILE)
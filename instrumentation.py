@@ -0,0 +1,283 @@
+import atexit
+import json
+import os
+import sys
+import time
+
+# ==============================
+# CONFIG
+# ==============================
+# Tracing is off unless EVJ_TRACE points at an output file:
+#   EVJ_TRACE=trace.jsonl python main.py
+# Per-stage cProfile dumps are written when EVJ_PROFILE names a directory
+# (optionally limited with EVJ_PROFILE_STAGES=filter_stations,candidates).
+
+TRACE_FILE = os.environ.get("EVJ_TRACE")
+PROFILE_DIR = os.environ.get("EVJ_PROFILE")
+PROFILE_STAGES = {
+    s for s in os.environ.get("EVJ_PROFILE_STAGES", "").split(",") if s
+}
+
+ENABLED = bool(TRACE_FILE or PROFILE_DIR)
+
+
+# ==============================
+# STATE
+# ==============================
+
+_events = []
+_http = {}      # api → {"calls", "errors", "total_s", "max_s"}
+_caches = {}    # cache → {"hits", "misses"}
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:   # Windows
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports KiB, macOS bytes
+    if sys.platform == "darwin":
+        return round(peak / 2**20, 1)
+    return round(peak / 1024, 1)
+
+
+def _emit(event):
+    _events.append(event)
+
+    if TRACE_FILE:
+        with open(TRACE_FILE, "a") as f:
+            f.write(json.dumps(event) + "\n")
+
+
+# ==============================
+# STAGES
+# ==============================
+
+class _NullSpan:
+    """
+    Returned when tracing is disabled: every call is a no-op.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def count(self, key, n=1):
+        pass
+
+    def set(self, key, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _StageSpan:
+
+    def __init__(self, name, counts):
+        self.name = name
+        self.counts = dict(counts)
+        self.profiler = None
+
+    def count(self, key, n=1):
+        self.counts[key] = self.counts.get(key, 0) + n
+
+    def set(self, key, value):
+        self.counts[key] = value
+
+    def __enter__(self):
+        if PROFILE_DIR and (not PROFILE_STAGES or self.name in PROFILE_STAGES):
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+        self.start = time.time()
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall_s = time.perf_counter() - self.t0
+
+        if self.profiler is not None:
+            self.profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            self.profiler.dump_stats(os.path.join(PROFILE_DIR, f"{self.name}.prof"))
+
+        _emit({
+            "type": "stage",
+            "name": self.name,
+            "start": round(self.start, 3),
+            "wall_s": round(wall_s, 6),
+            "peak_rss_mb": _peak_rss_mb(),
+            "ok": exc_type is None,
+            **self.counts,
+        })
+        return False
+
+
+def stage(name, **counts):
+    """
+    Context manager timing one pipeline stage:
+
+        with stage("filter_stations", stations=len(rows)) as s:
+            ...
+            s.count("kept")
+    """
+    if not ENABLED:
+        return _NULL_SPAN
+    return _StageSpan(name, counts)
+
+
+def traced(name):
+    """
+    Decorator form of stage().
+    """
+    def wrap(fn):
+        def inner(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+
+        inner.__name__ = fn.__name__
+        inner.__doc__ = fn.__doc__
+        inner.__wrapped__ = fn
+        return inner
+
+    return wrap
+
+
+# ==============================
+# HTTP CALLS
+# ==============================
+
+class _HttpSpan:
+
+    def __init__(self, api):
+        self.api = api
+        self.error = False
+
+    def fail(self):
+        self.error = True
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        latency = time.perf_counter() - self.t0
+
+        stats = _http.setdefault(self.api, {"calls": 0, "errors": 0, "total_s": 0.0, "max_s": 0.0})
+        stats["calls"] += 1
+        stats["total_s"] += latency
+        stats["max_s"] = max(stats["max_s"], latency)
+
+        if self.error or exc_type is not None:
+            stats["errors"] += 1
+
+        return False
+
+
+class _NullHttpSpan(_NullSpan):
+
+    def fail(self):
+        pass
+
+
+_NULL_HTTP_SPAN = _NullHttpSpan()
+
+
+def http_call(api):
+    """
+    Wraps one outgoing request:
+
+        with http_call("google_elevation") as call:
+            res = requests.get(...)
+            if data["status"] != "OK":
+                call.fail()
+    """
+    if not ENABLED:
+        return _NULL_HTTP_SPAN
+    return _HttpSpan(api)
+
+
+# ==============================
+# CACHES
+# ==============================
+
+def cache_lookup(cache, hit):
+    if not ENABLED:
+        return
+
+    stats = _caches.setdefault(cache, {"hits": 0, "misses": 0})
+    stats["hits" if hit else "misses"] += 1
+
+
+# ==============================
+# SUMMARY
+# ==============================
+
+def summary():
+    http = {
+        api: {
+            "calls": s["calls"],
+            "errors": s["errors"],
+            "mean_latency_s": round(s["total_s"] / s["calls"], 6) if s["calls"] else None,
+            "max_latency_s": round(s["max_s"], 6),
+        }
+        for api, s in _http.items()
+    }
+
+    caches = {
+        name: {
+            **s,
+            "hit_rate": round(s["hits"] / (s["hits"] + s["misses"]), 4)
+            if s["hits"] + s["misses"] else None,
+        }
+        for name, s in _caches.items()
+    }
+
+    return {
+        "type": "summary",
+        "argv": sys.argv,
+        "peak_rss_mb": _peak_rss_mb(),
+        "stages": len([e for e in _events if e["type"] == "stage"]),
+        "http": http,
+        "caches": caches,
+    }
+
+
+def _write_summary():
+    if _events or _http or _caches:
+        _emit(summary())
+
+
+if ENABLED:
+    atexit.register(_write_summary)
+
+
+# ==============================
+# MAIN: pretty-print a trace file
+# ==============================
+
+if __name__ == "__main__":
+
+    if len(sys.argv) != 2:
+        print("usage: python instrumentation.py trace.jsonl")
+        sys.exit(1)
+
+    with open(sys.argv[1]) as f:
+        events = [json.loads(line) for line in f if line.strip()]
+
+    print(f"{'stage':35s} {'wall (ms)':>12s} {'peak RSS (MB)':>14s}")
+    for e in events:
+        if e["type"] == "stage":
+            print(f"{e['name']:35s} {e['wall_s'] * 1000:12.1f} {e['peak_rss_mb'] or 0:14.1f}")
+
+    for e in events:
+        if e["type"] == "summary":
+            print("\n🌐 HTTP:", json.dumps(e["http"], indent=2))
+            print("🗄  Caches:", json.dumps(e["caches"], indent=2))
@@ -0,0 +1,277 @@
+import argparse
+import contextlib
+import importlib.util
+import math
+import os
+import time
+
+import numpy as np
+
+# ==============================
+# CONFIG
+# ==============================
+# Loop kernels that numpy can't express well (carried state, early
+# stop), compiled with numba when it is installed. The pure-Python
+# functions they mirror stay the reference and the fallback:
+#   main.sample_route                  → resample_route
+#   energy_model_with_wind.simulate_energy → soc_profile
+#   filter_stations.get_side_of_route  → side_of_route
+#
+# EVJ_JIT=auto (default) uses numba if importable, 0 never, 1 requires it.
+# Compiled code is cached next to this file, so one
+#   python jit_kernels.py warmup
+# at deploy time (or warmup() at service start) keeps compile time off
+# the first request.
+
+JIT_MODE = os.environ.get("EVJ_JIT", "auto")
+
+EARTH_RADIUS_M = 6371000.0
+
+_compiled = {}
+
+
+# ==============================
+# KERNELS (plain Python, numba-compatible)
+# ==============================
+
+def _haversine_m(lat1, lon1, lat2, lon2):
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lon2 - lon1)
+
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def resample_route(lat, lng, step_m):
+    """main.sample_route over arrays → (lat, lng) of the sampled points."""
+    n = len(lat)
+
+    total = 0.0
+    for i in range(1, n):
+        total += _haversine_m(lat[i - 1], lng[i - 1], lat[i], lng[i])
+
+    out_lat = np.empty(int(total / step_m) + 3)
+    out_lng = np.empty(int(total / step_m) + 3)
+
+    out_lat[0] = lat[0]
+    out_lng[0] = lng[0]
+    count = 1
+    carry = 0.0
+
+    for i in range(1, n):
+        seg_len = _haversine_m(lat[i - 1], lng[i - 1], lat[i], lng[i])
+        if seg_len == 0:
+            continue
+
+        dist_covered = 0.0
+
+        while carry + (seg_len - dist_covered) >= step_m:
+            remaining = step_m - carry
+            fraction = (dist_covered + remaining) / seg_len
+
+            # Float drift can add one sample beyond the estimate
+            if count == len(out_lat):
+                out_lat = np.concatenate((out_lat, np.empty(len(out_lat))))
+                out_lng = np.concatenate((out_lng, np.empty(len(out_lng))))
+
+            out_lat[count] = lat[i - 1] + (lat[i] - lat[i - 1]) * fraction
+            out_lng[count] = lng[i - 1] + (lng[i] - lng[i - 1]) * fraction
+            count += 1
+
+            dist_covered += remaining
+            carry = 0.0
+
+        carry += seg_len - dist_covered
+
+    # Destination once
+    if _haversine_m(out_lat[count - 1], out_lng[count - 1], lat[n - 1], lng[n - 1]) > 1:
+        if count == len(out_lat):
+            out_lat = np.concatenate((out_lat, np.empty(1)))
+            out_lng = np.concatenate((out_lng, np.empty(1)))
+
+        out_lat[count] = lat[n - 1]
+        out_lng[count] = lng[n - 1]
+        count += 1
+
+    return out_lat[:count], out_lng[:count]
+
+
+def soc_profile(lat, lng, elev, wind_speed, wind_dir, speeds,
+                mass, g, crr, drag_coeff, capacity_j, initial_soc, min_soc):
+    """
+    energy_model_with_wind.simulate_energy over arrays → (distance_m,
+    soc) per segment, stopping after the first segment at or below
+    min_soc. drag_coeff = 0.5 · ρ · Cd · A.
+    """
+    n = len(lat)
+    distance = np.empty(max(n - 1, 0))
+    soc_out = np.empty(max(n - 1, 0))
+
+    soc = initial_soc
+    total_distance = 0.0
+    count = 0
+
+    for i in range(1, n):
+        lat1 = math.radians(lat[i - 1])
+        lat2 = math.radians(lat[i])
+        dlon = math.radians(lng[i]) - math.radians(lng[i - 1])
+
+        x = math.sin(dlon) * math.cos(lat2)
+        y = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(dlon)
+        bearing = (math.degrees(math.atan2(x, y)) + 360) % 360
+
+        a = (
+            math.sin((lat2 - lat1) / 2) ** 2
+            + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+        )
+        segment_distance = 2 * EARTH_RADIUS_M * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+        slope_energy = mass * g * (elev[i] - elev[i - 1])
+        rolling_energy = mass * g * crr * segment_distance
+
+        wind_along = wind_speed[i - 1] * math.cos(math.radians(bearing - wind_dir[i - 1]))
+        v_air = max(speeds[i - 1] + wind_along, 0.0)
+        drag = drag_coeff * v_air ** 2 * segment_distance
+
+        soc -= (slope_energy + rolling_energy + drag) / capacity_j
+        total_distance += segment_distance
+
+        distance[count] = total_distance
+        soc_out[count] = soc
+        count += 1
+
+        if soc <= min_soc:
+            break
+
+    return distance[:count], soc_out[:count]
+
+
+def side_of_route(ax, ay, bx, by, cx, cy):
+    """
+    filter_stations.get_side_of_route for many stations: +1 left,
+    -1 right, 0 on the line. All coordinates (lon, lat) arrays.
+    """
+    side = np.empty(len(ax), dtype=np.int8)
+
+    for i in range(len(ax)):
+        cross = (bx[i] - ax[i]) * (cy[i] - ay[i]) - (by[i] - ay[i]) * (cx[i] - ax[i])
+
+        if cross > 0:
+            side[i] = 1
+        elif cross < 0:
+            side[i] = -1
+        else:
+            side[i] = 0
+
+    return side
+
+
+KERNELS = {
+    "resample_route": resample_route,
+    "soc_profile": soc_profile,
+    "side_of_route": side_of_route,
+}
+
+SIDE_NAMES = {1: "left", -1: "right", 0: "on"}
+
+
+# ==============================
+# DISPATCH
+# ==============================
+
+def available():
+    if JIT_MODE == "0":
+        return False
+
+    found = importlib.util.find_spec("numba") is not None
+    if JIT_MODE == "1" and not found:
+        raise Exception("EVJ_JIT=1 but numba is not installed")
+
+    return found
+
+
+def kernel(name):
+    """
+    Compiled kernel, or None when numba is off or missing (callers then
+    run their pure-Python path). numba is only imported here, on first use.
+    """
+    if not available():
+        return None
+
+    if not _compiled:
+        import numba
+
+        # Kernels call _haversine_m through module globals, which numba
+        # resolves at compile time: swap in the compiled helper first
+        globals()["_haversine_m"] = numba.njit(cache=True)(_haversine_m)
+
+        for kname, fn in KERNELS.items():
+            _compiled[kname] = numba.njit(cache=True)(fn)
+
+    return _compiled[name]
+
+
+@contextlib.contextmanager
+def python_only():
+    """Runs the pure-Python reference paths, e.g. to compare against."""
+    global JIT_MODE
+
+    saved = JIT_MODE
+    JIT_MODE = "0"
+    try:
+        yield
+    finally:
+        JIT_MODE = saved
+
+
+def warmup():
+    """
+    Compiles every kernel for the argument types the pipeline passes
+    (float64 arrays), or loads them from the on-disk cache. Returns
+    seconds taken, None without numba.
+    """
+    if not available():
+        return None
+
+    start = time.perf_counter()
+
+    lat = np.array([19.11, 19.1104, 19.1108])
+    lng = np.array([72.92, 72.9204, 72.9208])
+    ones = np.ones(3)
+
+    kernel("resample_route")(lat, lng, 50.0)
+    kernel("soc_profile")(lat, lng, ones, ones, ones, ones * 25, 1800.0, 9.81, 0.01, 0.8, 2.16e8, 1.0, 0.1)
+    kernel("side_of_route")(lng, lat, lng, lat, lng, lat)
+
+    return time.perf_counter() - start
+
+
+# ==============================
+# MAIN
+# ==============================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Optional numba kernels")
+    parser.add_argument("command", choices=["warmup", "check"],
+                        help="warmup: compile and cache; check: compare against the Python references")
+    args = parser.parse_args(argv)
+
+    if not available():
+        print("⚠️  numba not available (or EVJ_JIT=0), pure-Python paths in use")
+        return 0
+
+    seconds = warmup()
+    print(f"✅ Kernels ready in {seconds:.2f}s")
+
+    if args.command == "check":
+        from benchmarks import jit_equivalence
+
+        return jit_equivalence()
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,38 +1,25 @@
 import json
 import random
-from scipy.spatial import KDTree
+from instrumentation import stage
 
-# -----------------------------
-# LOAD ROUTE POINTS
-# -----------------------------
-with open("sampled_with_elevation_50m.json") as f:
-    points = json.load(f)
-
-# Extract lat/lon only
-coords = [(p["lat"], p["lng"]) for p in points]
 
 # -----------------------------
 # BUILD KD-TREE
 # -----------------------------
-route_kdtree = KDTree(coords)
+def build_route_kdtree(points):
+    """KD-tree over (lat, lng) of the route points."""
+    from scipy.spatial import KDTree
 
-print("KD-Tree built successfully ✅")
-print("Total route points:", len(coords))
-# Test with slightly offset points
-print("\n🔍 Offset-point test:")
-lat, lon = coords[1000]
-offset_point = (lat + 0.0003, lon + 0.0003)
+    coords = [(p["lat"], p["lng"]) for p in points]
 
-dist, idx = route_kdtree.query(offset_point)
-
-print("Offset query → nearest index:", idx)
-print("Matched route point:", coords[idx])
+    with stage("kdtree_build", points=len(coords)):
+        return KDTree(coords)
 
 
 # -----------------------------
 # VERIFICATION TESTS
 # -----------------------------
-def test_random_queries(k=5):
+def test_random_queries(route_kdtree, coords, k=5):
     print("\n🔍 KD-Tree sanity check:")
     for _ in range(k):
         idx = random.randint(0, len(coords) - 1)
@@ -46,4 +33,28 @@ def test_random_queries(k=5):
             f"Distance={dist:.8f}"
         )
 
-test_random_queries()
+
+if __name__ == "__main__":
+
+    # -----------------------------
+    # LOAD ROUTE POINTS
+    # -----------------------------
+    with open("sampled_with_elevation_50m.json") as f:
+        points = json.load(f)
+
+    route_kdtree = build_route_kdtree(points)
+    coords = [(p["lat"], p["lng"]) for p in points]
+
+    print("KD-Tree built successfully ✅")
+    print("Total route points:", len(coords))
+    # Test with slightly offset points
+    print("\n🔍 Offset-point test:")
+    lat, lon = coords[min(1000, len(coords) - 1)]
+    offset_point = (lat + 0.0003, lon + 0.0003)
+
+    dist, idx = route_kdtree.query(offset_point)
+
+    print("Offset query → nearest index:", idx)
+    print("Matched route point:", coords[idx])
+
+    test_random_queries(route_kdtree, coords)
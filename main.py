@@ -1,17 +1,25 @@
-import requests
-import polyline
-import folium
 import math
-import time
-from config import GOOGLE_MAPS_API_KEY
 import json
 
+import numpy as np
+
+from api_endpoints import DIRECTIONS_URL, ELEVATION_URL
+from instrumentation import stage, http_call, traced
+from quota import acquire
+from adaptive_sampling import sample_route_adaptive
+from speed_profile import save_speed_profile, step_speed_profile
+
 # -----------------------------
 # STEP 1: INPUTS (Given)
 # -----------------------------
 SOURCE = (19.110394346916838, 72.9255527657633)
 DESTINATION = (18.579607394136257, 73.90884169273019)
-ELEVATION_URL = "https://maps.googleapis.com/maps/api/elevation/json"
+
+# Keep 50 m points only where heading/grade changes (see adaptive_sampling.py).
+# The energy error bound (adaptive_sampling.MAX_ERROR_WH) is NOT enforced
+# here: checking it needs every 50 m elevation, which is what this saves.
+# Measure a route with `python adaptive_sampling.py` before turning it on.
+ADAPTIVE_SAMPLING = False
 #Harversine formula
 def haversine(p1, p2):
     lat1, lon1 = p1
@@ -30,7 +38,18 @@ def interpolate(p1, p2, fraction):
     lon = p1[1] + (p2[1] - p1[1]) * fraction
     return (lat, lon)
 #sampling points between source and destination
+@traced("sample_route")
 def sample_route(route_points, step_m=50):
+    from jit_kernels import kernel
+
+    resample = kernel("resample_route")
+    if resample is not None:
+        lat = np.array([p[0] for p in route_points], dtype=float)
+        lng = np.array([p[1] for p in route_points], dtype=float)
+
+        out_lat, out_lng = resample(lat, lng, float(step_m))
+        return [route_points[0]] + list(zip(out_lat[1:].tolist(), out_lng[1:].tolist()))
+
     sampled = [route_points[0]]
     carry = 0.0
 
@@ -64,36 +83,43 @@ def sample_route(route_points, step_m=50):
 
 #elevation batch request 
 def fetch_elevations(points, batch_size=400):
+    import requests
+    from config import GOOGLE_MAPS_API_KEY
+
     enriched = []
 
-    for i in range(0, len(points), batch_size):
-        batch = points[i:i + batch_size]
+    with stage("fetch_elevations", points=len(points)) as span:
 
-        locations = "|".join(
-            f"{lat},{lng}" for lat, lng in batch
-        )
+        for i in range(0, len(points), batch_size):
+            batch = points[i:i + batch_size]
 
-        params = {
-            "locations": locations,
-            "key": GOOGLE_MAPS_API_KEY
-        }
+            locations = "|".join(
+                f"{lat},{lng}" for lat, lng in batch
+            )
 
-        print(f"Fetching elevation batch {i//batch_size + 1}")
+            params = {
+                "locations": locations,
+                "key": GOOGLE_MAPS_API_KEY
+            }
 
-        res = requests.get(ELEVATION_URL, params=params)
-        data = res.json()
+            print(f"Fetching elevation batch {i//batch_size + 1}")
 
-        if data["status"] != "OK":
-            raise Exception(data)
+            acquire("google_elevation")
+            with http_call("google_elevation"):
+                res = requests.get(ELEVATION_URL, params=params)
+                data = res.json()
 
-        for pt, result in zip(batch, data["results"]):
-            enriched.append({
-                "lat": pt[0],
-                "lng": pt[1],
-                "elevation": result["elevation"]
-            })
+                if data["status"] != "OK":
+                    raise Exception(data)
 
-        time.sleep(0.2)  # rate-limit safety
+            span.count("batches")
+
+            for pt, result in zip(batch, data["results"]):
+                enriched.append({
+                    "lat": pt[0],
+                    "lng": pt[1],
+                    "elevation": result["elevation"]
+                })
 
     return enriched
 #Save points in json fil
@@ -104,8 +130,14 @@ def save_sampled_route(points, filename="sampled_route_50m.json"):
 # -----------------------------
 # STEP 1A: Fetch route
 # -----------------------------
-def fetch_route_polyline(source, destination):
-    url = "https://maps.googleapis.com/maps/api/directions/json"
+@traced("fetch_route")
+def fetch_route(source, destination):
+    """
+    First Directions route (overview polyline, legs and steps).
+    """
+    import requests
+    from config import GOOGLE_MAPS_API_KEY
+
     params = {
         "origin": f"{source[0]},{source[1]}",
         "destination": f"{destination[0]},{destination[1]}",
@@ -113,43 +145,58 @@ def fetch_route_polyline(source, destination):
         "key": GOOGLE_MAPS_API_KEY
     }
 
-    response = requests.get(url, params=params)
-    data = response.json()
+    acquire("google_directions")
+    with http_call("google_directions"):
+        response = requests.get(DIRECTIONS_URL, params=params)
+        data = response.json()
+
+        if data["status"] != "OK":
+            raise Exception(f"Directions API error: {data['status']}")
+
+    return data["routes"][0]
 
-    if data["status"] != "OK":
-        raise Exception(f"Directions API error: {data['status']}")
 
-    polyline_str = data["routes"][0]["overview_polyline"]["points"]
-    return polyline_str
+def fetch_route_polyline(source, destination):
+    return fetch_route(source, destination)["overview_polyline"]["points"]
+@traced("render_sampling_comparison")
 def plot_sampling_comparison(original, sampled, source, destination):
+    import folium
+    from route_render import add_route_layer
+
     center_lat = (source[0] + destination[0]) / 2
     center_lon = (source[1] + destination[1]) / 2
 
     m = folium.Map(location=[center_lat, center_lon], zoom_start=7)
 
     # Original route (thin, red)
-    folium.PolyLine(
+    add_route_layer(
+        m,
         original,
         color="red",
         weight=2,
         opacity=0.5,
         tooltip="Original Polyline"
-    ).add_to(m)
+    )
 
-    # Sampled route (thick, blue)
-    folium.PolyLine(
+    # Sampled route (thick, blue) — simplified for rendering only
+    add_route_layer(
+        m,
         sampled,
         color="blue",
         weight=4,
         opacity=0.8,
         tooltip="Sampled @50m"
-    ).add_to(m)
+    )
 
     folium.Marker(source, tooltip="Source", icon=folium.Icon(color="green")).add_to(m)
     folium.Marker(destination, tooltip="Destination", icon=folium.Icon(color="red")).add_to(m)
 
     m.save("route_sampling_50m.html")
+@traced("render_elevation_map")
 def plot_elevation_map(points_with_elevation, source, destination):
+    import folium
+    from route_render import add_elevation_layer
+
     center_lat = (source[0] + destination[0]) / 2
     center_lon = (source[1] + destination[1]) / 2
 
@@ -163,14 +210,8 @@ def plot_elevation_map(points_with_elevation, source, destination):
         else:
             return "red"
 
-    for pt in points_with_elevation:
-        folium.CircleMarker(
-            location=[pt["lat"], pt["lng"]],
-            radius=3,
-            color=elevation_color(pt["elevation"]),
-            fill=True,
-            fill_opacity=0.7
-        ).add_to(m)
+    # One encoded layer of colour runs instead of a marker per point
+    add_elevation_layer(m, points_with_elevation, elevation_color)
 
     folium.Marker(source, tooltip="Source", icon=folium.Icon(color="green")).add_to(m)
     folium.Marker(destination, tooltip="Destination", icon=folium.Icon(color="red")).add_to(m)
@@ -182,13 +223,19 @@ def plot_elevation_map(points_with_elevation, source, destination):
 # STEP 1B: Decode polyline
 # -----------------------------
 def decode_route(polyline_str):
+    import polyline
+
     return polyline.decode(polyline_str)
 
 
 # -----------------------------
 # STEP 1C: Visualize on map
 # -----------------------------
+@traced("render_route_on_map")
 def plot_route_on_map(route_points, source, destination):
+    import folium
+    from route_render import add_route_layer
+
     # Center map roughly between source & destination
     center_lat = (source[0] + destination[0]) / 2
     center_lon = (source[1] + destination[1]) / 2
@@ -196,12 +243,13 @@ def plot_route_on_map(route_points, source, destination):
     m = folium.Map(location=[center_lat, center_lon], zoom_start=7)
 
     # Plot route
-    folium.PolyLine(
+    add_route_layer(
+        m,
         route_points,
         color="blue",
         weight=5,
         opacity=0.8
-    ).add_to(m)
+    )
 
     # Markers
     folium.Marker(source, tooltip="Source", icon=folium.Icon(color="green")).add_to(m)
@@ -217,7 +265,11 @@ def plot_route_on_map(route_points, source, destination):
 # -----------------------------
 if __name__ == "__main__":
     print("Fetching route from Google Directions API...")
-    polyline_str = fetch_route_polyline(SOURCE, DESTINATION)
+    route = fetch_route(SOURCE, DESTINATION)
+    polyline_str = route["overview_polyline"]["points"]
+
+    # Step durations → per-segment speeds (used by prefix_builder.py)
+    save_speed_profile(step_speed_profile(route))
 
     print("Decoding polyline...")
     route_points = decode_route(polyline_str)
@@ -240,7 +292,14 @@ if __name__ == "__main__":
     # STEP 3: FETCH ELEVATION
 
     print("Fetching elevation data...")
-    sampled_with_elevation = fetch_elevations(sampled_route)
+    if ADAPTIVE_SAMPLING:
+        print("⚠️  Adaptive sampling: route energy error is not bounded on this run")
+        sampled_with_elevation = sample_route_adaptive(
+            sampled_route,
+            lambda batch: [p["elevation"] for p in fetch_elevations(batch)]
+        )
+    else:
+        sampled_with_elevation = fetch_elevations(sampled_route)
 
     print(f"Elevation fetched for {len(sampled_with_elevation)} points")
 
@@ -1,85 +1,108 @@
 import json
-import folium
+from instrumentation import stage
 
-# -----------------------------
-# LOAD ROUTE POINTS
-# -----------------------------
-with open("sampled_with_elevation_50m.json") as f:
-    route_points = json.load(f)
-
-route_coords = [(p["lat"], p["lng"]) for p in route_points]
-
-print("✅ Route loaded:", len(route_coords), "points")
 
 # -----------------------------
-# LOAD RELEVANT STATIONS
+# BUILD MAP
 # -----------------------------
-with open("filtered_stations.json") as f:
-    stations = json.load(f)
+def render_route_with_stations(route_points, stations, output_file="route_with_stations.html",
+                               tile_dir=None):
+    """
+    Route polyline plus the filtered stations, saved as HTML.
+    Station tiles go to <output>_tiles/ next to the HTML unless tile_dir
+    says otherwise (tile_dir=False embeds every station in the page).
+    """
+    import folium
+    from route_render import add_route_layer
+    from station_layers import add_station_layer, tile_dir_for
 
-print("✅ Stations loaded:", len(stations))
+    route_coords = [(p["lat"], p["lng"]) for p in route_points]
 
-# -----------------------------
-# MAP CENTER = MIDPOINT OF ROUTE
-# -----------------------------
-mid_index = len(route_coords) // 2
-map_center = route_coords[mid_index]
+    # -----------------------------
+    # MAP CENTER = MIDPOINT OF ROUTE
+    # -----------------------------
+    mid_index = len(route_coords) // 2
+    map_center = route_coords[mid_index]
 
-m = folium.Map(location=map_center, zoom_start=9)
+    m = folium.Map(location=map_center, zoom_start=9)
 
-# -----------------------------
-# DRAW ROUTE POLYLINE
-# -----------------------------
-folium.PolyLine(
-    route_coords,
-    weight=5,
-    color="blue",
-    opacity=0.8
-).add_to(m)
+    # -----------------------------
+    # DRAW ROUTE POLYLINE
+    # -----------------------------
+    add_route_layer(
+        m,
+        route_coords,
+        weight=5,
+        color="blue",
+        opacity=0.8
+    )
 
-# -----------------------------
-# MARK SOURCE + DESTINATION
-# -----------------------------
-folium.Marker(
-    route_coords[0],
-    popup="SOURCE (Mumbai)",
-    icon=folium.Icon(color="green")
-).add_to(m)
-
-folium.Marker(
-    route_coords[-1],
-    popup="DESTINATION (Pune)",
-    icon=folium.Icon(color="red")
-).add_to(m)
-# -----------------------------
-# ADD STATION MARKERS (Clickable)
-# -----------------------------
-for s in stations:
-    lat = float(s["latitude"])
-    lon = float(s["longitude"])
-
-    name = s["name"]
-    city = s["city"]
-    dist = s["distance_to_route_km"]
-
-    popup_text = f"""
-    <b>{name}</b><br>
-    City: {city}<br>
-    Distance to Route: {dist} km
-    """
+    # -----------------------------
+    # MARK SOURCE + DESTINATION
+    # -----------------------------
+    folium.Marker(
+        route_coords[0],
+        popup="SOURCE (Mumbai)",
+        icon=folium.Icon(color="green")
+    ).add_to(m)
 
     folium.Marker(
-        location=(lat, lon),
-        popup=folium.Popup(popup_text, max_width=300),
-        tooltip=name,   # shows name on hover
-        icon=folium.Icon(color="orange", icon="bolt", prefix="fa")
+        route_coords[-1],
+        popup="DESTINATION (Pune)",
+        icon=folium.Icon(color="red")
     ).add_to(m)
+    # -----------------------------
+    # ADD STATION MARKERS (Clustered, loaded per viewport)
+    # -----------------------------
+    station_rows = [
+        [
+            float(s["latitude"]),
+            float(s["longitude"]),
+            s["name"],             # shows name on hover
+            s["name"],
+            s["city"],
+            s["distance_to_route_km"],
+        ]
+        for s in stations
+    ]
+
+    add_station_layer(
+        m,
+        station_rows,
+        popup_template=(
+            "<b>{0}</b><br>"
+            "City: {1}<br>"
+            "Distance to Route: {2} km"
+        ),
+        tile_dir=tile_dir_for(output_file, tile_dir),
+        icon={"icon": "bolt", "prefix": "fa", "markerColor": "orange"},
+    )
+
+    # -----------------------------
+    # SAVE MAP OUTPUT
+    # -----------------------------
+    with stage("render_save", file=output_file):
+        m.save(output_file)
+
+    return output_file
+
 
 # -----------------------------
-# SAVE MAP OUTPUT
+# MAIN
 # -----------------------------
-output_file = "route_with_stations.html"
-m.save(output_file)
+if __name__ == "__main__":
+
+    with open("sampled_with_elevation_50m.json") as f:
+        route_points = json.load(f)
+
+    print("✅ Route loaded:", len(route_points), "points")
+
+    with open("filtered_stations.json") as f:
+        stations = json.load(f)
+
+    print("✅ Stations loaded:", len(stations))
+
+    output_file = render_route_with_stations(route_points, stations)
 
-print("\n✅ DONE! Open this file in browser:")
-print("   ", output_file)
+    print("\n✅ DONE! Open this file in browser:")
+    print("   ", output_file)
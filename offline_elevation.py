@@ -1,23 +1,32 @@
 import json
-import elevation
-import rasterio
+
+import numpy as np
+
+from instrumentation import traced
+
+# Points are grouped by DEM tile so each tile is read once, and only
+# the part of it that covers the points
+DEM_TILE_PX = 256
 
 
 # -----------------------------
 # STEP 1: Download DEM
 # -----------------------------
 def download_dem(route_points, output_file="dem.tif"):
-
     lats = [p[0] for p in route_points]
     lngs = [p[1] for p in route_points]
 
-    min_lat, max_lat = min(lats), max(lats)
-    min_lon, max_lon = min(lngs), max(lngs)
+    download_dem_bounds((min(lngs), min(lats), max(lngs), max(lats)), output_file)
+
+
+def download_dem_bounds(bounds, output_file="dem.tif"):
+    """bounds = (min_lon, min_lat, max_lon, max_lat)"""
+    import elevation
 
     print("📦 Downloading DEM...")
 
     elevation.clip(
-        bounds=(min_lon, min_lat, max_lon, max_lat),
+        bounds=bounds,
         output=output_file
     )
 
@@ -28,41 +37,82 @@ def download_dem(route_points, output_file="dem.tif"):
 # STEP 2: Query Elevation
 # -----------------------------
 def get_elevation(lat, lon, dataset):
+    return float(sample_dem(dataset, [lat], [lon])[0])
+
+
+def sample_dem(dataset, lats, lons, tile=DEM_TILE_PX):
+    """
+    DEM values at many points. Pixel indices come from one inverse
+    transform over the arrays; the band is then read in windows, one per
+    DEM tile that contains points. Outside the DEM or nodata → NaN.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    values = np.full(len(lats), np.nan)
+
+    if len(lats) == 0:
+        return values
+
+    from rasterio.windows import Window
+
+    cols, rows = ~dataset.transform * (lons, lats)
+    rows = np.floor(rows).astype(np.int64)
+    cols = np.floor(cols).astype(np.int64)
 
-    row, col = dataset.index(lon, lat)
-    value = dataset.read(1)[row, col]
+    inside = np.flatnonzero(
+        (rows >= 0) & (rows < dataset.height) & (cols >= 0) & (cols < dataset.width)
+    )
+
+    # Group points by tile: sort by tile key, then split at key changes
+    tiles_per_row = -(-dataset.width // tile)
+    key = (rows[inside] // tile) * tiles_per_row + cols[inside] // tile
+    order = inside[np.argsort(key, kind="stable")]
+    splits = np.flatnonzero(np.diff(np.sort(key))) + 1
+
+    for group in np.split(order, splits):
+        r, c = rows[group], cols[group]
+        r0, c0 = r.min(), c.min()
+
+        block = dataset.read(
+            1, window=Window(int(c0), int(r0), int(c.max() - c0 + 1), int(r.max() - r0 + 1))
+        )
+        values[group] = block[r - r0, c - c0]
+
+    if dataset.nodata is not None:
+        values[values == dataset.nodata] = np.nan
+
+    return values
 
-    return float(value)
+
+def dem_resolution_m(dataset):
+    """Pixel height in metres (geographic DEMs are in degrees)."""
+    res = abs(dataset.res[1])
+    if dataset.crs is not None and dataset.crs.is_geographic:
+        res *= 111_320
+    return round(res, 1)
 
 
 # -----------------------------
 # STEP 3: Add Elevation
 # -----------------------------
+@traced("add_elevation_offline")
 def add_elevation_offline(route_points, dem_file="dem.tif"):
+    import rasterio
 
     print("🌍 Loading DEM...")
 
-    enriched = []
+    lats = [point[0] for point in route_points]
+    lons = [point[1] for point in route_points]
 
     with rasterio.open(dem_file) as dataset:
+        elevations = sample_dem(dataset, lats, lons)
 
-        for i, point in enumerate(route_points):
-
-            lat = point[0]
-            lon = point[1]
-
-            elev = get_elevation(lat, lon, dataset)
-
-            enriched.append({
-                "lat": lat,
-                "lng": lon,
-                "elevation": elev
-            })
-
-            if i % 200 == 0:
-                print(f"✅ {i}/{len(route_points)} done")
+    print(f"✅ {len(route_points)} points sampled")
 
-    return enriched
+    return [
+        {"lat": lat, "lng": lon, "elevation": float(elev)}
+        for lat, lon, elev in zip(lats, lons, elevations)
+    ]
 
 
 # -----------------------------
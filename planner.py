@@ -0,0 +1,150 @@
+# =====================================================
+# LIBRARY API
+# =====================================================
+# Every step is a plain function over dicts/lists; nothing is read or
+# written unless asked. Network clients (requests, polyline, geopy) and
+# map rendering (folium) are only imported by the steps that need them.
+#
+#   from planner import plan
+#   result = plan((19.11, 72.93), (18.58, 73.91))
+#
+# Long-running services: call jit_kernels.warmup() once at start so the
+# optional numba kernels are compiled (or loaded) before the first plan.
+
+from candidates import find_candidates
+from detour_energy import add_detour_energy
+from energy_to_detour import add_route_energy
+from filter_stations import filter_stations, load_station_rows
+from prefix_builder import build_prefix_arrays_np
+from route_pyramid import build_route_pyramid
+
+STEP_M = 50
+
+
+# -----------------------------
+# STEP 1-4: ROUTE
+# -----------------------------
+def plan_route(source, destination, step_m=STEP_M):
+    """
+    Directions → step points → samples every step_m → elevations.
+    Returns (route_points, speed_profile); route_points are
+    {"lat", "lng", "elevation"} dicts.
+    """
+    from main import fetch_elevations, sample_route
+    from sampling_route import fetch_directions, route_points_from_steps
+    from speed_profile import step_speed_profile
+
+    route = fetch_directions(source, destination)["routes"][0]
+
+    sampled = sample_route(route_points_from_steps(route), step_m=step_m)
+
+    return fetch_elevations(sampled), step_speed_profile(route)
+
+
+def route_prefix(route_points, speed_profile=None):
+    """Same arrays prefix_builder.py saves to prefix_arrays.json."""
+    from speed_profile import build_time_prefix, segment_speeds
+
+    cum_distance, cum_ascent, cum_descent = build_prefix_arrays_np(route_points)
+
+    speeds = segment_speeds(cum_distance, speed_profile)
+
+    return {
+        "cum_distance_m": cum_distance.tolist(),
+        "cum_ascent_m": cum_ascent.tolist(),
+        "cum_descent_m": cum_descent.tolist(),
+        "cum_time_s": build_time_prefix(cum_distance, speeds).tolist(),
+        "segment_speed_ms": speeds.tolist(),
+    }
+
+
+# -----------------------------
+# STEP 7-9: CANDIDATES + ENERGY
+# -----------------------------
+def score_candidates(route_points, prefix, stations, route_pyramid=None,
+                     road_graph_file=None, cache_file=None):
+    """
+    Candidate detour points, route energy and detour energy for every
+    station. By default no road graph or persistent detour cache is
+    used; pass their file names to opt in.
+    """
+    stations = find_candidates(
+        route_points, prefix["cum_distance_m"], stations,
+        route_pyramid=route_pyramid
+    )
+
+    add_route_energy(stations, prefix)
+
+    return add_detour_energy(
+        stations, route_points,
+        road_graph_file=road_graph_file, cache_file=cache_file
+    )
+
+
+# -----------------------------
+# STEP 10: BEST STOP PER STATION
+# -----------------------------
+def best_stations(stations, route_points, weights=None, networks=()):
+    """
+    map_visualization.json rows, highest arrival SOC first. With weights
+    (station_ranking criteria, e.g. {"energy": 1, "detour": 0.5}) the
+    rows are ordered by each station's best weighted score instead and
+    carry it as "score".
+    """
+    from best_station_soc import build_map_ready_output
+
+    rows = build_map_ready_output(stations, route_points)
+
+    if weights is None:
+        return sorted(rows, key=lambda r: -r["arrival_soc"])
+
+    from station_ranking import candidate_arrays, rank
+
+    arrays = candidate_arrays(stations)
+    chosen, score = rank(arrays, weights, k=len(stations), networks=networks)
+
+    station_score = {
+        str(stations[arrays["station_pos"][i]]["id"]): round(float(score[i]), 4)
+        for i in chosen
+    }
+    for r in rows:
+        r["score"] = station_score.get(str(r["station_id"]), 0.0)
+
+    return sorted(rows, key=lambda r: -r["score"])
+
+
+# -----------------------------
+# FULL PLAN
+# -----------------------------
+def plan(source, destination, station_rows=None, route_points=None, speed_profile=None,
+         weights=None):
+    """
+    Runs the whole pipeline in memory. route_points skips the Google
+    calls (e.g. a saved sampled_with_elevation_50m.json); station_rows
+    defaults to the station store / stations.csv; weights ranks "best"
+    with station_ranking instead of by arrival SOC.
+    """
+    if route_points is None:
+        route_points, speed_profile = plan_route(source, destination)
+
+    if station_rows is None:
+        station_rows = load_station_rows(route_points=route_points)
+
+    prefix = route_prefix(route_points, speed_profile)
+
+    # One pyramid serves both the filter and the candidate search
+    pyramid = build_route_pyramid(
+        [p["lat"] for p in route_points],
+        [p["lng"] for p in route_points],
+        prefix["cum_distance_m"]
+    )
+
+    nearby = filter_stations(route_points, station_rows, route_pyramid=pyramid)
+    scored = score_candidates(route_points, prefix, nearby, route_pyramid=pyramid)
+
+    return {
+        "route_points": route_points,
+        "prefix": prefix,
+        "stations": scored,
+        "best": best_stations(scored, route_points, weights),
+    }
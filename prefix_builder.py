@@ -1,6 +1,10 @@
 import json
 import math
 
+import numpy as np
+
+from instrumentation import traced
+
 # -------------------------------
 # Haversine Distance (meters)
 # -------------------------------
@@ -27,6 +31,7 @@ def haversine(p1, p2):
 # -------------------------------
 # Build Prefix Arrays
 # -------------------------------
+@traced("build_prefix_arrays")
 def build_prefix_arrays(points):
     n = len(points)
 
@@ -58,6 +63,45 @@ def build_prefix_arrays(points):
     return cum_distance, cum_ascent, cum_descent
 
 
+# -------------------------------
+# Vectorized versions (NumPy)
+# -------------------------------
+def haversine_np(lat1, lon1, lat2, lon2):
+    """
+    Element-wise haversine distance in meters for arrays of degrees.
+    """
+    R = 6371000
+
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+
+    dphi = np.radians(np.asarray(lat2) - lat1)
+    dlambda = np.radians(np.asarray(lon2) - lon1)
+
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+
+    return 2 * R * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def build_prefix_arrays_np(points):
+    """
+    Same result as build_prefix_arrays, computed with NumPy.
+    Returns three float64 arrays.
+    """
+    lat = np.fromiter((p["lat"] for p in points), dtype=float, count=len(points))
+    lng = np.fromiter((p["lng"] for p in points), dtype=float, count=len(points))
+    elev = np.fromiter((p["elevation"] for p in points), dtype=float, count=len(points))
+
+    d = haversine_np(lat[:-1], lng[:-1], lat[1:], lng[1:])
+    delta_h = np.diff(elev)
+
+    cum_distance = np.concatenate(([0.0], np.cumsum(d)))
+    cum_ascent = np.concatenate(([0.0], np.cumsum(np.where(delta_h > 0, delta_h, 0.0))))
+    cum_descent = np.concatenate(([0.0], np.cumsum(np.where(delta_h > 0, 0.0, -delta_h))))
+
+    return cum_distance, cum_ascent, cum_descent
+
+
 # -------------------------------
 # MAIN
 # -------------------------------
@@ -70,11 +114,26 @@ if __name__ == "__main__":
     # Build arrays
     cum_distance, cum_ascent, cum_descent = build_prefix_arrays(points)
 
+    # Travel time from the Directions step speeds
+    from speed_profile import (
+        DEFAULT_SPEED_MS, SPEED_PROFILE_FILE,
+        build_time_prefix, load_speed_profile, segment_speeds
+    )
+
+    speed_profile = load_speed_profile()
+    if speed_profile is None:
+        print(f"⚠️  {SPEED_PROFILE_FILE} not found, using {DEFAULT_SPEED_MS} m/s everywhere")
+
+    speeds = segment_speeds(cum_distance, speed_profile)
+    cum_time = build_time_prefix(cum_distance, speeds)
+
     # Save prefix arrays to file
     prefix_data = {
         "cum_distance_m": cum_distance,
         "cum_ascent_m": cum_ascent,
-        "cum_descent_m": cum_descent
+        "cum_descent_m": cum_descent,
+        "cum_time_s": cum_time.tolist(),
+        "segment_speed_ms": speeds.tolist()
     }
 
     with open("prefix_arrays.json", "w") as f:
@@ -88,6 +147,7 @@ if __name__ == "__main__":
     print("Total Route Distance (km):", cum_distance[-1] / 1000)
     print("Total Ascent (m):", cum_ascent[-1])
     print("Total Descent (m):", cum_descent[-1])
+    print("Travel Time (h):", round(cum_time[-1] / 3600, 2))
 
     print("\nSample Checkpoints:")
     for i in [100, 500, 1000, 2000]:
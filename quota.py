@@ -0,0 +1,186 @@
+import argparse
+import os
+import struct
+import tempfile
+import time
+
+# ==============================
+# CONFIG
+# ==============================
+# One token bucket per external API budget, shared by every process on
+# the machine: the bucket state lives in a small file under QUOTA_DIR
+# and is updated under an exclusive file lock. Callers reserve a token
+# and sleep until it is due, so N workers together send at the budget,
+# not N × the budget.
+#
+#   EVJ_QUOTAS="google_elevation=100,openweather=1"   (requests/s, overrides)
+#   EVJ_QUOTA=0                                       (no limiting, e.g. replay server)
+
+QUOTA_DIR = os.environ.get("EVJ_QUOTA_DIR", os.path.join(tempfile.gettempdir(), "evj_quota"))
+ENABLED = os.environ.get("EVJ_QUOTA", "1") != "0"
+
+# budget → requests/s (Google: 6,000/min elevation, 3,000/min directions;
+# OpenWeather free tier: 60/min across all its endpoints)
+BUDGETS = {
+    "google_elevation": 100.0,
+    "google_directions": 50.0,
+    "openweather": 1.0,
+}
+
+# http_call api name → budget it draws from
+BUDGET_OF = {
+    "google_elevation": "google_elevation",
+    "google_directions": "google_directions",
+    "openweather": "openweather",
+    "openweather_forecast": "openweather",
+}
+
+# Tokens a budget can bank while idle (1 = evenly spaced, no bursts)
+BURST = 1.0
+
+_STATE = struct.Struct("<dd")   # tokens, wall-clock time of last update
+
+
+def parse_budgets(text):
+    """"google_elevation=50,openweather=1" → {budget: requests/s}"""
+    budgets = {}
+
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        name, value = part.split("=")
+        budgets[name] = float(value)
+
+    return budgets
+
+
+BUDGETS.update(parse_budgets(os.environ.get("EVJ_QUOTAS", "")))
+
+
+# ==============================
+# FILE LOCK
+# ==============================
+
+try:
+    import fcntl
+
+    def _lock(f):
+        fcntl.flock(f, fcntl.LOCK_EX)
+
+    def _unlock(f):
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+except ImportError:  # Windows
+    import msvcrt
+
+    def _lock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, _STATE.size)
+
+    def _unlock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, _STATE.size)
+
+
+# ==============================
+# TOKEN BUCKET
+# ==============================
+
+def reserve(budget, rate, burst=BURST, quota_dir=QUOTA_DIR):
+    """
+    Takes one token from the shared bucket and returns how long to wait
+    before using it. The bucket may go negative: later callers queue
+    behind earlier reservations instead of racing for the next token.
+    """
+    os.makedirs(quota_dir, exist_ok=True)
+    filename = os.path.join(quota_dir, budget + ".bucket")
+
+    fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o666)
+    with os.fdopen(fd, "r+b") as f:
+        _lock(f)
+        try:
+            f.seek(0)
+            data = f.read(_STATE.size)
+            now = time.time()
+
+            if len(data) == _STATE.size:
+                tokens, last = _STATE.unpack(data)
+                tokens = min(burst, tokens + max(now - last, 0) * rate)
+            else:
+                tokens = burst
+
+            tokens -= 1
+
+            f.seek(0)
+            f.write(_STATE.pack(tokens, now))
+            f.flush()
+        finally:
+            _unlock(f)
+
+    return max(-tokens / rate, 0.0)
+
+
+def acquire(api):
+    """
+    Blocks until `api` may send one request under its budget. Returns
+    seconds waited. APIs without a budget (or EVJ_QUOTA=0) never wait.
+    """
+    budget = BUDGET_OF.get(api, api)
+    rate = BUDGETS.get(budget)
+
+    if not ENABLED or not rate:
+        return 0.0
+
+    wait = reserve(budget, rate)
+    if wait > 0:
+        time.sleep(wait)
+
+    return wait
+
+
+# ==============================
+# MAIN
+# ==============================
+
+def _worker(api, n, out):
+    start = time.time()
+    for _ in range(n):
+        acquire(api)
+    out.put((start, time.time()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared API quota: show budgets or measure throughput")
+    parser.add_argument("--api", default="google_elevation")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="spawn this many processes calling acquire() and report aggregate rate")
+    parser.add_argument("--requests", type=int, default=100, help="per worker")
+    args = parser.parse_args(argv)
+
+    print("📁", QUOTA_DIR if ENABLED else f"{QUOTA_DIR} (disabled)")
+    for budget, rate in sorted(BUDGETS.items()):
+        print(f"   {budget:20s} {rate:g}/s")
+
+    if args.workers:
+        import multiprocessing
+
+        out = multiprocessing.Queue()
+        procs = [
+            multiprocessing.Process(target=_worker, args=(args.api, args.requests, out))
+            for _ in range(args.workers)
+        ]
+        for p in procs:
+            p.start()
+
+        spans = [out.get() for _ in procs]
+        for p in procs:
+            p.join()
+
+        total = args.workers * args.requests
+        elapsed = max(e for _, e in spans) - min(s for s, _ in spans)
+        budget = BUDGET_OF.get(args.api, args.api)
+
+        print(f"✅ {total} requests from {args.workers} processes in {elapsed:.2f}s "
+              f"→ {total / elapsed:.1f}/s (budget {BUDGETS.get(budget, 0):g}/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import argparse
+import json
+
+import numpy as np
+
+from fleet_energy import fleet_energy_kwh
+from instrumentation import stage
+from vehicle_profiles import DEFAULT_PROFILE, get_profile, profile_arrays
+
+# ==============================
+# CONFIG
+# ==============================
+
+ROUTE_FILE = "sampled_with_elevation_50m.json"
+PREFIX_FILE = "prefix_arrays.json"
+OUTPUT_FILE = "reach_rings.json"
+
+RING_SOC_PCT = (75, 50, 25)   # plus the vehicle's min_soc_pct
+
+
+# ==============================
+# CUMULATIVE ENERGY
+# ==============================
+
+def cumulative_energy_kwh(prefix, vehicle=DEFAULT_PROFILE):
+    """Energy from source → every route point (energy_to_detour model)."""
+    return fleet_energy_kwh(
+        profile_arrays([vehicle]),
+        np.asarray(prefix["cum_distance_m"], dtype=float) / 1000,
+        np.asarray(prefix["cum_ascent_m"], dtype=float),
+        np.asarray(prefix["cum_descent_m"], dtype=float),
+    )[0]
+
+
+# ==============================
+# RANGE-MAX TABLE
+# ==============================
+
+def build_max_table(cum_energy):
+    """
+    Sparse table: level l holds max(cum_energy[p : p + 2**l]) for every
+    p where the window fits. O(n log n) to build, shared by all queries.
+    """
+    levels = [np.asarray(cum_energy, dtype=float)]
+
+    while 2 ** len(levels) <= len(levels[0]):
+        prev = levels[-1]
+        half = 2 ** (len(levels) - 1)
+        levels.append(np.maximum(prev[:-half], prev[half:]))
+
+    return levels
+
+
+def reach_index(table, start_idx, budget_kwh):
+    """
+    Furthest route index j >= start_idx such that cumulative energy never
+    exceeds cum_energy[start_idx] + budget_kwh on [start_idx, j].
+
+    Regen on the way counts, so this is the first crossing of the
+    threshold rather than a plain searchsorted. Binary lifting over the
+    sparse table: one O(log n) descent per query, all queries at once.
+    """
+    cum_energy = table[0]
+    n = len(cum_energy)
+
+    pos = np.asarray(start_idx, dtype=np.int64).copy()
+    threshold = cum_energy[pos] + np.asarray(budget_kwh, dtype=float)
+
+    for level in range(len(table) - 1, -1, -1):
+        width = 2 ** level
+        window = table[level]
+
+        # Window [pos + 1, pos + width] fits in the route?
+        fits = pos + width <= n - 1
+        nxt = np.where(fits, pos + 1, 0)
+
+        ok = fits & (window[np.minimum(nxt, len(window) - 1)] <= threshold)
+        pos = np.where(ok, pos + width, pos)
+
+    # Below the minimum already at the start → nowhere to go
+    return np.where(np.asarray(budget_kwh) < 0, np.asarray(start_idx), pos)
+
+
+# ==============================
+# QUERIES
+# ==============================
+
+def reach(prefix, start_idx, soc_pct, vehicle=DEFAULT_PROFILE, table=None, min_soc_pct=None):
+    """
+    For each (start_idx, soc_pct) pair: furthest route index reachable
+    before SOC drops to min_soc_pct, its distance and the SOC there.
+
+    Charge is not capped at 100 % on regen stretches, so a full battery
+    starting downhill reads slightly optimistic.
+    """
+    profile = get_profile(vehicle)
+    if min_soc_pct is None:
+        min_soc_pct = profile["min_soc_pct"]
+
+    if table is None:
+        table = build_max_table(cumulative_energy_kwh(prefix, vehicle))
+
+    cum_energy = table[0]
+    cum_distance = np.asarray(prefix["cum_distance_m"], dtype=float)
+
+    start_idx = np.asarray(start_idx, dtype=np.int64)
+    soc_pct = np.asarray(soc_pct, dtype=float)
+
+    budget = (soc_pct - min_soc_pct) / 100 * profile["battery_kwh"]
+
+    with stage("reach", queries=int(start_idx.size)):
+        end_idx = reach_index(table, start_idx, budget)
+
+    used = cum_energy[end_idx] - cum_energy[start_idx]
+
+    return {
+        "end_idx": end_idx,
+        "reach_km": (cum_distance[end_idx] - cum_distance[start_idx]) / 1000,
+        "end_soc_pct": soc_pct - used / profile["battery_kwh"] * 100,
+        "to_destination": end_idx == len(cum_energy) - 1,
+    }
+
+
+def reachable(table, start_idx, soc_pct, target_idx, battery_kwh, min_soc_pct):
+    """
+    Mask of target indices reachable from (start_idx, soc_pct), e.g. to
+    drop candidate detour points a station stage would never reach.
+    """
+    budget = (soc_pct - min_soc_pct) / 100 * battery_kwh
+    end_idx = reach_index(table, np.full(len(target_idx), start_idx), np.full(len(target_idx), budget))
+
+    target_idx = np.asarray(target_idx)
+    return (target_idx >= start_idx) & (target_idx <= end_idx)
+
+
+def range_rings(route_points, prefix, start_idx, soc_pct, vehicle=DEFAULT_PROFILE,
+                ring_soc_pct=RING_SOC_PCT):
+    """
+    Route points where SOC falls to each ring level (and the vehicle's
+    minimum), starting at start_idx with soc_pct.
+    """
+    profile = get_profile(vehicle)
+    levels = [lvl for lvl in ring_soc_pct if lvl < soc_pct] + [profile["min_soc_pct"]]
+
+    table = build_max_table(cumulative_energy_kwh(prefix, vehicle))
+
+    # One query per ring, with the ring level as the floor
+    budget = (soc_pct - np.array(levels, dtype=float)) / 100 * profile["battery_kwh"]
+    end_idx = reach_index(table, np.full(len(levels), start_idx), budget)
+
+    rings = []
+    for level, idx in zip(levels, end_idx):
+        idx = int(idx)
+        rings.append({
+            "soc_pct": level,
+            "route_idx": idx,
+            "lat": route_points[idx]["lat"],
+            "lng": route_points[idx]["lng"],
+            "distance_km": round((prefix["cum_distance_m"][idx] - prefix["cum_distance_m"][start_idx]) / 1000, 3),
+            "to_destination": idx == len(route_points) - 1,
+        })
+
+    return {
+        "start_idx": start_idx,
+        "start_soc_pct": soc_pct,
+        "vehicle": vehicle,
+        "rings": rings,
+    }
+
+
+# ==============================
+# MAIN
+# ==============================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reach rings along the route")
+    parser.add_argument("--route", default=ROUTE_FILE)
+    parser.add_argument("--prefix", default=PREFIX_FILE)
+    parser.add_argument("--start-idx", type=int, default=0)
+    parser.add_argument("--soc", type=float, default=100)
+    parser.add_argument("--vehicle", default=DEFAULT_PROFILE)
+    parser.add_argument("--out", default=OUTPUT_FILE)
+    args = parser.parse_args(argv)
+
+    with open(args.route) as f:
+        route_points = json.load(f)
+
+    with open(args.prefix) as f:
+        prefix = json.load(f)
+
+    if len(prefix["cum_distance_m"]) != len(route_points):
+        raise Exception("prefix_arrays.json does not match the route, rerun prefix_builder.py")
+
+    rings = range_rings(route_points, prefix, args.start_idx, args.soc, args.vehicle)
+
+    with open(args.out, "w") as f:
+        json.dump(rings, f, indent=2)
+
+    for ring in rings["rings"]:
+        print(f"🔋 {ring['soc_pct']}% at {ring['distance_km']} km (idx {ring['route_idx']})")
+    print("✅ Saved →", args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,479 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+# ==============================
+# CONFIG
+# ==============================
+# Local stand-in for Google Directions/Elevation and OpenWeather, for
+# benchmarks and load tests without live keys or quota:
+#   python replay_server.py serve --latency-ms 80 --error-rate 0.02 --rate-limit google_elevation=50
+#   export EVJ_GOOGLE_MAPS_URL=http://127.0.0.1:8765 EVJ_OPENWEATHER_URL=http://127.0.0.1:8765
+#
+# Responses come from recordings (replay_recordings/<api>/<hash>.json)
+# when one matches the request, else they are synthesized. --record
+# fills the recordings from the real APIs (needs keys in the requests).
+#
+#   python replay_server.py load --workers 8 --batches 200   (elevation fetch throughput)
+#
+# Fetchers still draw from quota.py's shared budgets; EVJ_QUOTA=0 load
+# tests the server alone.
+
+HOST = "127.0.0.1"
+PORT = 8765
+RECORDINGS_DIR = "replay_recordings"
+
+# Real upstreams for --record (not api_endpoints, which may point here)
+UPSTREAM = {
+    "google": "https://maps.googleapis.com",
+    "openweather": "https://api.openweathermap.org",
+}
+
+# path → api name (same names instrumentation.http_call uses)
+APIS = {
+    "/maps/api/directions/json": "google_directions",
+    "/maps/api/elevation/json": "google_elevation",
+    "/data/2.5/weather": "openweather",
+    "/data/2.5/forecast": "openweather_forecast",
+}
+
+# Never part of a recording key or file
+SECRET_PARAMS = {"key", "appid"}
+
+STEP_KM = 1.0              # synthetic Directions step length
+STEP_POINTS = 20           # points per synthetic step polyline
+SYNTHETIC_SPEED_MS = 22.0
+
+
+def provider(api):
+    return "google" if api.startswith("google") else "openweather"
+
+
+# ==============================
+# SYNTHETIC RESPONSES
+# ==============================
+
+def synthetic_elevation(lat, lng):
+    """Smooth, deterministic terrain (m) so repeated runs agree."""
+    return round(
+        400
+        + 350 * math.sin(math.radians(lat * 40)) * math.cos(math.radians(lng * 25))
+        + 60 * math.sin(math.radians((lat + lng) * 400)),
+        4,
+    )
+
+
+def _latlng(text):
+    lat, lng = text.split(",")
+    return float(lat), float(lng)
+
+
+def _haversine_km(a, b):
+    dlat = math.radians(b[0] - a[0])
+    dlng = math.radians(b[1] - a[1])
+    h = math.sin(dlat / 2) ** 2 + math.cos(math.radians(a[0])) * math.cos(math.radians(b[0])) * math.sin(dlng / 2) ** 2
+    return 2 * 6371 * math.asin(math.sqrt(h))
+
+
+def synthetic_route(origin, destination, bend=0.0):
+    """
+    One Directions route from origin to destination: a gentle arc
+    (bend = sideways offset at the midpoint, degrees) cut into ~1 km steps.
+    """
+    import polyline
+
+    def at(t):
+        lat = origin[0] + (destination[0] - origin[0]) * t
+        lng = origin[1] + (destination[1] - origin[1]) * t
+        off = bend * math.sin(math.pi * t)
+        return lat - off * (destination[1] - origin[1]) / 10, lng + off * (destination[0] - origin[0]) / 10
+
+    n_steps = max(1, int(_haversine_km(origin, destination) / STEP_KM))
+    steps = []
+    overview = []
+
+    for s in range(n_steps):
+        pts = [at((s + k / STEP_POINTS) / n_steps) for k in range(STEP_POINTS + 1)]
+        meters = sum(_haversine_km(a, b) for a, b in zip(pts, pts[1:])) * 1000
+
+        steps.append({
+            "distance": {"value": round(meters)},
+            "duration": {"value": max(1, round(meters / SYNTHETIC_SPEED_MS))},
+            "start_location": {"lat": pts[0][0], "lng": pts[0][1]},
+            "end_location": {"lat": pts[-1][0], "lng": pts[-1][1]},
+            "polyline": {"points": polyline.encode(pts, 5)},
+        })
+        overview.extend(pts if s == 0 else pts[1:])
+
+    return {
+        "summary": f"Synthetic route (bend {bend})",
+        "legs": [{
+            "distance": {"value": sum(st["distance"]["value"] for st in steps)},
+            "duration": {"value": sum(st["duration"]["value"] for st in steps)},
+            "steps": steps,
+        }],
+        "overview_polyline": {"points": polyline.encode(overview[::5] + [overview[-1]], 5)},
+    }
+
+
+def synthetic_response(api, params):
+    if api == "google_directions":
+        origin = _latlng(params["origin"])
+        destination = _latlng(params["destination"])
+        bends = [0.0, 0.4, -0.4] if params.get("alternatives") == "true" else [0.0]
+
+        return {"status": "OK", "routes": [synthetic_route(origin, destination, b) for b in bends]}
+
+    if api == "google_elevation":
+        results = []
+        for loc in params["locations"].split("|"):
+            lat, lng = _latlng(loc)
+            results.append({
+                "elevation": synthetic_elevation(lat, lng),
+                "location": {"lat": lat, "lng": lng},
+                "resolution": 9.5,
+            })
+        return {"status": "OK", "results": results}
+
+    lat = float(params.get("lat", 0))
+    lon = float(params.get("lon", 0))
+
+    # Wind turns slowly with time, seeded by location
+    def wind(t):
+        phase = (lat * 13 + lon * 7 + t / 10800) % 360
+        return {"speed": round(3 + 2 * math.sin(phase), 2), "deg": round((200 + 40 * phase) % 360)}
+
+    now = int(time.time())
+
+    if api == "openweather":
+        return {"coord": {"lat": lat, "lon": lon}, "wind": wind(now), "cod": 200}
+
+    start = now - now % 10800 + 10800
+    return {
+        "cod": "200",
+        "list": [{"dt": start + i * 10800, "wind": wind(start + i * 10800)} for i in range(40)],
+    }
+
+
+# ==============================
+# RECORDINGS
+# ==============================
+
+def recording_key(path, params):
+    public = sorted((k, v) for k, v in params.items() if k not in SECRET_PARAMS)
+    return hashlib.sha1(json.dumps([path, public]).encode()).hexdigest()[:16]
+
+
+def recording_file(directory, api, path, params):
+    return os.path.join(directory, api, recording_key(path, params) + ".json")
+
+
+def load_recording(directory, api, path, params):
+    filename = recording_file(directory, api, path, params)
+    if not os.path.exists(filename):
+        return None
+
+    with open(filename) as f:
+        return json.load(f)["response"]
+
+
+def save_recording(directory, api, path, params, response):
+    filename = recording_file(directory, api, path, params)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+    with open(filename, "w") as f:
+        json.dump({
+            "path": path,
+            "params": {k: v for k, v in params.items() if k not in SECRET_PARAMS},
+            "response": response,
+        }, f)
+
+
+def fetch_upstream(api, path, params):
+    import requests
+
+    return requests.get(UPSTREAM[provider(api)] + path, params=params).json()
+
+
+# ==============================
+# FAULTS
+# ==============================
+
+class TokenBucket:
+    """rate requests/s with a burst of one second's worth."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.t = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.t) * self.rate)
+            self.t = now
+
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def rate_limited_response(api):
+    """What each provider actually sends back when over quota."""
+    if provider(api) == "google":
+        return 200, {"status": "OVER_QUERY_LIMIT", "error_message": "Replay server rate limit"}
+    return 429, {"cod": 429, "message": "Replay server rate limit"}
+
+
+def error_response(api):
+    if provider(api) == "google":
+        return 500, {"status": "UNKNOWN_ERROR", "error_message": "Replay server injected error"}
+    return 500, {"cod": 500, "message": "Replay server injected error"}
+
+
+def parse_rates(text):
+    """"google_elevation=50,openweather=60" → {api: requests/s}; a bare number applies to every API."""
+    rates = {}
+
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        if "=" not in part:
+            rates.update({api: float(part) for api in APIS.values()})
+            continue
+
+        name, value = part.split("=")
+        if name not in APIS.values():
+            raise Exception(f"Unknown API '{name}', expected one of {sorted(APIS.values())}")
+        rates[name] = float(value)
+
+    return rates
+
+
+# ==============================
+# SERVER
+# ==============================
+
+class ReplayState:
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, rates=None,
+                 recordings_dir=RECORDINGS_DIR, record=False, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.buckets = {api: TokenBucket(r) for api, r in (rates or {}).items()}
+        self.recordings_dir = recordings_dir
+        self.record = record
+        self.rng = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def count(self, api, key):
+        with self.lock:
+            stats = self.stats.setdefault(
+                api, {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0, "recorded": 0, "synthetic": 0}
+            )
+            stats[key] += 1
+
+    def delay(self):
+        with self.lock:
+            jitter = self.rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+            fail = self.rng.random() < self.error_rate
+
+        time.sleep(max(self.latency_ms + jitter, 0) / 1000)
+        return fail
+
+    def respond(self, path, params):
+        """(http status, JSON body) for one request."""
+        api = APIS.get(path)
+        if api is None:
+            return 404, {"error": f"No replay for {path}"}
+
+        self.count(api, "requests")
+
+        bucket = self.buckets.get(api)
+        if bucket is not None and not bucket.take():
+            self.count(api, "rate_limited")
+            return rate_limited_response(api)
+
+        if self.delay():
+            self.count(api, "errors")
+            return error_response(api)
+
+        body = load_recording(self.recordings_dir, api, path, params)
+        if body is not None:
+            self.count(api, "recorded")
+        elif self.record:
+            body = fetch_upstream(api, path, params)
+            save_recording(self.recordings_dir, api, path, params, body)
+            self.count(api, "recorded")
+        else:
+            body = synthetic_response(api, params)
+            self.count(api, "synthetic")
+
+        self.count(api, "ok")
+        return 200, body
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+
+    state = None   # set by make_server
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+
+        if url.path == "/_stats":
+            status, body = 200, self.state.stats
+        else:
+            try:
+                status, body = self.state.respond(url.path, dict(parse_qsl(url.query)))
+            except (KeyError, ValueError) as e:
+                status, body = 400, {"status": "INVALID_REQUEST", "error_message": str(e)}
+
+        data = json.dumps(body).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_server(state, host=HOST, port=PORT):
+    handler = type("Handler", (ReplayHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(state, host=HOST, port=0):
+    """Background server (port 0 = any free port). Returns (server, base_url)."""
+    server = make_server(state, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+# ==============================
+# LOAD TEST
+# ==============================
+
+def load_test(base_url, workers, batches, batch_size=400):
+    """
+    Concurrent elevations.fetch_elevation_batch calls against base_url.
+    Returns throughput, failures and latency percentiles.
+    """
+    import importlib
+    from concurrent.futures import ThreadPoolExecutor
+
+    import api_endpoints
+    import elevations
+
+    # URLs are read at import: re-read them with the replay base URL
+    os.environ["EVJ_GOOGLE_MAPS_URL"] = base_url
+    os.environ["EVJ_OPENWEATHER_URL"] = base_url
+    importlib.reload(api_endpoints)
+    importlib.reload(elevations)
+
+    def batch_points(b):
+        return [(18.5 + (b * batch_size + i) * 1e-4, 73.8) for i in range(batch_size)]
+
+    def one(b):
+        t0 = time.perf_counter()
+        try:
+            elevations.fetch_elevation_batch(batch_points(b))
+            ok = True
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - t0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(one, range(batches)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(t for _, t in results)
+
+    return {
+        "workers": workers,
+        "batches": batches,
+        "seconds": round(elapsed, 3),
+        "batches_per_s": round(batches / elapsed, 1),
+        "failed": sum(1 for ok, _ in results if not ok),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1),
+    }
+
+
+# ==============================
+# MAIN
+# ==============================
+
+def main(argv=None):
+    faults = argparse.ArgumentParser(add_help=False)
+    faults.add_argument("--latency-ms", type=float, default=0.0)
+    faults.add_argument("--jitter-ms", type=float, default=0.0)
+    faults.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 500")
+    faults.add_argument("--rate-limit", default="",
+                        help="requests/s, e.g. 50 or google_elevation=50,openweather=60")
+    faults.add_argument("--recordings", default=RECORDINGS_DIR)
+    faults.add_argument("--seed", type=int)
+
+    parser = argparse.ArgumentParser(description="Replay server for the external APIs")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", parents=[faults], help="serve until Ctrl+C")
+    serve.add_argument("--host", default=HOST)
+    serve.add_argument("--port", type=int, default=PORT)
+    serve.add_argument("--record", action="store_true", help="fetch and save responses that have no recording")
+
+    load = sub.add_parser("load", parents=[faults], help="concurrent elevation fetches against an in-process server")
+    load.add_argument("--workers", type=int, default=8)
+    load.add_argument("--batches", type=int, default=200)
+
+    args = parser.parse_args(argv)
+
+    state = ReplayState(
+        args.latency_ms, args.jitter_ms, args.error_rate, parse_rates(args.rate_limit),
+        args.recordings, getattr(args, "record", False), args.seed,
+    )
+
+    if args.command == "serve":
+        server = make_server(state, args.host, args.port)
+        base_url = f"http://{args.host}:{args.port}"
+
+        print(f"🎞  Replay server on {base_url}")
+        print(f"   export EVJ_GOOGLE_MAPS_URL={base_url} EVJ_OPENWEATHER_URL={base_url}")
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            print("📊", json.dumps(state.stats))
+
+    elif args.command == "load":
+        server, base_url = start_in_thread(state)
+        try:
+            result = load_test(base_url, args.workers, args.batches)
+        finally:
+            server.shutdown()
+
+        print("✅", json.dumps(result))
+        print("📊", json.dumps(state.stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,624 @@
+import argparse
+import csv
+import heapq
+import json
+import math
+import time
+
+import numpy as np
+
+from instrumentation import stage
+from prefix_builder import haversine_np
+
+# ==============================
+# CONFIG
+# ==============================
+# Build once from a local extract, then every detour query runs offline:
+#   python road_graph.py build region.osm.pbf          (needs `pip install osmium`)
+#   python road_graph.py build nodes.csv edges.csv     (id,lat,lon / u,v,length_m,oneway)
+#
+# Preprocessing is pure Python and its cost is set by the junction count
+# (shape points are compressed away first): ~25 s for a synthetic grid of
+# 10k junctions / 108k nodes (`check --size 100 --shape-points 5`). It
+# has not been timed on a real extract; cut one to the route corridor
+# rather than building a whole state.
+
+ROAD_GRAPH_FILE = "road_graph_ch.npz"
+
+# Highway classes a car can drive on
+DRIVABLE = {
+    "motorway", "motorway_link", "trunk", "trunk_link", "primary", "primary_link",
+    "secondary", "secondary_link", "tertiary", "tertiary_link",
+    "unclassified", "residential", "living_street", "service", "road",
+}
+
+# Witness searches stop after this many settled nodes; a missed witness
+# only adds a redundant shortcut, never a wrong distance.
+WITNESS_SETTLE_LIMIT = 60
+
+
+# ==============================
+# CSR GRAPH
+# ==============================
+
+def to_csr(n, tails, heads, weights):
+    """
+    Directed edge list → (indptr, indices, weights), parallel edges
+    reduced to the shortest one.
+    """
+    tails = np.asarray(tails, dtype=np.int64)
+    heads = np.asarray(heads, dtype=np.int64)
+    weights = np.asarray(weights, dtype=np.float64)
+
+    order = np.lexsort((weights, heads, tails))
+    tails, heads, weights = tails[order], heads[order], weights[order]
+
+    first = np.ones(len(tails), dtype=bool)
+    first[1:] = (tails[1:] != tails[:-1]) | (heads[1:] != heads[:-1])
+    tails, heads, weights = tails[first], heads[first], weights[first]
+
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(indptr, tails + 1, 1)
+
+    return np.cumsum(indptr), heads.astype(np.int32), weights
+
+
+def _edge_list(node_lat, node_lon, u, v, oneway, length_m=None):
+    u = np.asarray(u, dtype=np.int64)
+    v = np.asarray(v, dtype=np.int64)
+    oneway = np.asarray(oneway, dtype=bool)
+
+    if length_m is None:
+        length_m = haversine_np(node_lat[u], node_lon[u], node_lat[v], node_lon[v])
+    length_m = np.asarray(length_m, dtype=float)
+
+    both = ~oneway
+    tails = np.concatenate((u, v[both]))
+    heads = np.concatenate((v, u[both]))
+    weights = np.concatenate((length_m, length_m[both]))
+
+    return tails, heads, weights
+
+
+# ==============================
+# LOADERS
+# ==============================
+
+def load_edge_csv(nodes_file, edges_file):
+    """
+    nodes.csv: id,lat,lon   edges.csv: u,v[,length_m][,oneway]
+    """
+    ids, lat, lon = [], [], []
+    with open(nodes_file, newline="") as f:
+        for row in csv.DictReader(f):
+            ids.append(row["id"])
+            lat.append(float(row["lat"]))
+            lon.append(float(row["lon"]))
+
+    index = {node_id: i for i, node_id in enumerate(ids)}
+    lat, lon = np.array(lat), np.array(lon)
+
+    u, v, length, oneway = [], [], [], []
+    with open(edges_file, newline="") as f:
+        for row in csv.DictReader(f):
+            u.append(index[row["u"]])
+            v.append(index[row["v"]])
+            length.append(float(row["length_m"]) if row.get("length_m") else math.nan)
+            oneway.append(row.get("oneway", "0") in ("1", "true", "yes"))
+
+    length = np.array(length)
+    missing = np.isnan(length)
+    length[missing] = haversine_np(
+        lat[np.array(u)[missing]], lon[np.array(u)[missing]],
+        lat[np.array(v)[missing]], lon[np.array(v)[missing]]
+    )
+
+    return lat, lon, _edge_list(lat, lon, u, v, oneway, length)
+
+
+def load_osm_pbf(path):
+    """
+    Drivable ways from an OSM extract. Only nodes used by those ways are kept.
+    """
+    try:
+        import osmium
+    except ImportError:
+        raise Exception("Reading .osm.pbf needs pyosmium: pip install osmium")
+
+    ways = []
+    used = {}
+
+    class WayHandler(osmium.SimpleHandler):
+        def way(self, w):
+            if w.tags.get("highway") not in DRIVABLE:
+                return
+
+            oneway = w.tags.get("oneway", "no")
+            if w.tags.get("highway") in ("motorway", "motorway_link") and oneway == "no":
+                oneway = "yes"
+
+            refs = []
+            for n in w.nodes:
+                if not n.location.valid():
+                    continue
+                refs.append(n.ref)
+                used[n.ref] = (n.location.lat, n.location.lon)
+
+            ways.append((refs, oneway))
+
+    WayHandler().apply_file(path, locations=True)
+
+    index = {ref: i for i, ref in enumerate(used)}
+    coords = np.array(list(used.values()))
+    lat, lon = coords[:, 0], coords[:, 1]
+
+    u, v, oneway = [], [], []
+    for refs, way_oneway in ways:
+        nodes = [index[r] for r in refs]
+        if way_oneway == "-1":
+            nodes.reverse()
+
+        for a, b in zip(nodes[:-1], nodes[1:]):
+            u.append(a)
+            v.append(b)
+            oneway.append(way_oneway in ("yes", "true", "1", "-1"))
+
+    return lat, lon, _edge_list(lat, lon, u, v, oneway)
+
+
+# ==============================
+# CONTRACTION HIERARCHIES
+# ==============================
+
+def _witness_distances(out_edges, source, skip, bound, limit=WITNESS_SETTLE_LIMIT):
+    """
+    Bounded Dijkstra on the not-yet-contracted graph, avoiding `skip`.
+    """
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    settled = 0
+
+    while heap and settled < limit:
+        d, x = heapq.heappop(heap)
+        if d > dist[x]:
+            continue
+        if d > bound:
+            break
+        settled += 1
+
+        for y, w in out_edges[x].items():
+            if y == skip:
+                continue
+            nd = d + w
+            if nd < dist.get(y, math.inf):
+                dist[y] = nd
+                heapq.heappush(heap, (nd, y))
+
+    return dist
+
+
+def _shortcuts(out_edges, in_edges, v):
+    """
+    Shortcuts needed to contract v: (u, w, weight) for every in/out pair
+    whose path through v has no witness.
+    """
+    found = []
+
+    for u, w_in in in_edges[v].items():
+        targets = {w: w_in + w_out for w, w_out in out_edges[v].items() if w != u}
+        if not targets:
+            continue
+
+        dist = _witness_distances(out_edges, u, v, max(targets.values()))
+
+        for w, via in targets.items():
+            if dist.get(w, math.inf) > via:
+                found.append((u, w, via))
+
+    return found
+
+
+def chain_nodes(out_edges, in_edges):
+    """
+    Nodes with exactly two distinct neighbours: the shape points of a
+    road between junctions. In a typical OSM extract most nodes are.
+    """
+    return [
+        x for x in range(len(out_edges))
+        if len(out_edges[x].keys() | in_edges[x].keys()) == 2
+    ]
+
+
+def build_contraction_hierarchy(lat, lon, edges):
+    """
+    Contracts nodes and returns two upward CSR graphs: forward (rank
+    increases along the edge) and backward (reversed edges into
+    lower-ranked nodes).
+
+    Degree-2 chains are compressed first: each shape point is contracted
+    without witness searches, which leaves one edge per direction between
+    the junctions at the chain ends. Contracting a chain node never gives
+    a neighbour more than two neighbours, so this stays linear. Only the
+    junctions then go through edge-difference ordering (lazy updates).
+    """
+    tails, heads, weights = edges
+    n = len(lat)
+
+    indptr, indices, w = to_csr(n, tails, heads, weights)
+
+    out_edges = [dict() for _ in range(n)]
+    in_edges = [dict() for _ in range(n)]
+    for x in range(n):
+        for k in range(indptr[x], indptr[x + 1]):
+            y = int(indices[k])
+            if y != x:
+                out_edges[x][y] = float(w[k])
+                in_edges[y][x] = float(w[k])
+
+    deleted_neighbors = [0] * n
+
+    rank = np.zeros(n, dtype=np.int32)
+    up_fwd = [None] * n
+    up_bwd = [None] * n
+    contracted = 0
+    shortcut_count = 0
+
+    def contract(v, shortcuts):
+        nonlocal contracted, shortcut_count
+
+        for u, x, via in shortcuts:
+            if via < out_edges[u].get(x, math.inf):
+                out_edges[u][x] = via
+                in_edges[x][u] = via
+                shortcut_count += 1
+
+        rank[v] = contracted
+        contracted += 1
+
+        # Every remaining neighbour ranks above v
+        up_fwd[v] = list(out_edges[v].items())
+        up_bwd[v] = list(in_edges[v].items())
+
+        for x in out_edges[v]:
+            del in_edges[x][v]
+            deleted_neighbors[x] += 1
+        for u in in_edges[v]:
+            del out_edges[u][v]
+            deleted_neighbors[u] += 1
+
+        out_edges[v] = {}
+        in_edges[v] = {}
+
+    def priority(v):
+        shortcuts = _shortcuts(out_edges, in_edges, v)
+        edge_difference = len(shortcuts) - len(in_edges[v]) - len(out_edges[v])
+        return edge_difference + deleted_neighbors[v], shortcuts
+
+    with stage("ch_preprocess", nodes=n, edges=len(indices)) as span:
+
+        # Degree-2 chains: no witness search, a redundant shortcut is
+        # harmless. Rounds of non-adjacent chain nodes halve every chain,
+        # so upward searches from a shape point stay logarithmic in its
+        # chain length instead of walking it.
+        chain = chain_nodes(out_edges, in_edges)
+        remaining = chain
+
+        while remaining:
+            blocked = set()
+            this_round = []
+            later = []
+
+            for v in remaining:
+                if v in blocked:
+                    later.append(v)
+                else:
+                    this_round.append(v)
+                    blocked.update(out_edges[v].keys() | in_edges[v].keys())
+
+            for v in this_round:
+                contract(v, [
+                    (u, x, w_in + w_out)
+                    for u, w_in in in_edges[v].items()
+                    for x, w_out in out_edges[v].items() if x != u
+                ])
+
+            remaining = later
+
+        span.set("chain_nodes", len(chain))
+
+        in_chain = np.zeros(n, dtype=bool)
+        in_chain[chain] = True
+
+        heap = [(priority(v)[0], v) for v in range(n) if not in_chain[v]]
+        heapq.heapify(heap)
+
+        while heap:
+            _, v = heapq.heappop(heap)
+
+            # Lazy update: re-insert if no longer the cheapest
+            p, shortcuts = priority(v)
+            if heap and p > heap[0][0]:
+                heapq.heappush(heap, (p, v))
+                continue
+
+            contract(v, shortcuts)
+
+        span.set("shortcuts", shortcut_count)
+
+    def pack(adj):
+        t = [x for x in range(n) for _ in adj[x]]
+        h = [y for x in range(n) for y, _ in adj[x]]
+        wt = [c for x in range(n) for _, c in adj[x]]
+        return to_csr(n, t, h, wt)
+
+    fwd = pack(up_fwd)
+    bwd = pack(up_bwd)
+
+    return {
+        "lat": np.asarray(lat, dtype=float),
+        "lon": np.asarray(lon, dtype=float),
+        "rank": rank,
+        "fwd_indptr": fwd[0], "fwd_indices": fwd[1], "fwd_weights": fwd[2],
+        "bwd_indptr": bwd[0], "bwd_indices": bwd[1], "bwd_weights": bwd[2],
+    }
+
+
+def save_hierarchy(ch, filename=ROAD_GRAPH_FILE):
+    np.savez_compressed(filename, **ch)
+
+
+def load_hierarchy(filename=ROAD_GRAPH_FILE):
+    with np.load(filename) as data:
+        return {k: data[k] for k in data.files}
+
+
+# ==============================
+# QUERIES
+# ==============================
+
+class RoadRouter:
+    """
+    Many-to-many road distances (meters) on a contraction hierarchy.
+
+    Uses the bucket method: one backward upward search per target fills
+    per-node buckets, then one forward upward search per source scans
+    them. Cost grows with sources + targets, not sources × targets.
+    """
+
+    def __init__(self, ch):
+        from scipy.spatial import KDTree
+        from route_pyramid import latlon_to_xyz
+
+        self.ch = ch
+        # Points on the sphere: chord distance ranks like haversine anywhere
+        self._xyz = lambda lat, lon: latlon_to_xyz(np.asarray(lat, dtype=float).reshape(-1),
+                                                  np.asarray(lon, dtype=float).reshape(-1))
+        self.tree = KDTree(self._xyz(ch["lat"], ch["lon"]))
+
+        # Python lists: much faster than NumPy scalar indexing in the searches
+        self.fwd = self._adjacency("fwd")
+        self.bwd = self._adjacency("bwd")
+
+    def _adjacency(self, prefix):
+        indptr = self.ch[f"{prefix}_indptr"].tolist()
+        indices = self.ch[f"{prefix}_indices"].tolist()
+        weights = self.ch[f"{prefix}_weights"].tolist()
+
+        return [
+            list(zip(indices[indptr[x]:indptr[x + 1]], weights[indptr[x]:indptr[x + 1]]))
+            for x in range(len(indptr) - 1)
+        ]
+
+    @staticmethod
+    def _upward_search(adj, source):
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        settled = []
+
+        while heap:
+            d, x = heapq.heappop(heap)
+            if d > dist[x]:
+                continue
+            settled.append((x, d))
+
+            for y, w in adj[x]:
+                nd = d + w
+                if nd < dist.get(y, math.inf):
+                    dist[y] = nd
+                    heapq.heappush(heap, (nd, y))
+
+        return settled
+
+    def snap(self, lat, lon):
+        """
+        Nearest graph node and great-circle snap distance (m) per point.
+        """
+        from route_pyramid import chord_to_arc
+
+        chord_m, node = self.tree.query(self._xyz(lat, lon))
+        return node, chord_to_arc(chord_m)
+
+    def node_matrix(self, sources, targets):
+        """
+        (S, T) shortest-path meters between graph nodes (inf = unreachable).
+        """
+        unique_targets, target_pos = np.unique(targets, return_inverse=True)
+        unique_sources, source_pos = np.unique(sources, return_inverse=True)
+
+        buckets = {}
+        for j, t in enumerate(unique_targets.tolist()):
+            for x, d in self._upward_search(self.bwd, t):
+                buckets.setdefault(x, ([], []))
+                buckets[x][0].append(j)
+                buckets[x][1].append(d)
+
+        buckets = {x: (np.array(j), np.array(d)) for x, (j, d) in buckets.items()}
+
+        result = np.full((len(unique_sources), len(unique_targets)), math.inf)
+        for i, s in enumerate(unique_sources.tolist()):
+            row = result[i]
+            for x, d in self._upward_search(self.fwd, s):
+                bucket = buckets.get(x)
+                if bucket is not None:
+                    j, dt = bucket
+                    row[j] = np.minimum(row[j], d + dt)
+
+        return result[np.ix_(source_pos, target_pos)]
+
+    def distance_matrix_m(self, src_lat, src_lon, dst_lat, dst_lon):
+        """
+        (S, T) road distance between coordinates, including the straight
+        snap legs onto and off the graph.
+        """
+        with stage("road_distance_matrix", sources=len(src_lat), targets=len(dst_lat)):
+            s_node, s_snap = self.snap(src_lat, src_lon)
+            t_node, t_snap = self.snap(dst_lat, dst_lon)
+
+            return self.node_matrix(s_node, t_node) + s_snap[:, None] + t_snap[None, :]
+
+    def pair_distances_m(self, src_lat, src_lon, dst_lat, dst_lon):
+        """
+        Road distance for each (source[k], target[k]) pair. Repeated
+        coordinates collapse before the many-to-many search.
+        """
+        src = np.column_stack((src_lat, src_lon))
+        dst = np.column_stack((dst_lat, dst_lon))
+
+        src_u, src_inv = np.unique(src, axis=0, return_inverse=True)
+        dst_u, dst_inv = np.unique(dst, axis=0, return_inverse=True)
+
+        matrix = self.distance_matrix_m(src_u[:, 0], src_u[:, 1], dst_u[:, 0], dst_u[:, 1])
+        return matrix[src_inv.ravel(), dst_inv.ravel()]
+
+
+# ==============================
+# SELF-CHECK ON A SYNTHETIC GRID
+# ==============================
+
+def synthetic_grid(rows, cols, spacing_deg=0.002, seed=0, shape_points=0):
+    """
+    Street grid with a few one-way streets and a "river" that only two
+    bridges cross, so straight-line distance is a poor estimate.
+    shape_points adds that many degree-2 nodes along every street, as
+    OSM ways carry between junctions.
+    """
+    rng = np.random.default_rng(seed)
+
+    r, c = np.divmod(np.arange(rows * cols), cols)
+    lat = 18.5 + r * spacing_deg
+    lon = 73.8 + c * spacing_deg
+
+    u, v = [], []
+    for i in range(rows):
+        for j in range(cols):
+            x = i * cols + j
+            if j + 1 < cols:
+                u.append(x)
+                v.append(x + 1)
+            if i + 1 < rows and (i != rows // 2 or j in (cols // 5, 4 * cols // 5)):
+                u.append(x)
+                v.append(x + cols)
+
+    oneway = rng.random(len(u)) < 0.1
+
+    if shape_points:
+        lat, lon = list(lat), list(lon)
+        su, sv, s_oneway = [], [], []
+
+        for a, b, one in zip(u, v, oneway):
+            path = [a]
+            for k in range(1, shape_points + 1):
+                t = k / (shape_points + 1)
+                # A small sideways kink so the street is not a straight line
+                lat.append(lat[a] + t * (lat[b] - lat[a]) + rng.normal(0, spacing_deg / 20))
+                lon.append(lon[a] + t * (lon[b] - lon[a]) + rng.normal(0, spacing_deg / 20))
+                path.append(len(lat) - 1)
+            path.append(b)
+
+            su.extend(path[:-1])
+            sv.extend(path[1:])
+            s_oneway.extend([one] * (len(path) - 1))
+
+        lat, lon = np.array(lat), np.array(lon)
+        u, v, oneway = su, sv, s_oneway
+
+    return lat, lon, _edge_list(lat, lon, u, v, oneway)
+
+
+def self_check(rows=60, cols=60, queries=200, shape_points=0):
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra
+
+    lat, lon, edges = synthetic_grid(rows, cols, shape_points=shape_points)
+    n = len(lat)
+
+    t0 = time.perf_counter()
+    ch = build_contraction_hierarchy(lat, lon, edges)
+    build_s = time.perf_counter() - t0
+
+    router = RoadRouter(ch)
+
+    rng = np.random.default_rng(1)
+    sources = rng.integers(0, n, queries)
+    targets = rng.integers(0, n, queries // 4)
+
+    t0 = time.perf_counter()
+    got = router.node_matrix(sources, targets)
+    query_s = time.perf_counter() - t0
+
+    indptr, indices, w = to_csr(n, *edges)
+    graph = csr_matrix((w, indices, indptr), shape=(n, n))
+    expected = dijkstra(graph, indices=sources)[:, targets]
+
+    finite = np.isfinite(expected)
+    return {
+        "nodes": n,
+        "edges": int(len(indices)),
+        "shortcuts": int(len(ch["fwd_indices"]) + len(ch["bwd_indices"]) - len(indices)),
+        "build_s": round(build_s, 2),
+        "pairs": int(got.size),
+        "us_per_pair": round(query_s / got.size * 1e6, 2),
+        "max_abs_error_m": float(np.max(np.abs(got[finite] - expected[finite]))),
+        "reachability_matches": bool(np.array_equal(np.isfinite(got), finite)),
+    }
+
+
+# ==============================
+# MAIN
+# ==============================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline road graph + contraction hierarchies")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="preprocess an extract into " + ROAD_GRAPH_FILE)
+    build.add_argument("inputs", nargs="+", help="region.osm.pbf, or nodes.csv edges.csv")
+    build.add_argument("--output", default=ROAD_GRAPH_FILE)
+
+    check = sub.add_parser("check", help="compare against plain Dijkstra on a synthetic grid")
+    check.add_argument("--size", type=int, default=60)
+    check.add_argument("--shape-points", type=int, default=0,
+                       help="degree-2 nodes per street, as in OSM ways")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "check":
+        print(json.dumps(self_check(args.size, args.size, shape_points=args.shape_points), indent=2))
+        return
+
+    if len(args.inputs) == 1:
+        lat, lon, edges = load_osm_pbf(args.inputs[0])
+    else:
+        lat, lon, edges = load_edge_csv(*args.inputs[:2])
+
+    print(f"✅ Road graph: {len(lat)} nodes, {len(edges[0])} directed edges")
+
+    t0 = time.perf_counter()
+    ch = build_contraction_hierarchy(lat, lon, edges)
+    save_hierarchy(ch, args.output)
+
+    print(f"✅ Contraction hierarchy saved → {args.output} ({time.perf_counter() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+from instrumentation import cache_lookup, stage
+from prefix_builder import build_prefix_arrays_np
+from route_pyramid import build_route_pyramid, nearest_route_points
+from vehicle_profiles import G, get_profile
+
+# ==============================
+# CONFIG
+# ==============================
+
+SOURCE = (19.110394346916838, 72.9255527657633)
+DESTINATION = (18.579607394136257, 73.90884169273019)
+
+OUTPUT_FILE = "route_alternatives.json"
+
+STEP_M = 50
+ELEVATION_BATCH_SIZE = 400       # Google allows max 512 locations per request
+ELEVATION_WORKERS = 8            # concurrent Elevation API requests
+CACHE_PRECISION = 5              # ~1 m: alternatives share their common stretches
+
+CHARGER_REACH_KM = 5             # charger_gaps.REACH_KM: coverage = reach − off-route distance
+
+VEHICLE = get_profile()
+BATTERY_KWH = VEHICLE["battery_kwh"]
+mass = VEHICLE["mass_kg"]
+g = G
+regen_eff = VEHICLE["regen_eff"]
+base_Wh_per_km = VEHICLE["base_wh_per_km"]
+
+
+# ==============================
+# SHARED ELEVATION CACHE
+# ==============================
+
+class ElevationCache:
+    """
+    Thread-safe elevation lookup shared by every route being evaluated.
+
+    Points are keyed on rounded (lat, lng). A point requested by two
+    routes at once is fetched once: the second caller waits on the
+    first caller's in-flight future.
+    """
+
+    def __init__(self, fetch_batch, batch_size=ELEVATION_BATCH_SIZE,
+                 max_workers=ELEVATION_WORKERS, precision=CACHE_PRECISION):
+        self.fetch_batch = fetch_batch
+        self.batch_size = batch_size
+        self.precision = precision
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.futures = {}
+
+    def key(self, pt):
+        return (round(pt[0], self.precision), round(pt[1], self.precision))
+
+    def _fetch(self, keys, futures):
+        try:
+            elevations = self.fetch_batch(keys)
+        except Exception as exc:
+            # Forget the failed keys so the next lookup fetches them again
+            with self.lock:
+                for k, fut in zip(keys, futures):
+                    if self.futures.get(k) is fut:
+                        del self.futures[k]
+
+            for fut in futures:
+                fut.set_exception(exc)
+            return
+
+        for fut, elev in zip(futures, elevations):
+            fut.set_result(elev)
+
+    def lookup(self, points):
+        keys = [self.key(pt) for pt in points]
+        missing = []
+        mine = {}
+
+        with self.lock:
+            for k in keys:
+                fut = self.futures.get(k)
+                hit = fut is not None
+                cache_lookup("elevation", hit)
+
+                if not hit:
+                    fut = Future()
+                    self.futures[k] = fut
+                    missing.append((k, fut))
+                mine[k] = fut
+
+        for i in range(0, len(missing), self.batch_size):
+            chunk = missing[i:i + self.batch_size]
+            self.pool.submit(self._fetch, [k for k, _ in chunk], [f for _, f in chunk])
+
+        return [mine[k].result() for k in keys]
+
+
+def google_elevation_batch(points):
+    """
+    One Elevation API request (≤ 512 points) → list of elevations.
+    """
+    from main import fetch_elevations
+
+    return [p["elevation"] for p in fetch_elevations(points, batch_size=len(points))]
+
+
+# ==============================
+# PER-ROUTE EVALUATION
+# ==============================
+
+def route_energy_profile(cum_distance, cum_ascent, cum_descent):
+    """
+    Energy from source → every route point (kWh), the energy_to_detour model.
+    """
+    E_flat = cum_distance / 1000 * base_Wh_per_km / 1000
+    E_climb = mass * g * cum_ascent / 3.6e6
+    E_regen = mass * g * cum_descent / 3.6e6 * regen_eff
+
+    return E_flat + E_climb - E_regen
+
+
+def evaluate_route(route_no, route, elevation_cache, station_rows=None):
+    """
+    station_rows defaults to the active stations along this route
+    (filter_stations.load_station_rows: station store or stations.csv).
+    """
+    from charger_gaps import corridor_gaps
+    from filter_stations import load_station_rows
+    from main import sample_route
+
+    with stage("evaluate_route", route=route_no) as span:
+
+        sampled = sample_route(route["points"], step_m=STEP_M)
+        elevations = elevation_cache.lookup(sampled)
+
+        points = [
+            {"lat": lat, "lng": lng, "elevation": elev}
+            for (lat, lng), elev in zip(sampled, elevations)
+        ]
+
+        cum_distance, cum_ascent, cum_descent = build_prefix_arrays_np(points)
+        energy = route_energy_profile(cum_distance, cum_ascent, cum_descent)
+
+        # Without charging, the lowest SOC is where cumulative energy peaks
+        min_soc = 100 - float(np.max(energy)) / BATTERY_KWH * 100
+
+        if station_rows is None:
+            station_rows = load_station_rows(route_points=points)
+
+        station_lat, station_lon = [], []
+        for row in station_rows:
+            try:
+                lat, lon = float(row["latitude"]), float(row["longitude"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            station_lat.append(lat)
+            station_lon.append(lon)
+
+        pyramid = build_route_pyramid(
+            [p["lat"] for p in points], [p["lng"] for p in points], cum_distance
+        )
+        _, dist_m, nearest = nearest_route_points(
+            pyramid, station_lat, station_lon, k=1,
+            max_distance_m=CHARGER_REACH_KM * 1000
+        )
+        within = nearest[:, 0] < len(points)
+        covered = [
+            {"nearest_route_index": int(i), "distance_to_route_km": float(d) / 1000}
+            for i, d in zip(nearest[within, 0], dist_m[within, 0])
+        ]
+
+        gaps = corridor_gaps({
+            "cum_distance_m": cum_distance,
+            "cum_ascent_m": cum_ascent,
+            "cum_descent_m": cum_descent,
+        }, covered, reach_km=CHARGER_REACH_KM)
+
+        span.set("points", len(points))
+        span.set("stations", len(covered))
+
+    return {
+        "route_no": route_no,
+        "summary": route.get("summary", ""),
+        "distance_km": round(float(cum_distance[-1]) / 1000, 3),
+        "total_energy_kwh": round(float(energy[-1]), 3),
+        "min_soc_pct": round(min_soc, 2),
+        "stations_within_reach": int(len(covered)),
+        "longest_charger_gap_km": gaps[0]["length_km"] if gaps else 0.0,
+        "points": points,
+    }
+
+
+def rank_key(result):
+    """
+    Lowest total energy first, then highest minimum SOC, then the
+    shortest charger gap.
+    """
+    return (
+        round(result["total_energy_kwh"], 1),
+        -round(result["min_soc_pct"], 1),
+        round(result["longest_charger_gap_km"], 1),
+    )
+
+
+# ==============================
+# ALL ALTERNATIVES, CONCURRENTLY
+# ==============================
+
+def evaluate_alternatives(routes, fetch_batch=google_elevation_batch, station_rows=None):
+    """
+    Runs sampling, elevation, energy and charger coverage for every route
+    in parallel. Elevation batches from all routes go through one shared
+    cache and request pool, so total latency is close to that of the
+    longest single route. No routes → [].
+    """
+    if not routes:
+        return []
+
+    elevation_cache = ElevationCache(fetch_batch)
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(routes)) as pool:
+            futures = [
+                pool.submit(evaluate_route, i, route, elevation_cache, station_rows)
+                for i, route in enumerate(routes)
+            ]
+            results = [f.result() for f in futures]
+    finally:
+        elevation_cache.pool.shutdown()
+
+    results.sort(key=rank_key)
+
+    for rank, r in enumerate(results, start=1):
+        r["rank"] = rank
+
+    return results
+
+
+# ==============================
+# MAIN
+# ==============================
+
+if __name__ == "__main__":
+    from sampling_route import fetch_alternative_route_points
+
+    print("🚀 Fetching alternative routes...")
+    routes = fetch_alternative_route_points(SOURCE, DESTINATION)
+    print("✅ Routes returned:", len(routes))
+
+    ranked = evaluate_alternatives(routes)
+
+    with open(OUTPUT_FILE, "w") as f:
+        json.dump([
+            {k: v for k, v in r.items() if k != "points"} for r in ranked
+        ], f, indent=2)
+
+    for r in ranked:
+        print(
+            f"#{r['rank']} {r['summary'] or 'route ' + str(r['route_no'])}:",
+            f"{r['distance_km']} km,",
+            f"{r['total_energy_kwh']} kWh,",
+            f"min SOC {r['min_soc_pct']}%,",
+            f"longest gap {r['longest_charger_gap_km']} km"
+        )
+
+    print("\n✅ Saved →", OUTPUT_FILE)
@@ -0,0 +1,284 @@
+import argparse
+import json
+import os
+import struct
+
+import numpy as np
+
+from instrumentation import stage
+
+# ==============================
+# CONFIG
+# ==============================
+# Planned routes kept for auditing, one compact file per route:
+#   python route_archive.py pack sampled_with_elevation_wind.json
+#   python route_archive.py unpack route_archive/<id>.evra --start 1000 --stop 2000
+#
+# File layout:
+#   chunks …                         column-major, see encode_chunk
+#   index                            JSON: fields, scales, chunk offsets
+#   footer                           MAGIC + uint64 index offset + uint32 index length
+#
+# Like Google's polyline encoding, every value is a scaled integer
+# stored as a zigzag varint delta from the previous point. Each chunk
+# starts from zero, so any chunk decodes on its own.
+
+ARCHIVE_DIR = os.environ.get("EVJ_ROUTE_ARCHIVE", "route_archive")
+ARCHIVE_EXT = ".evra"
+
+MAGIC = b"EVRA1"
+FOOTER = struct.Struct("<5sQI")
+
+CHUNK_POINTS = 1024
+
+# field → integer scale. Storage is lossy: write_archive rounds every
+# value to 1 / scale, i.e. lat/lng to 1e-5° (~1 m), elevation and wind
+# speed to 0.01. The pipeline's route JSON already holds 5-decimal
+# lat/lng, so those round-trip exactly; other input is quantized.
+# Fields with scale 1 are integers and come back as int.
+FIELD_SCALES = {
+    "lat": 100_000,
+    "lng": 100_000,
+    "elevation": 100,
+    "wind_speed": 100,
+    "wind_direction": 1,
+}
+
+
+# ==============================
+# ZIGZAG VARINTS
+# ==============================
+
+def encode_varints(values):
+    """int64 array → zigzag LEB128 bytes, 7 bits per byte, low bits first."""
+    values = np.asarray(values, dtype=np.int64)
+    zz = ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+    # Bytes per value: 1 + one more for every further 7 bits
+    nbytes = np.ones(len(zz), dtype=np.int64)
+    rest = zz >> np.uint64(7)
+    while rest.any():
+        nbytes += rest > 0
+        rest >>= np.uint64(7)
+
+    # Byte k of a value holds bits 7k … 7k+6, high bit set except on the last
+    owner = np.repeat(np.arange(len(zz)), nbytes)
+    k = np.arange(len(owner)) - np.repeat(np.cumsum(nbytes) - nbytes, nbytes)
+
+    out = (zz[owner] >> (np.uint64(7) * k.astype(np.uint64))) & np.uint64(0x7F)
+    out |= np.where(k < nbytes[owner] - 1, np.uint64(0x80), np.uint64(0))
+
+    return out.astype(np.uint8).tobytes()
+
+
+def decode_varints(data):
+    """Inverse of encode_varints, for all values in data at once."""
+    b = np.frombuffer(data, dtype=np.uint8)
+    if len(b) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    last = b < 0x80
+    starts = np.r_[0, np.flatnonzero(last)[:-1] + 1]
+
+    k = np.arange(len(b)) - np.repeat(starts, np.diff(np.r_[starts, len(b)]))
+    parts = (b & 0x7F).astype(np.uint64) << (np.uint64(7) * k.astype(np.uint64))
+
+    zz = np.bitwise_or.reduceat(parts, starts)
+    return (zz >> np.uint64(1)).astype(np.int64) ^ -(zz & np.uint64(1)).astype(np.int64)
+
+
+# ==============================
+# CHUNKS
+# ==============================
+
+def encode_chunk(columns):
+    """
+    (F, n) scaled integers → bytes. Column after column, each as deltas
+    from zero, so one decode + one cumsum per column restores it.
+    """
+    deltas = np.diff(columns, axis=1, prepend=0)
+    return encode_varints(deltas.ravel())
+
+
+def decode_chunk(data, n_fields):
+    deltas = decode_varints(data).reshape(n_fields, -1)
+    return np.cumsum(deltas, axis=1)
+
+
+def scaled_columns(points, fields, scales):
+    columns = np.empty((len(fields), len(points)), dtype=np.int64)
+
+    for f, name in enumerate(fields):
+        values = np.array([p[name] for p in points], dtype=float)
+        columns[f] = np.round(values * scales[name])
+
+    return columns
+
+
+# ==============================
+# WRITE / READ
+# ==============================
+
+def write_archive(filename, points, chunk_points=CHUNK_POINTS, scales=None):
+    scales = {**FIELD_SCALES, **(scales or {})}
+    fields = list(points[0].keys()) if points else []
+
+    unknown = [f for f in fields if f not in scales]
+    if unknown:
+        raise Exception(f"No archive scale for field(s) {unknown}, pass scales=")
+
+    with stage("route_archive_write", points=len(points)):
+        columns = scaled_columns(points, fields, scales)
+
+        chunks = []
+        offset = 0
+
+        with open(filename, "wb") as f:
+            for start in range(0, len(points), chunk_points):
+                data = encode_chunk(columns[:, start:start + chunk_points])
+                f.write(data)
+
+                chunks.append([offset, len(data)])
+                offset += len(data)
+
+            index = json.dumps({
+                "points": len(points),
+                "chunk_points": chunk_points,
+                "fields": fields,
+                "scales": {name: scales[name] for name in fields},
+                "chunks": chunks,
+            }).encode()
+
+            f.write(index)
+            f.write(FOOTER.pack(MAGIC, offset, len(index)))
+
+    return offset + len(index) + FOOTER.size
+
+
+class RouteArchive:
+    """
+    Reads one archive file. Only the index is loaded up front; a range
+    of route indices reads and decodes just the chunks that cover it.
+    """
+
+    def __init__(self, filename):
+        self.f = open(filename, "rb")
+
+        self.f.seek(-FOOTER.size, os.SEEK_END)
+        magic, index_offset, index_len = FOOTER.unpack(self.f.read(FOOTER.size))
+        if magic != MAGIC:
+            raise Exception(f"{filename} is not a route archive")
+
+        self.f.seek(index_offset)
+        self.index = json.loads(self.f.read(index_len))
+
+        self.fields = self.index["fields"]
+        self.scales = np.array([self.index["scales"][name] for name in self.fields], dtype=float)
+
+    def close(self):
+        self.f.close()
+
+    def __len__(self):
+        return self.index["points"]
+
+    def columns(self, start=0, stop=None):
+        """
+        {field: array} for route indices [start, stop): float, or int64
+        for fields stored with scale 1.
+        """
+        n = len(self)
+        stop = n if stop is None else min(stop, n)
+        start = max(start, 0)
+
+        if start >= stop:
+            return {
+                name: np.zeros(0, dtype=np.int64 if scale == 1 else float)
+                for name, scale in zip(self.fields, self.scales)
+            }
+
+        size = self.index["chunk_points"]
+        first, last = start // size, (stop - 1) // size
+        chunks = self.index["chunks"][first:last + 1]
+
+        # Chunks are contiguous on disk: one read for the whole range
+        self.f.seek(chunks[0][0])
+        data = self.f.read(chunks[-1][0] + chunks[-1][1] - chunks[0][0])
+
+        parts = []
+        base = chunks[0][0]
+        for offset, length in chunks:
+            parts.append(decode_chunk(data[offset - base:offset - base + length], len(self.fields)))
+
+        scaled = np.concatenate(parts, axis=1)[:, start - first * size:stop - first * size]
+        return {
+            name: scaled[f] if self.scales[f] == 1 else scaled[f] / self.scales[f]
+            for f, name in enumerate(self.fields)
+        }
+
+    def points(self, start=0, stop=None):
+        """Route points as the JSON files hold them."""
+        columns = self.columns(start, stop)
+        rows = zip(*(columns[name].tolist() for name in self.fields))
+
+        return [dict(zip(self.fields, row)) for row in rows]
+
+
+def read_archive(filename, start=0, stop=None):
+    archive = RouteArchive(filename)
+    try:
+        return archive.points(start, stop)
+    finally:
+        archive.close()
+
+
+def archive_route(points, directory=ARCHIVE_DIR):
+    """Stores a route under its fingerprint. Returns the file path."""
+    from station_store import route_fingerprint
+
+    os.makedirs(directory, exist_ok=True)
+    filename = os.path.join(directory, route_fingerprint(points) + ARCHIVE_EXT)
+    write_archive(filename, points)
+
+    return filename
+
+
+# ==============================
+# MAIN
+# ==============================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compact route archive")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    pack = sub.add_parser("pack", help="archive a route JSON file")
+    pack.add_argument("route")
+    pack.add_argument("--dir", default=ARCHIVE_DIR)
+
+    unpack = sub.add_parser("unpack", help="route indices [start, stop) back to JSON")
+    unpack.add_argument("archive")
+    unpack.add_argument("--start", type=int, default=0)
+    unpack.add_argument("--stop", type=int)
+    unpack.add_argument("--out", default="route_unpacked.json")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "pack":
+        with open(args.route) as f:
+            points = json.load(f)
+
+        filename = archive_route(points, args.dir)
+        size = os.path.getsize(filename)
+        print(f"✅ {len(points)} points → {filename} "
+              f"({size / 1024:.0f} KB, {os.path.getsize(args.route) / size:.1f}x smaller)")
+
+    elif args.command == "unpack":
+        points = read_archive(args.archive, args.start, args.stop)
+
+        with open(args.out, "w") as f:
+            json.dump(points, f, indent=2)
+
+        print(f"✅ {len(points)} points → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,510 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from instrumentation import cache_lookup, stage
+from prefix_builder import haversine_np
+
+# ==============================
+# CONFIG
+# ==============================
+
+ROUTE_CHUNKS_FILE = os.environ.get("EVJ_ROUTE_CHUNKS", "route_chunks.sqlite")
+
+STEP_M = 50
+
+# Content-defined chunking of the decoded Directions vertices: a vertex
+# ends a chunk when its hash is 0 mod CHUNK_AVG_VERTICES. The cut depends
+# only on the vertex itself, so two routes along the same road cut it at
+# the same vertices whatever happened before the shared stretch.
+#
+# A stretch with no such vertex within CHUNK_MAX_VERTICES is cut at the
+# lowest-hash vertex in the second half of that window. Two routes that
+# enter the stretch at different offsets see mostly the same window, so
+# they soon pick the same vertex and cut identically from there on.
+CHUNK_AVG_VERTICES = 64
+CHUNK_MIN_VERTICES = 16
+CHUNK_MAX_VERTICES = 512
+VERTEX_PRECISION = 5              # ~1 m
+
+MAX_DISTANCE_KM = 5               # filter_stations.MAX_DISTANCE_KM
+KM_PER_DEG_LAT = 111.32
+
+SQL_CHUNK = 500
+
+
+# ==============================
+# CHUNKING
+# ==============================
+
+def quantize(vertices):
+    return np.round(np.asarray(vertices, dtype=float) * 10 ** VERTEX_PRECISION).astype(np.int64)
+
+
+def chunk_bounds(vertices):
+    """
+    [(start, end), ...] vertex index ranges; consecutive chunks share
+    their boundary vertex.
+    """
+    q = quantize(vertices)
+    n = len(q)
+
+    mixed = (q[:, 0] * 73856093) ^ (q[:, 1] * 19349663)
+    strong = np.flatnonzero((mixed % CHUNK_AVG_VERTICES) == 0)
+    rank = (mixed * 2654435761) & 0xFFFFFFFF   # scrambled, for forced cuts
+
+    def first(cuts, lo, hi):
+        k = np.searchsorted(cuts, lo)
+        return int(cuts[k]) if k < len(cuts) and cuts[k] <= hi else None
+
+    bounds = []
+    start = 0
+
+    while True:
+        hi = min(start + CHUNK_MAX_VERTICES, n - 2)
+        if hi < start + CHUNK_MIN_VERTICES:
+            break
+
+        cut = first(strong, start + CHUNK_MIN_VERTICES, hi)
+
+        if cut is None and n - 1 - start > CHUNK_MAX_VERTICES:
+            lo = start + CHUNK_MAX_VERTICES // 2
+            cut = lo + int(np.argmin(rank[lo:hi + 1]))
+
+        if cut is None:
+            break
+
+        bounds.append((start, cut))
+        start = cut
+
+    bounds.append((start, n - 1))
+    return bounds
+
+
+def chunk_id(vertices, step_m=STEP_M):
+    h = hashlib.sha1(quantize(vertices).tobytes())
+    h.update(str(step_m).encode())
+    return h.hexdigest()[:20]
+
+
+def stations_version(station_rows):
+    """Changes whenever a station is added, removed or moved."""
+    h = hashlib.sha1()
+    for row in sorted(station_rows, key=lambda r: str(r.get("id"))):
+        h.update(f"{row.get('id')}|{row.get('latitude')}|{row.get('longitude')}\n".encode())
+    return h.hexdigest()[:20]
+
+
+def chunk_station_versions(points, chunk_sizes, station_rows, max_distance_km=MAX_DISTANCE_KM):
+    """
+    stations_version per chunk, over only the stations in grid cells
+    within max_distance_km of that chunk. A chunk's version then depends
+    on the chunk and its own neighbourhood, not on which route (and so
+    which corridor of store rows) it was loaded with.
+    """
+    from station_store import cell_of, corridor_cells
+
+    by_cell = {}
+    for row in station_rows:
+        try:
+            cell = cell_of(float(row["latitude"]), float(row["longitude"]))
+        except (KeyError, TypeError, ValueError):
+            continue
+        by_cell.setdefault(cell, []).append(row)
+
+    offsets = np.concatenate(([0], np.cumsum(chunk_sizes)))
+    versions = []
+
+    for i in range(len(chunk_sizes)):
+        cells = corridor_cells(points[offsets[i]:offsets[i + 1]], max_distance_km)
+        versions.append(stations_version(
+            [row for cell in cells for row in by_cell.get(cell, ())]
+        ))
+
+    return versions
+
+
+# ==============================
+# PER-CHUNK WORK
+# ==============================
+
+def sample_chunk(vertices, last, step_m=STEP_M):
+    """
+    50 m samples of one chunk, anchored at its own first vertex so the
+    result depends only on the chunk. The end vertex belongs to the next
+    chunk unless this is the last one.
+    """
+    from main import sample_route
+
+    sampled = sample_route([tuple(v) for v in vertices], step_m=step_m)
+    if not last and len(sampled) > 1:
+        sampled = sampled[:-1]
+
+    return sampled
+
+
+def local_prefix(points):
+    """Cumulative distance/ascent/descent inside one chunk (prefix deltas)."""
+    lat = np.array([p["lat"] for p in points])
+    lng = np.array([p["lng"] for p in points])
+    elev = np.array([p["elevation"] for p in points])
+
+    d = haversine_np(lat[:-1], lng[:-1], lat[1:], lng[1:])
+    dh = np.diff(elev)
+
+    return (
+        np.concatenate(([0.0], np.cumsum(d))),
+        np.concatenate(([0.0], np.cumsum(np.where(dh > 0, dh, 0.0)))),
+        np.concatenate(([0.0], np.cumsum(np.where(dh > 0, 0.0, -dh)))),
+    )
+
+
+def chunk_nearby(points, st_lat, st_lon, max_distance_km=MAX_DISTANCE_KM):
+    """
+    Stations within max_distance_km of any point of one chunk:
+    {station position: (local index, distance km)}.
+    """
+    lat = np.array([p["lat"] for p in points])
+    lng = np.array([p["lng"] for p in points])
+
+    # Bounding box with margin first, exact distances for the few inside
+    pad_lat = max_distance_km / KM_PER_DEG_LAT
+    pad_lng = pad_lat / max(np.cos(np.radians(np.abs(lat).max())), 0.01)
+
+    inside = np.flatnonzero(
+        (st_lat >= lat.min() - pad_lat) & (st_lat <= lat.max() + pad_lat)
+        & (st_lon >= lng.min() - pad_lng) & (st_lon <= lng.max() + pad_lng)
+    )
+    if len(inside) == 0:
+        return {}
+
+    dist_km = haversine_np(
+        st_lat[inside][:, None], st_lon[inside][:, None], lat[None, :], lng[None, :]
+    ) / 1000
+
+    nearest = np.argmin(dist_km, axis=1)
+    best = dist_km[np.arange(len(inside)), nearest]
+
+    return {
+        int(pos): (int(idx), float(d))
+        for pos, idx, d in zip(inside, nearest, best)
+        if d <= max_distance_km
+    }
+
+
+# ==============================
+# STORE
+# ==============================
+
+class RouteChunkStore:
+    """
+    Per-chunk results keyed by chunk content: sampled points with
+    elevation, local prefix arrays, and nearby stations per version of
+    the stations around the chunk.
+    """
+
+    def __init__(self, filename=ROUTE_CHUNKS_FILE):
+        self.db = sqlite3.connect(filename)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id   TEXT PRIMARY KEY,
+                points     TEXT NOT NULL,
+                prefix     TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS nearby (
+                chunk_id         TEXT NOT NULL,
+                stations_version TEXT NOT NULL,
+                stations         TEXT NOT NULL,
+                PRIMARY KEY (chunk_id, stations_version)
+            );
+        """)
+
+    def close(self):
+        self.db.close()
+
+    def _get(self, table, columns, ids, extra="", params=()):
+        found = {}
+
+        for i in range(0, len(ids), SQL_CHUNK):
+            part = ids[i:i + SQL_CHUNK]
+            marks = ",".join("?" * len(part))
+            rows = self.db.execute(
+                f"SELECT chunk_id, {columns} FROM {table} WHERE chunk_id IN ({marks}) {extra}",
+                [*part, *params]
+            )
+            for cid, *values in rows:
+                found[cid] = values
+
+        return found
+
+    def get_chunks(self, ids):
+        rows = self._get("chunks", "points, prefix", list(set(ids)))
+        return {cid: (json.loads(p), json.loads(x)) for cid, (p, x) in rows.items()}
+
+    def put_chunks(self, values):
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_id, points, prefix, created_at) VALUES (?, ?, ?, ?)",
+                [(cid, json.dumps(points), json.dumps(prefix), now) for cid, (points, prefix) in values.items()]
+            )
+
+    def get_nearby(self, versions):
+        """versions: {chunk_id: stations_version} → {chunk_id: nearby} for the hits."""
+        ids = list(versions)
+        found = {}
+
+        for i in range(0, len(ids), SQL_CHUNK):
+            part = ids[i:i + SQL_CHUNK]
+            marks = ",".join("?" * len(part))
+            rows = self.db.execute(
+                f"SELECT chunk_id, stations_version, stations FROM nearby WHERE chunk_id IN ({marks})",
+                part
+            )
+            for cid, version, stations in rows:
+                if versions[cid] == version:
+                    found[cid] = json.loads(stations)
+
+        return found
+
+    def put_nearby(self, values, versions):
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO nearby (chunk_id, stations_version, stations) VALUES (?, ?, ?)",
+                [(cid, versions[cid], json.dumps(s)) for cid, s in values.items()]
+            )
+
+    def stats(self):
+        chunks, = self.db.execute("SELECT COUNT(*) FROM chunks").fetchone()
+        nearby, = self.db.execute("SELECT COUNT(*) FROM nearby").fetchone()
+        return {"chunks": chunks, "nearby": nearby}
+
+
+# ==============================
+# ROUTE ASSEMBLY
+# ==============================
+
+def splice_prefix(points, chunk_prefixes):
+    """
+    Global prefix arrays from the per-chunk ones: each chunk is shifted
+    by everything before it plus the junction segment into it.
+    """
+    cum = {"cum_distance_m": [], "cum_ascent_m": [], "cum_descent_m": []}
+    offset = np.zeros(3)
+    pos = 0
+
+    for local in chunk_prefixes:
+        n = len(local["cum_distance_m"])
+
+        if pos > 0:
+            a, b = points[pos - 1], points[pos]
+            dh = b["elevation"] - a["elevation"]
+            offset += (
+                float(haversine_np(a["lat"], a["lng"], b["lat"], b["lng"])),
+                max(dh, 0.0),
+                max(-dh, 0.0),
+            )
+
+        for k, (key, arr) in enumerate(cum.items()):
+            arr.append(offset[k] + np.asarray(local[key]))
+            offset[k] = arr[-1][-1]
+
+        pos += n
+
+    return {key: np.concatenate(arrs).tolist() for key, arrs in cum.items()}
+
+
+def chunked_route(vertices, store, fetch_elevations=None, step_m=STEP_M):
+    """
+    Sampled route with elevation and prefix arrays, reusing every chunk
+    already in the store. Only new chunks are sampled and sent to the
+    Elevation API (in one batch).
+    Returns (points, prefix, chunks, stats); chunks is [(chunk_id,
+    number of points), ...] in route order.
+    """
+    if fetch_elevations is None:
+        from main import fetch_elevations
+
+    bounds = chunk_bounds(vertices)
+    ids = [chunk_id(vertices[s:e + 1], step_m) for s, e in bounds]
+
+    with stage("route_chunks", chunks=len(ids)) as span:
+        cached = store.get_chunks(ids)
+        for cid in ids:
+            cache_lookup("route_chunk", cid in cached)
+
+        new = {}
+        for (s, e), cid in zip(bounds, ids):
+            if cid not in cached and cid not in new:
+                new[cid] = sample_chunk(vertices[s:e + 1], e == len(vertices) - 1, step_m)
+
+        if new:
+            flat = [pt for samples in new.values() for pt in samples]
+            enriched = iter(fetch_elevations(flat))
+
+            computed = {}
+            for cid, samples in new.items():
+                points = [next(enriched) for _ in samples]
+                d, a, dsc = local_prefix(points)
+                computed[cid] = (points, {
+                    "cum_distance_m": d.tolist(),
+                    "cum_ascent_m": a.tolist(),
+                    "cum_descent_m": dsc.tolist(),
+                })
+
+            store.put_chunks(computed)
+            cached.update(computed)
+
+        points = [pt for cid in ids for pt in cached[cid][0]]
+        prefix = splice_prefix(points, [cached[cid][1] for cid in ids])
+
+        span.set("new_chunks", len(new))
+        span.set("points", len(points))
+
+    chunks = [(cid, len(cached[cid][0])) for cid in ids]
+
+    stats = {
+        "chunks": len(ids),
+        "reused_chunks": len(ids) - len(new),
+        "new_points": sum(len(s) for s in new.values()),
+        "points": len(points),
+    }
+
+    return points, prefix, chunks, stats
+
+
+def chunked_filter(points, chunks, station_rows, store,
+                   max_distance_km=MAX_DISTANCE_KM, side="left"):
+    """
+    filter_stations over the spliced route. Nearby stations are stored
+    per chunk and version of the stations around it; only new chunks, or
+    chunks whose stations changed, are matched against the station set.
+    Sides are decided on the whole route.
+    """
+    from filter_stations import get_side_of_route
+
+    ids = [cid for cid, _ in chunks]
+    chunk_sizes = [size for _, size in chunks]
+    versions = dict(zip(ids, chunk_station_versions(points, chunk_sizes, station_rows, max_distance_km)))
+
+    by_id = {}
+    for row in station_rows:
+        try:
+            by_id[str(row["id"])] = (row, float(row["latitude"]), float(row["longitude"]))
+        except (KeyError, TypeError, ValueError):
+            continue
+
+    with stage("route_chunks_filter", chunks=len(ids)) as span:
+        nearby = store.get_nearby(versions)
+        missing = [i for i, cid in enumerate(ids) if cid not in nearby]
+
+        if missing:
+            sids = list(by_id)
+            st_lat = np.array([by_id[s][1] for s in sids])
+            st_lon = np.array([by_id[s][2] for s in sids])
+
+            offsets = np.concatenate(([0], np.cumsum(chunk_sizes)))
+            computed = {}
+
+            for i in missing:
+                chunk_points = points[offsets[i]:offsets[i + 1]]
+                found = chunk_nearby(chunk_points, st_lat, st_lon, max_distance_km)
+                computed[ids[i]] = [[sids[pos], idx, d] for pos, (idx, d) in found.items()]
+
+            store.put_nearby(computed, versions)
+            nearby.update(computed)
+
+        span.set("new_chunks", len(missing))
+
+    # Closest chunk point per station over the whole route
+    best = {}
+    offset = 0
+    for cid, size in zip(ids, chunk_sizes):
+        for sid, idx, d in nearby[cid]:
+            if sid not in best or d < best[sid][1]:
+                best[sid] = (offset + idx, d)
+        offset += size
+
+    route_coords = [(p["lng"], p["lat"]) for p in points]
+    relevant = []
+
+    # Station file order, like filter_stations
+    for sid, (row, lat, lon) in by_id.items():
+        if sid not in best:
+            continue
+
+        nearest_idx, distance_km = best[sid]
+
+        if nearest_idx <= 0 or nearest_idx >= len(route_coords) - 1:
+            continue
+
+        station_side = get_side_of_route(
+            route_coords[nearest_idx - 1], route_coords[nearest_idx + 1], (lon, lat)
+        )
+
+        if station_side == side:
+            row = dict(row)
+            row["distance_to_route_km"] = round(distance_km, 3)
+            row["nearest_route_index"] = int(nearest_idx)
+            row["side"] = station_side
+            relevant.append(row)
+
+    return relevant
+
+
+# ==============================
+# MAIN
+# ==============================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan a route reusing chunks of previous routes")
+    parser.add_argument("--store", default=ROUTE_CHUNKS_FILE)
+    parser.add_argument("--vertices", help="JSON [[lat, lng], ...] instead of calling Directions")
+    parser.add_argument("--source", type=float, nargs=2)
+    parser.add_argument("--destination", type=float, nargs=2)
+    parser.add_argument("--stations", default="stations.csv")
+    args = parser.parse_args(argv)
+
+    if args.vertices:
+        with open(args.vertices) as f:
+            vertices = json.load(f)
+    else:
+        from main import DESTINATION, SOURCE
+        from sampling_route import fetch_directions, route_points_from_steps
+
+        route = fetch_directions(args.source or SOURCE, args.destination or DESTINATION)["routes"][0]
+        vertices = route_points_from_steps(route)
+
+    store = RouteChunkStore(args.store)
+
+    points, prefix, chunks, stats = chunked_route(vertices, store)
+    print(
+        f"♻️  {stats['reused_chunks']}/{stats['chunks']} chunks reused, "
+        f"{stats['new_points']}/{stats['points']} points computed"
+    )
+
+    from filter_stations import load_station_rows
+
+    stations = chunked_filter(points, chunks, load_station_rows(args.stations, route_points=points), store)
+    store.close()
+
+    with open("sampled_with_elevation_50m.json", "w") as f:
+        json.dump(points, f, indent=2)
+
+    with open("prefix_arrays.json", "w") as f:
+        json.dump(prefix, f, indent=2)
+
+    with open("filtered_stations.json", "w", encoding="utf-8") as f:
+        json.dump(stations, f, indent=2)
+
+    print("✅ Route points:", len(points), "| stations:", len(stations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import math
+
+import numpy as np
+
+from instrumentation import stage
+from prefix_builder import haversine_np
+
+# ==============================
+# CONFIG
+# ==============================
+# Coarser levels are taken from the fine route's cumulative distance
+# array. The fine level itself is the sampled route (50 m).
+PYRAMID_STEPS_M = (500, 5000)
+
+EARTH_RADIUS_M = 6371000
+
+
+# ==============================
+# Lat/lon → 3D meters on the sphere
+# ==============================
+# The pyramid indexes points on the sphere itself: straight-line (chord)
+# distance grows monotonically with great-circle distance, so the
+# KD-trees rank and cut off exactly as haversine would, at any latitude
+# span. A single-reference equirectangular projection stretches
+# east-west distances away from its reference latitude.
+
+def latlon_to_xyz(lat, lon):
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    return EARTH_RADIUS_M * np.column_stack((
+        np.cos(lat) * np.cos(lon),
+        np.cos(lat) * np.sin(lon),
+        np.sin(lat),
+    ))
+
+
+def arc_to_chord(distance_m):
+    """Great-circle meters → straight-line meters through the sphere."""
+    if not np.isfinite(distance_m):
+        return distance_m
+    return 2 * EARTH_RADIUS_M * math.sin(min(distance_m / (2 * EARTH_RADIUS_M), math.pi / 2))
+
+
+def chord_to_arc(chord_m):
+    """Inverse of arc_to_chord (inf stays inf)."""
+    chord_m = np.asarray(chord_m, dtype=float)
+    ratio = np.clip(np.nan_to_num(chord_m / (2 * EARTH_RADIUS_M), posinf=1.0), 0.0, 1.0)
+    return np.where(np.isfinite(chord_m), 2 * EARTH_RADIUS_M * np.arcsin(ratio), np.inf)
+
+
+# ==============================
+# BUILD
+# ==============================
+def _level_vertices(cum_distance_m, step_m):
+    """
+    Fine indices of the first point at or past every multiple of step_m,
+    always including both route ends.
+    """
+    marks = np.arange(0, cum_distance_m[-1], step_m)
+    idx = np.searchsorted(cum_distance_m, marks, side="left")
+    idx = np.unique(np.concatenate((idx, [len(cum_distance_m) - 1])))
+    return idx
+
+
+def _half_step(xy, idx):
+    """
+    Exact bound h: every fine point is within h (chord) meters of one of
+    the two level vertices that bracket it. So for any station,
+    d(fine route) ≥ d(level vertices) − h.
+    """
+    n = len(xy)
+    pos = np.searchsorted(idx, np.arange(n), side="right")
+    left = idx[np.clip(pos - 1, 0, len(idx) - 1)]
+    right = idx[np.clip(pos, 0, len(idx) - 1)]
+
+    d_left = np.linalg.norm(xy - xy[left], axis=1)
+    d_right = np.linalg.norm(xy - xy[right], axis=1)
+
+    return float(np.max(np.minimum(d_left, d_right)))
+
+
+def build_route_pyramid(lat, lng, cum_distance_m=None, steps_m=PYRAMID_STEPS_M):
+    """
+    Multi-resolution index over a sampled route.
+
+    Level 0 is the fine route; each further level keeps one vertex every
+    `step` meters of cumulative distance. Every level has its own KD-tree
+    and an exact half-step bound, and level vertices are fine indices, so
+    refined results map straight back to the route.
+    """
+    from scipy.spatial import KDTree
+
+    lat = np.asarray(lat, dtype=float)
+    lng = np.asarray(lng, dtype=float)
+
+    if cum_distance_m is None:
+        seg = haversine_np(lat[:-1], lng[:-1], lat[1:], lng[1:])
+        cum_distance_m = np.concatenate(([0.0], np.cumsum(seg)))
+    cum_distance_m = np.asarray(cum_distance_m, dtype=float)
+
+    xy = latlon_to_xyz(lat, lng)
+
+    with stage("route_pyramid_build", points=len(xy)):
+
+        levels = [{
+            "step_m": None,
+            "idx": np.arange(len(xy)),
+            "half_step_m": 0.0,
+            "tree": KDTree(xy),
+        }]
+
+        for step_m in sorted(steps_m):
+            idx = _level_vertices(cum_distance_m, step_m)
+            levels.append({
+                "step_m": step_m,
+                "idx": idx,
+                "half_step_m": _half_step(xy, idx),
+                "tree": KDTree(xy[idx]),
+            })
+
+    return {"xy": xy, "levels": levels}
+
+
+# ==============================
+# QUERY
+# ==============================
+def nearest_route_points(pyramid, lat, lon, k=1, max_distance_m=math.inf):
+    """
+    Coarse-to-fine nearest route points for many stations.
+
+    Each coarse level rejects, in one vectorized KD-tree query, every
+    station whose distance to that level minus its half step already
+    exceeds max_distance_m. Only survivors reach the 50 m tree.
+
+    Returns (positions, distances_m, fine_indices): positions into the
+    input arrays of the surviving stations, and (n, k) arrays of their
+    k nearest fine route points by great-circle distance (inf /
+    len(route) where fewer than k lie within max_distance_m).
+    """
+    station_xy = latlon_to_xyz(np.asarray(lat, dtype=float), np.asarray(lon, dtype=float))
+    max_chord_m = arc_to_chord(max_distance_m)
+
+    with stage("route_pyramid_query", stations=len(station_xy)) as span:
+
+        alive = np.arange(len(station_xy))
+
+        for level in reversed(pyramid["levels"][1:]):
+            if not len(alive):
+                break
+
+            bound = max_chord_m + level["half_step_m"]
+            d, _ = level["tree"].query(station_xy[alive], distance_upper_bound=bound)
+            alive = alive[d <= bound]
+
+            span.set(f"survivors_{level['step_m']}m", len(alive))
+
+        fine = pyramid["levels"][0]
+        if len(alive):
+            dist, idx = fine["tree"].query(
+                station_xy[alive], k=k, distance_upper_bound=max_chord_m
+            )
+            dist = chord_to_arc(dist)
+        else:
+            dist, idx = np.empty((0, k)), np.empty((0, k), dtype=int)
+
+    return alive, dist.reshape(len(alive), k), idx.reshape(len(alive), k)
@@ -0,0 +1,230 @@
+import json
+import math
+
+import numpy as np
+import polyline
+from branca.element import MacroElement
+from jinja2 import Template
+
+from instrumentation import traced
+
+# -----------------------------
+# RENDER SETTINGS
+# -----------------------------
+# Route geometry is simplified for the most detailed zoom a user is
+# expected to inspect; coarser zooms simply draw the same vertices.
+RENDER_ZOOM = 14
+PIXEL_TOLERANCE = 1.0     # max deviation allowed on screen (pixels)
+
+EARTH_RADIUS_M = 6371000
+WEB_MERCATOR_M_PER_PX = 156543.03392  # metres per pixel at zoom 0, equator
+
+
+# -----------------------------
+# Zoom → metres per pixel
+# -----------------------------
+def meters_per_pixel(lat, zoom):
+    """
+    Ground resolution of a 256px Web-Mercator tile at `lat` and `zoom`.
+    """
+    return WEB_MERCATOR_M_PER_PX * math.cos(math.radians(lat)) / (2 ** zoom)
+
+
+def simplify_tolerance_m(lat, zoom=RENDER_ZOOM, pixel_tolerance=PIXEL_TOLERANCE):
+    return pixel_tolerance * meters_per_pixel(lat, zoom)
+
+
+# -----------------------------
+# Lat/lon → local XY metres
+# -----------------------------
+def project_to_meters(coords, ref_lat):
+    coords = np.asarray(coords, dtype=float)
+
+    x = np.radians(coords[:, 1]) * EARTH_RADIUS_M * math.cos(math.radians(ref_lat))
+    y = np.radians(coords[:, 0]) * EARTH_RADIUS_M
+
+    return np.column_stack((x, y))
+
+
+# -----------------------------
+# Douglas–Peucker
+# -----------------------------
+def douglas_peucker(coords, tolerance_m):
+    """
+    Returns indices of the (lat, lon) vertices kept by Douglas–Peucker
+    at `tolerance_m`. First and last vertices are always kept.
+    """
+    n = len(coords)
+    if n <= 2:
+        return list(range(n))
+
+    xy = project_to_meters(coords, coords[0][0])
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    # Explicit stack instead of recursion: 50 m routes have 10^4–10^6 points
+    stack = [(0, n - 1)]
+
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        a = xy[start]
+        b = xy[end]
+        inner = xy[start + 1:end]
+
+        ab = b - a
+        ab_len = math.hypot(ab[0], ab[1])
+
+        if ab_len == 0:
+            dist = np.hypot(inner[:, 0] - a[0], inner[:, 1] - a[1])
+        else:
+            # Perpendicular distance of every inner vertex to chord a→b
+            dist = np.abs(ab[0] * (inner[:, 1] - a[1]) - ab[1] * (inner[:, 0] - a[0])) / ab_len
+
+        i = int(np.argmax(dist))
+
+        if dist[i] > tolerance_m:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+
+    return np.flatnonzero(keep).tolist()
+
+
+def simplify_route(coords, zoom=RENDER_ZOOM, pixel_tolerance=PIXEL_TOLERANCE):
+    """
+    Simplifies a list of (lat, lon) to `pixel_tolerance` pixels at `zoom`.
+    """
+    if len(coords) <= 2:
+        return list(coords)
+
+    mid_lat = coords[len(coords) // 2][0]
+    tolerance_m = simplify_tolerance_m(mid_lat, zoom, pixel_tolerance)
+
+    return [coords[i] for i in douglas_peucker(coords, tolerance_m)]
+
+
+# -----------------------------
+# Split route into colour runs
+# -----------------------------
+def color_runs(coords, values, color_fn):
+    """
+    Groups consecutive points with the same colour into runs.
+    Neighbouring runs share their boundary vertex so the line stays continuous.
+    """
+    runs = []
+    if not coords:
+        return runs
+
+    current_color = color_fn(values[0])
+    current = [coords[0]]
+
+    for pt, value in zip(coords[1:], values[1:]):
+        color = color_fn(value)
+
+        current.append(pt)
+
+        if color != current_color:
+            runs.append((current, current_color))
+            current = [pt]
+            current_color = color
+
+    if len(current) > 1:
+        runs.append((current, current_color))
+
+    return runs
+
+
+# -----------------------------
+# Encoded polyline layer (one Leaflet layer, compact payload)
+# -----------------------------
+_ENCODED_LAYER_TEMPLATE = """
+{% macro script(this, kwargs) %}
+    var {{ this.get_name() }} = L.featureGroup().addTo({{ this._parent.get_name() }});
+    (function() {
+        function decode(str) {
+            var index = 0, lat = 0, lng = 0, coords = [];
+            while (index < str.length) {
+                var b, shift = 0, result = 0;
+                do { b = str.charCodeAt(index++) - 63; result |= (b & 0x1f) << shift; shift += 5; } while (b >= 0x20);
+                lat += (result & 1) ? ~(result >> 1) : (result >> 1);
+                shift = 0; result = 0;
+                do { b = str.charCodeAt(index++) - 63; result |= (b & 0x1f) << shift; shift += 5; } while (b >= 0x20);
+                lng += (result & 1) ? ~(result >> 1) : (result >> 1);
+                coords.push([lat * 1e-5, lng * 1e-5]);
+            }
+            return coords;
+        }
+        var runs = {{ this.runs_json }};
+        var style = {{ this.style_json }};
+        for (var i = 0; i < runs.length; i++) {
+            var line = L.polyline(decode(runs[i][0]), Object.assign({}, style, {color: runs[i][1]}));
+            {% if this.tooltip %}line.bindTooltip({{ this.tooltip_json }});{% endif %}
+            line.addTo({{ this.get_name() }});
+        }
+    })();
+{% endmacro %}
+"""
+
+
+def encoded_polyline_layer(runs, weight=4, opacity=0.8, tooltip=None):
+    """
+    Builds a single Leaflet layer from [(coords, color), ...] runs.
+    Geometry is embedded as Google encoded polylines (~4 bytes/vertex)
+    instead of one folium object per point.
+    """
+    layer = MacroElement()
+    layer._name = "EncodedPolylineLayer"
+    layer._template = Template(_ENCODED_LAYER_TEMPLATE)
+
+    layer.runs_json = json.dumps(
+        [[polyline.encode(coords, 5), color] for coords, color in runs]
+    )
+    layer.style_json = json.dumps({"weight": weight, "opacity": opacity})
+    layer.tooltip = tooltip
+    layer.tooltip_json = json.dumps(tooltip)
+
+    return layer
+
+
+# -----------------------------
+# Public helpers used by the map scripts
+# -----------------------------
+@traced("render_route_layer")
+def add_route_layer(m, coords, color="blue", weight=4, opacity=0.8,
+                    tooltip=None, zoom=RENDER_ZOOM, pixel_tolerance=PIXEL_TOLERANCE):
+    """
+    Draws a simplified, encoded route line onto folium map `m`.
+    """
+    coords = [tuple(c) for c in coords]
+    simplified = simplify_route(coords, zoom, pixel_tolerance)
+
+    layer = encoded_polyline_layer([(simplified, color)], weight, opacity, tooltip)
+    layer.add_to(m)
+
+    return layer
+
+
+@traced("render_elevation_layer")
+def add_elevation_layer(m, points, color_fn, weight=5, opacity=0.8,
+                        zoom=RENDER_ZOOM, pixel_tolerance=PIXEL_TOLERANCE):
+    """
+    Draws the route coloured by elevation as one layer of encoded
+    colour runs, each simplified independently.
+    """
+    coords = [(p["lat"], p["lng"]) for p in points]
+    elevations = [p["elevation"] for p in points]
+
+    runs = [
+        (simplify_route(run, zoom, pixel_tolerance), color)
+        for run, color in color_runs(coords, elevations, color_fn)
+    ]
+
+    layer = encoded_polyline_layer(runs, weight, opacity)
+    layer.add_to(m)
+
+    return layer
@@ -1,17 +1,19 @@
 import json
 from best_station_soc import step10_build_best_dataframe
 
-# Load Step 9 output
-with open("stations_with_total_energy.json", "r") as f:
-    stations_data = json.load(f)
+if __name__ == "__main__":
 
-# Run Step 10
-df = step10_build_best_dataframe(stations_data)
+    # Load Step 9 output
+    with open("stations_with_total_energy.json", "r") as f:
+        stations_data = json.load(f)
 
-print("\n✅ STEP 10 COMPLETE: Best Candidate Per Station\n")
-print(df.head(10))
+    # Run Step 10
+    df = step10_build_best_dataframe(stations_data)
 
-# Save result
-df.to_csv("step10_best_stations.csv", index=False)
+    print("\n✅ STEP 10 COMPLETE: Best Candidate Per Station\n")
+    print(df.head(10))
 
-print("\nSaved → step10_best_stations.csv")
+    # Save result
+    df.to_csv("step10_best_stations.csv", index=False)
+
+    print("\nSaved → step10_best_stations.csv")
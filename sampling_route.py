@@ -1,8 +1,8 @@
-import requests
-import polyline
 import json
-from geopy.distance import geodesic
-from config import GOOGLE_MAPS_API_KEY
+from api_endpoints import DIRECTIONS_URL
+from instrumentation import http_call, traced
+from quota import acquire
+from speed_profile import save_speed_profile, step_speed_profile
 # ==============================
 # ✅ CONFIG
 # ==============================
@@ -20,34 +20,43 @@ OUTPUT_FILE = "sampled_route_50m.json"
 # ✅ Fetch FULL Route Geometry
 # ==============================
 
-def fetch_full_route_points(source, destination):
+def fetch_directions(source, destination, alternatives=False):
     """
-    Fetches the complete road-following route geometry
-    using step-by-step polyline decoding.
+    Raw Directions API response. With `alternatives`, Google returns
+    up to three routes instead of one.
     """
-
-    url = "https://maps.googleapis.com/maps/api/directions/json"
+    import requests
+    from config import GOOGLE_MAPS_API_KEY
 
     params = {
         "origin": f"{source[0]},{source[1]}",
         "destination": f"{destination[0]},{destination[1]}",
         "mode": "driving",
+        "alternatives": "true" if alternatives else "false",
         "key": GOOGLE_MAPS_API_KEY
     }
 
-    response = requests.get(url, params=params)
-    data = response.json()
+    acquire("google_directions")
+    with http_call("google_directions"):
+        response = requests.get(DIRECTIONS_URL, params=params)
+        data = response.json()
 
-    if data["status"] != "OK":
-        raise Exception("Directions API Error:", data)
+        if data["status"] != "OK":
+            raise Exception("Directions API Error:", data)
 
-    steps = data["routes"][0]["legs"][0]["steps"]
+    return data
 
-    full_route_points = []
 
-    print("✅ Extracting road geometry from steps...")
+def route_points_from_steps(route):
+    """
+    Decodes every step polyline of one Directions route
+    into a single list of (lat, lng).
+    """
+    import polyline
 
-    for step in steps:
+    full_route_points = []
+
+    for step in route["legs"][0]["steps"]:
         step_polyline = step["polyline"]["points"]
 
         # Decode step polyline into full coordinates
@@ -56,20 +65,56 @@ def fetch_full_route_points(source, destination):
         # Append to full route
         full_route_points.extend(decoded_points)
 
+    return full_route_points
+
+
+@traced("fetch_full_route_points")
+def fetch_full_route_points(source, destination):
+    """
+    Fetches the complete road-following route geometry
+    using step-by-step polyline decoding.
+    """
+
+    data = fetch_directions(source, destination)
+
+    print("✅ Extracting road geometry from steps...")
+
+    full_route_points = route_points_from_steps(data["routes"][0])
+
     print("✅ Total full route points:", len(full_route_points))
 
     return full_route_points
 
 
+@traced("fetch_alternative_route_points")
+def fetch_alternative_route_points(source, destination):
+    """
+    Like fetch_full_route_points, but for every alternative route.
+    Returns [{"summary", "points"}, ...] in Google's order.
+    """
+
+    data = fetch_directions(source, destination, alternatives=True)
+
+    return [
+        {
+            "summary": route.get("summary", ""),
+            "points": route_points_from_steps(route)
+        }
+        for route in data["routes"]
+    ]
+
+
 # ==============================
 # ✅ Accurate Sampling Every 50m
 # ==============================
 
+@traced("sample_route_exact")
 def sample_route_exact(route_points, step_m=50):
     """
     Samples points every `step_m` meters
     along the real curved road geometry.
     """
+    from geopy.distance import geodesic
 
     sampled = [route_points[0]]
     accumulated_distance = 0
@@ -117,7 +162,11 @@ def save_sampled_route(sampled_points, filename):
 if __name__ == "__main__":
     print("\n🚀 Fetching full road-following route...\n")
 
-    full_route = fetch_full_route_points(SOURCE, DESTINATION)
+    route = fetch_directions(SOURCE, DESTINATION)["routes"][0]
+    full_route = route_points_from_steps(route)
+
+    # Step durations → per-segment speeds (used by prefix_builder.py)
+    save_speed_profile(step_speed_profile(route))
 
     print("\n🚀 Sampling route every 50 meters...\n")
 
@@ -0,0 +1,201 @@
+import argparse
+import json
+
+import numpy as np
+
+from detour_energy import detour_geometry
+from instrumentation import stage
+from vehicle_profiles import CRUISE_SPEED_MS, DEFAULT_PROFILE, G, RHO, get_profile
+
+# ==============================
+# CONFIG
+# ==============================
+
+STATIONS_FILE = "stations_with_total_energy.json"
+ROUTE_FILE = "sampled_with_elevation_50m.json"
+PREFIX_FILE = "prefix_arrays.json"
+OUTPUT_FILE = "soc_ensemble.json"
+
+SAMPLES = 4000
+SEED = 42
+
+# Parameter spread. Profile mass_kg includes the profile's nominal
+# payload_kg; samples replace it with a payload spread around it.
+PAYLOAD_SD = 0.34                            # × payload_kg
+PAYLOAD_MAX = 3.4                            # × payload_kg (0 is the minimum)
+BASE_WH_SIGMA = 0.08                         # lognormal multiplier on base_wh_per_km
+REGEN_EFF_SD = 0.10
+HEADWIND_SD_MS = 3.0                         # trip-average wind along the route
+
+
+# ==============================
+# PARAMETER SAMPLES
+# ==============================
+
+def _clipped_normal(rng, spec, n):
+    mean, sd, lo, hi = spec
+    return np.clip(rng.normal(mean, sd, n), lo, hi)
+
+
+def sample_parameters(vehicle, n=SAMPLES, seed=SEED):
+    """
+    n draws of mass, flat consumption and regen efficiency as (n, 1)
+    columns, ready to broadcast against (N,) station arrays.
+    """
+    rng = np.random.default_rng(seed)
+
+    payload = vehicle.get("payload_kg", 0.0)
+    mass = (
+        vehicle["mass_kg"] - payload
+        + _clipped_normal(rng, (payload, PAYLOAD_SD * payload, 0, PAYLOAD_MAX * payload), n)
+    )
+
+    # Headwind only changes the drag share of flat consumption:
+    # drag ∝ (v + w)², rolling resistance stays
+    cd = vehicle.get("cd", 0.29)
+    area = vehicle.get("area_m2", 2.2)
+    aero_wh_per_km = 0.5 * RHO * cd * area * CRUISE_SPEED_MS ** 2 * 1000 / 3600
+
+    headwind = rng.normal(0, HEADWIND_SD_MS, n)
+    wind_wh_per_km = aero_wh_per_km * (
+        np.maximum(1 + headwind / CRUISE_SPEED_MS, 0) ** 2 - 1
+    )
+
+    base = vehicle["base_wh_per_km"] * rng.lognormal(0, BASE_WH_SIGMA, n) + wind_wh_per_km
+    regen = np.clip(rng.normal(vehicle["regen_eff"], REGEN_EFF_SD, n), 0, 1)
+
+    return {
+        "mass_kg": mass[:, None],
+        "base_wh_per_km": base[:, None],
+        "regen_eff": regen[:, None],
+    }
+
+
+# ==============================
+# STATION GEOMETRY
+# ==============================
+
+def station_geometry(stations, route_points, prefix):
+    """
+    Route and detour (km, ascent, descent) to each station's best
+    candidate, the one best_station_soc picks. Returns the station ids
+    and (N,) arrays.
+    """
+    ids = []
+    geom = []
+
+    for station in stations:
+        if not station["candidate_detours"]:
+            continue
+
+        best = min(station["candidate_detours"], key=lambda c: c["total_energy_to_station_kwh"])
+        idx = best["route_idx"]
+
+        ids.append(station["id"])
+        geom.append((
+            prefix["cum_distance_m"][idx] / 1000,
+            prefix["cum_ascent_m"][idx],
+            prefix["cum_descent_m"][idx],
+            *detour_geometry(route_points[idx], station, best.get("detour_road_km")),
+        ))
+
+    geom = np.array(geom, dtype=float).reshape(-1, 6)
+
+    return ids, {
+        "route_km": geom[:, 0],
+        "route_ascent_m": geom[:, 1],
+        "route_descent_m": geom[:, 2],
+        "detour_km": geom[:, 3],
+        "detour_ascent_m": geom[:, 4],
+        "detour_descent_m": geom[:, 5],
+    }
+
+
+def energy_kwh(params, km, ascent_m, descent_m):
+    """energy_to_detour model, (S, 1) parameters × (N,) geometry → (S, N)."""
+    E_flat = km * params["base_wh_per_km"] / 1000
+    E_climb = params["mass_kg"] * G * ascent_m / 3.6e6
+    E_regen = params["mass_kg"] * G * descent_m / 3.6e6 * params["regen_eff"]
+
+    return E_flat + E_climb - E_regen
+
+
+# ==============================
+# ENSEMBLE
+# ==============================
+
+def ensemble_arrival_soc(stations, route_points, prefix, vehicle_name=DEFAULT_PROFILE,
+                         samples=SAMPLES, seed=SEED, start_soc_pct=100):
+    """
+    {station_id: {p10, p50, p90 arrival SOC, probability of arriving
+    above the vehicle's min_soc_pct}} from one (samples × stations)
+    array computation.
+    """
+    vehicle = get_profile(vehicle_name)
+
+    with stage("soc_ensemble", samples=samples) as span:
+        ids, geom = station_geometry(stations, route_points, prefix)
+        span.set("stations", len(ids))
+
+        params = sample_parameters(vehicle, samples, seed)
+
+        route = energy_kwh(params, geom["route_km"], geom["route_ascent_m"], geom["route_descent_m"])
+        detour = energy_kwh(params, geom["detour_km"], geom["detour_ascent_m"], geom["detour_descent_m"])
+
+        # detour_energy_kwh never lets a detour give energy back
+        total = route + np.maximum(detour, 0)
+        soc = start_soc_pct - total / vehicle["battery_kwh"] * 100
+
+        p10, p50, p90 = np.percentile(soc, [10, 50, 90], axis=0)
+        p_reach = (soc >= vehicle["min_soc_pct"]).mean(axis=0)
+
+    return {
+        sid: {
+            "arrival_soc_p10": round(float(a), 2),
+            "arrival_soc_p50": round(float(b), 2),
+            "arrival_soc_p90": round(float(c), 2),
+            "reach_probability": round(float(p), 3),
+        }
+        for sid, a, b, c, p in zip(ids, p10, p50, p90, p_reach)
+    }
+
+
+# ==============================
+# MAIN
+# ==============================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo arrival SOC per station")
+    parser.add_argument("--stations", default=STATIONS_FILE)
+    parser.add_argument("--route", default=ROUTE_FILE)
+    parser.add_argument("--prefix", default=PREFIX_FILE)
+    parser.add_argument("--vehicle", default=DEFAULT_PROFILE)
+    parser.add_argument("--samples", type=int, default=SAMPLES)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--start-soc", type=float, default=100)
+    parser.add_argument("--out", default=OUTPUT_FILE)
+    args = parser.parse_args(argv)
+
+    with open(args.stations) as f:
+        stations = json.load(f)
+
+    with open(args.route) as f:
+        route_points = json.load(f)
+
+    with open(args.prefix) as f:
+        prefix = json.load(f)
+
+    result = ensemble_arrival_soc(
+        stations, route_points, prefix, args.vehicle, args.samples, args.seed, args.start_soc
+    )
+
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2)
+
+    risky = sum(1 for r in result.values() if r["reach_probability"] < 0.9)
+    print(f"✅ {len(result)} stations, {args.samples} samples → {args.out}")
+    print(f"⚠️  {risky} station(s) reached with < 90 % probability")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import json
+import os
+
+import numpy as np
+
+from instrumentation import stage
+
+# ==============================
+# CONFIG
+# ==============================
+
+SPEED_PROFILE_FILE = "route_speed_profile.json"   # written by main.py / sampling_route.py
+PREFIX_FILE = "prefix_arrays.json"
+STATIONS_FILE = "stations_with_total_energy.json"
+OUTPUT_FILE = "station_eta.json"
+
+DEFAULT_SPEED_MS = 25     # fallback when no Directions durations are available
+MIN_SPEED_MS = 2          # clamp odd step durations (U-turns, ferries, 0 s steps)
+MAX_SPEED_MS = 40
+
+# Station access (same approximation as detour_energy.py)
+TWIST_FACTOR = 1.3
+DETOUR_SPEED_MS = 30 / 3.6
+
+DEPARTURE_TIME = "08:00:00"
+
+
+# ==============================
+# Directions steps → speed profile
+# ==============================
+
+def step_speed_profile(route):
+    """
+    Per-step speeds from one Directions route:
+    {"step_end_m": [...], "speed_ms": [...]}, distances as Google reports them.
+    """
+    step_end_m = []
+    speed_ms = []
+    total = 0.0
+
+    for step in route["legs"][0]["steps"]:
+        distance = step["distance"]["value"]
+        duration = step["duration"]["value"]
+
+        if distance <= 0:
+            continue
+
+        total += distance
+        step_end_m.append(total)
+        speed_ms.append(distance / duration if duration > 0 else MAX_SPEED_MS)
+
+    return {"step_end_m": step_end_m, "speed_ms": speed_ms}
+
+
+def save_speed_profile(profile, filename=SPEED_PROFILE_FILE):
+    with open(filename, "w") as f:
+        json.dump(profile, f, indent=2)
+
+    print(f"✅ Speed profile saved → {filename}")
+
+
+def load_speed_profile(filename=SPEED_PROFILE_FILE):
+    if not os.path.exists(filename):
+        return None
+
+    with open(filename) as f:
+        return json.load(f)
+
+
+# ==============================
+# Speed per route segment
+# ==============================
+
+def segment_speeds(cum_distance_m, profile=None):
+    """
+    Speed (m/s) of each of the M segments of a sampled route.
+
+    Each segment takes the speed of the Directions step containing its
+    midpoint. Step boundaries are rescaled to the route's own length, since
+    Google's step distances and our haversine sums differ slightly.
+    """
+    cum_distance_m = np.asarray(cum_distance_m, dtype=float)
+    n_segments = len(cum_distance_m) - 1
+
+    if not profile or not profile["step_end_m"]:
+        return np.full(n_segments, float(DEFAULT_SPEED_MS))
+
+    step_end = np.asarray(profile["step_end_m"], dtype=float)
+    speed = np.clip(np.asarray(profile["speed_ms"], dtype=float), MIN_SPEED_MS, MAX_SPEED_MS)
+
+    step_end *= cum_distance_m[-1] / step_end[-1]
+
+    mid = (cum_distance_m[:-1] + cum_distance_m[1:]) / 2
+    step = np.minimum(np.searchsorted(step_end, mid), len(speed) - 1)
+
+    return speed[step]
+
+
+def build_time_prefix(cum_distance_m, speeds):
+    """
+    cum_time_s[i] = travel time from source → route index i (seconds).
+    """
+    seg_m = np.diff(np.asarray(cum_distance_m, dtype=float))
+    return np.concatenate(([0.0], np.cumsum(seg_m / speeds)))
+
+
+# ==============================
+# ETA lookups (O(1) per candidate)
+# ==============================
+
+def access_eta_s(cum_time_s, route_idx, detour_km,
+                 detour_speed_ms=DETOUR_SPEED_MS, twist_factor=TWIST_FACTOR):
+    """
+    Seconds from departure to a station reached via route index route_idx.
+    Works on scalars or arrays of candidates.
+    """
+    cum_time_s = np.asarray(cum_time_s, dtype=float)
+    detour_s = np.asarray(detour_km, dtype=float) * 1000 * twist_factor / detour_speed_ms
+
+    return cum_time_s[np.asarray(route_idx)] + detour_s
+
+
+def seconds_of_day(hhmmss):
+    h, m, s = (int(x) for x in hhmmss.split(":"))
+    return h * 3600 + m * 60 + s
+
+
+def open_at(open_s, close_s, arrival_s):
+    """
+    Vectorized opening-hours check; handles windows past midnight
+    (close before open).
+    """
+    t = np.asarray(arrival_s) % 86400
+    open_s = np.asarray(open_s)
+    close_s = np.asarray(close_s)
+
+    same_day = (open_s <= t) & (t <= close_s)
+    overnight = (close_s < open_s) & ((t >= open_s) | (t <= close_s))
+
+    return same_day | overnight
+
+
+# ==============================
+# MAIN: station ETAs from the time prefix
+# ==============================
+# prefix_builder.py writes cum_time_s / segment_speed_ms next to
+# cum_distance_m; every candidate's ETA is then a single array lookup.
+
+if __name__ == "__main__":
+
+    with open(PREFIX_FILE) as f:
+        prefix = json.load(f)
+
+    if "cum_time_s" not in prefix:
+        raise Exception(f"{PREFIX_FILE} has no cum_time_s, re-run prefix_builder.py")
+
+    cum_time = np.asarray(prefix["cum_time_s"])
+    print(f"✅ Route travel time: {cum_time[-1] / 3600:.2f} h")
+
+    with open(STATIONS_FILE) as f:
+        stations = json.load(f)
+
+    owners, route_idx, detour_km = [], [], []
+    for s, station in enumerate(stations):
+        for cand in station["candidate_detours"]:
+            owners.append(s)
+            route_idx.append(cand["route_idx"])
+            detour_km.append(cand["detour_to_station_km"])
+
+    with stage("station_eta", candidates=len(route_idx)):
+        eta = access_eta_s(cum_time, route_idx, detour_km)
+
+        departure_s = seconds_of_day(DEPARTURE_TIME)
+        owners = np.array(owners, dtype=int)
+
+        open_s = np.array([seconds_of_day(st.get("open_time") or "00:00:00") for st in stations])
+        close_s = np.array([seconds_of_day(st.get("close_time") or "23:59:59") for st in stations])
+        is_open = open_at(open_s[owners], close_s[owners], departure_s + eta)
+
+    by_station = {}
+    for k, s in enumerate(owners):
+        by_station.setdefault(int(s), []).append({
+            "route_idx": route_idx[k],
+            "eta_min": round(float(eta[k]) / 60, 1),
+            "open_on_arrival": bool(is_open[k]),
+        })
+
+    output = [
+        {
+            "station_id": stations[s]["id"],
+            "name": stations[s]["name"],
+            "candidates": cands,
+        }
+        for s, cands in by_station.items()
+    ]
+
+    with open(OUTPUT_FILE, "w") as f:
+        json.dump(output, f, indent=2)
+
+    print(f"✅ ETAs for {len(route_idx)} candidates (departing {DEPARTURE_TIME}) → {OUTPUT_FILE}")
@@ -0,0 +1,160 @@
+import argparse
+import os
+
+import numpy as np
+
+from instrumentation import stage
+from station_store import STATION_STORE_FILE, STATIONS_FILE, StationStore
+
+# ==============================
+# CONFIG
+# ==============================
+# Stations with an empty `elevation` make detour_energy fall back to the
+# route point's elevation, i.e. no climb to the station. This samples
+# the DEM once for all of them and writes the values into the station
+# store with their source, so later runs find them already filled:
+#   python station_elevation.py                   (store, dem.tif)
+#   python station_elevation.py --dem india.tif --download
+
+DEM_FILE = "dem.tif"
+
+# Rows sampled before (elevation_source set) are never sampled again,
+# including those the DEM had no value for
+SOURCE_FIELD = "elevation_source"
+RESOLUTION_FIELD = "elevation_resolution_m"
+
+
+# ==============================
+# SELECTION
+# ==============================
+
+def missing_elevation(rows, resample=False):
+    """
+    (ids, lats, lons) of stations without an elevation that have not
+    been sampled yet. resample=True also takes previously sampled rows.
+    """
+    ids = []
+    lats = []
+    lons = []
+
+    for row in rows:
+        empty = row.get("elevation") in ("", None)
+        sampled = bool(row.get(SOURCE_FIELD))
+
+        if not (resample and sampled) and (sampled or not empty):
+            continue
+
+        try:
+            lat = float(row["latitude"])
+            lon = float(row["longitude"])
+        except (KeyError, TypeError, ValueError):
+            continue
+
+        ids.append(str(row["id"]))
+        lats.append(lat)
+        lons.append(lon)
+
+    return ids, np.array(lats, dtype=float), np.array(lons, dtype=float)
+
+
+def elevation_ops(ids, elevations, source, resolution_m):
+    """station_store delta upserts; stations the DEM has no value for get an empty elevation."""
+    return [
+        {"op": "upsert", "station": {
+            "id": sid,
+            "elevation": "" if np.isnan(elev) else round(float(elev), 1),
+            SOURCE_FIELD: source,
+            RESOLUTION_FIELD: resolution_m,
+        }}
+        for sid, elev in zip(ids, elevations)
+    ]
+
+
+# ==============================
+# BACKFILL
+# ==============================
+
+def backfill_elevations(store, dem_file=DEM_FILE, resample=False):
+    """
+    Samples the DEM at every station missing an elevation and applies
+    the values to the store. Applying them as deltas invalidates the
+    cached detours and corridor results they change.
+    """
+    import rasterio
+
+    from offline_elevation import dem_resolution_m, sample_dem
+
+    ids, lats, lons = missing_elevation(store.iter_rows(), resample)
+
+    with stage("station_elevation", stations=len(ids)) as span:
+        with rasterio.open(dem_file) as dataset:
+            elevations = sample_dem(dataset, lats, lons)
+            resolution_m = dem_resolution_m(dataset)
+
+        span.set("no_data", int(np.isnan(elevations).sum()))
+
+        source = f"dem:{os.path.basename(dem_file)}"
+        summary = store.apply(elevation_ops(ids, elevations, source, resolution_m))
+
+    summary["sampled"] = len(ids)
+    summary["no_data"] = int(np.isnan(elevations).sum())
+    return summary
+
+
+def station_bounds(rows, margin_deg=0.01):
+    _, lats, lons = missing_elevation(rows)
+    if len(lats) == 0:
+        return None
+
+    return (
+        lons.min() - margin_deg, lats.min() - margin_deg,
+        lons.max() + margin_deg, lats.max() + margin_deg,
+    )
+
+
+# ==============================
+# MAIN
+# ==============================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill missing station elevations from a DEM")
+    parser.add_argument("--store", default=STATION_STORE_FILE)
+    parser.add_argument("--csv", default=STATIONS_FILE, help="imported first if the store does not exist")
+    parser.add_argument("--dem", default=DEM_FILE)
+    parser.add_argument("--download", action="store_true",
+                        help="download a DEM covering the stations if --dem is missing")
+    parser.add_argument("--resample", action="store_true",
+                        help="also resample stations filled by an earlier run")
+    args = parser.parse_args(argv)
+
+    new_store = not os.path.exists(args.store)
+    store = StationStore(args.store)
+
+    if new_store:
+        print("✅ Imported stations:", store.import_csv(args.csv))
+
+    if not os.path.exists(args.dem):
+        if not args.download:
+            store.close()
+            raise Exception(f"{args.dem} not found, pass --download to fetch it")
+
+        from offline_elevation import download_dem_bounds
+
+        bounds = station_bounds(store.iter_rows())
+        if bounds is None:
+            store.close()
+            print("✅ No station is missing an elevation")
+            return
+
+        download_dem_bounds(bounds, args.dem)
+
+    summary = backfill_elevations(store, args.dem, args.resample)
+    store.close()
+
+    print(f"✅ Sampled {summary['sampled']} station elevations "
+          f"({summary['no_data']} outside the DEM or nodata)")
+    print("✅ Applied:", {k: summary[k] for k in ("upserts", "stale_corridors")})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import json
+import os
+
+from branca.element import MacroElement
+from folium.plugins import MarkerCluster
+from jinja2 import Template
+
+from instrumentation import traced
+
+# -----------------------------
+# LAYER SETTINGS
+# -----------------------------
+# Geohash precision 4 ≈ 39 km × 20 km cells: a national station set
+# becomes a few thousand buckets, one Pune corridor only a handful.
+BUCKET_PRECISION = 4
+VIEWPORT_PADDING = 0.25   # load buckets slightly outside the visible map
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+# -----------------------------
+# GEOHASH
+# -----------------------------
+def geohash_encode(lat, lon, precision=BUCKET_PRECISION):
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                bits = (bits << 1) | 1
+                lon_lo = mid
+            else:
+                bits = bits << 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_lo = mid
+            else:
+                bits = bits << 1
+                lat_hi = mid
+
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(chars)
+
+
+def geohash_bbox(geohash):
+    """
+    Returns (south, west, north, east) of a geohash cell.
+    """
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    even = True
+
+    for ch in geohash:
+        value = _BASE32.index(ch)
+
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                if bit:
+                    lon_lo = mid
+                else:
+                    lon_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+
+            even = not even
+
+    return lat_lo, lon_lo, lat_hi, lon_hi
+
+
+# -----------------------------
+# BUCKET INDEX
+# -----------------------------
+def build_bucket_index(rows, precision=BUCKET_PRECISION):
+    """
+    Groups compact rows [lat, lon, ...] by geohash cell.
+    Returns {geohash: [row, ...]}.
+    """
+    buckets = {}
+
+    for row in rows:
+        key = geohash_encode(row[0], row[1], precision)
+        buckets.setdefault(key, []).append(row)
+
+    return buckets
+
+
+def tile_dir_for(output_file, tile_dir=None):
+    """
+    Tile folder for a map saved as output_file: by default next to it
+    (detour_map.html → detour_map_tiles/); tile_dir=False embeds the
+    stations instead (returns None); any other tile_dir is used as is.
+    """
+    if tile_dir is None:
+        return os.path.splitext(output_file)[0] + "_tiles"
+    return tile_dir or None
+
+
+# -----------------------------
+# VIEWPORT-DRIVEN CLUSTER LAYER
+# -----------------------------
+# Rows are compact arrays. Column layout:
+#   0 lat, 1 lon, 2 tooltip, 3.. popup values
+#   (+ detour_lat, detour_lon, detour label as the last three when
+#    `with_detours` is set)
+# Popup HTML is produced from `popup_template` on first open only.
+# Detour point + connector belong to their station marker: they are only
+# drawn while that marker is shown on its own, never for clustered ones.
+# Tiles are small scripts that hand their rows to StationTiles.load, so
+# they load from file:// as well as over HTTP.
+_STATION_LAYER_TEMPLATE = """
+{% macro script(this, kwargs) %}
+    (function() {
+        var map = {{ this._parent.get_name() }};
+        var cluster = {{ this.cluster.get_name() }};
+        var popupTemplate = {{ this.popup_template_json }};
+        var iconOptions = {{ this.icon_json }};
+        var withDetours = {{ this.with_detours_json }};
+        var tileUrl = {{ this.tile_url_json }};
+        var buckets = {{ this.buckets_json }};
+        var loaded = {};
+
+        window.StationTiles = window.StationTiles || {layers: {}, load: function(layer, h, rows) {
+            window.StationTiles.layers[layer](rows);
+        }};
+        window.StationTiles.layers[{{ this.layer_id_json }}] = addRows;
+
+        function escapeHtml(v) {
+            return String(v).replace(/[&<>"']/g, function(c) {
+                return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;"}[c];
+            });
+        }
+
+        function popupHtml(row) {
+            return popupTemplate.replace(/\\{(\\d+)\\}/g, function(_, i) {
+                return escapeHtml(row[3 + Number(i)]);
+            });
+        }
+
+        function addRows(rows) {
+            var markers = [];
+            rows.forEach(function(row) {
+                var marker = L.marker([row[0], row[1]], {
+                    icon: L.AwesomeMarkers.icon(iconOptions)
+                });
+                if (row[2]) { marker.bindTooltip(escapeHtml(row[2])); }
+                marker.bindPopup(function() { return popupHtml(row); }, {maxWidth: 300});
+                markers.push(marker);
+
+                if (withDetours) {
+                    var detour = null;
+                    marker.on("add", function() {
+                        if (!detour) {
+                            var n = row.length;
+                            detour = L.layerGroup([
+                                L.circleMarker([row[n - 3], row[n - 2]], {
+                                    radius: 5, color: "red", fill: true, fillOpacity: 0.8
+                                }).bindPopup(escapeHtml(row[n - 1])),
+                                L.polyline([[row[n - 3], row[n - 2]], [row[0], row[1]]], {
+                                    weight: 2, color: "orange"
+                                }).bindTooltip("Detour Connection")
+                            ]);
+                        }
+                        detour.addTo(map);
+                    });
+                    marker.on("remove", function() {
+                        if (detour) { map.removeLayer(detour); }
+                    });
+                }
+            });
+            cluster.addLayers(markers);
+        }
+
+        function refresh() {
+            var view = map.getBounds().pad({{ this.padding }});
+            buckets.forEach(function(b) {
+                if (loaded[b.h]) { return; }
+                var cell = L.latLngBounds([b.b[0], b.b[1]], [b.b[2], b.b[3]]);
+                if (!view.intersects(cell)) { return; }
+                loaded[b.h] = true;
+
+                if (b.r) {
+                    addRows(b.r);
+                } else {
+                    var script = document.createElement("script");
+                    script.src = tileUrl + b.h + ".js";
+                    document.head.appendChild(script);
+                }
+            });
+        }
+
+        map.on("moveend", refresh);
+        refresh();
+    })();
+{% endmacro %}
+"""
+
+
+@traced("render_station_layer")
+def add_station_layer(m, rows, popup_template, icon=None, with_detours=False,
+                      precision=BUCKET_PRECISION, tile_dir=None, name="Stations"):
+    """
+    Adds stations to folium map `m` as a marker-cluster layer that only
+    materialises markers for geohash buckets inside the current viewport.
+
+    `rows` are compact lists [lat, lon, tooltip, *popup_values] (tooltip
+    may be None); the popup is rendered client-side from `popup_template`
+    ("{0}", "{1}", ... refer to popup_values) when it is first opened.
+
+    With `tile_dir` (next to the saved HTML), each bucket is written to
+    `<tile_dir>/<geohash>.js` and loaded on demand, so page weight no
+    longer grows with the total station count. tile_dir=None embeds
+    every bucket in the page instead.
+    """
+    buckets = build_bucket_index(rows, precision)
+
+    cluster = MarkerCluster(name=name, chunked_loading=True)
+    cluster.add_to(m)
+
+    layer = MacroElement()
+    layer._name = "StationLayer"
+    layer._template = Template(_STATION_LAYER_TEMPLATE)
+    layer_id = layer.get_name()
+
+    if tile_dir is not None:
+        os.makedirs(tile_dir, exist_ok=True)
+
+    payload = []
+    for key, bucket_rows in buckets.items():
+        entry = {"h": key, "b": [round(v, 5) for v in geohash_bbox(key)]}
+
+        if tile_dir is None:
+            entry["r"] = bucket_rows
+        else:
+            with open(os.path.join(tile_dir, key + ".js"), "w", encoding="utf-8") as f:
+                f.write(f"StationTiles.load({json.dumps(layer_id)},{json.dumps(key)},")
+                json.dump(bucket_rows, f, separators=(",", ":"))
+                f.write(");\n")
+
+        payload.append(entry)
+
+    layer.cluster = cluster
+    layer.layer_id_json = json.dumps(layer_id)
+    layer.padding = VIEWPORT_PADDING
+    layer.popup_template_json = json.dumps(popup_template)
+    layer.icon_json = json.dumps(icon or {"icon": "flash", "markerColor": "blue"})
+    layer.with_detours_json = json.dumps(with_detours)
+    layer.tile_url_json = json.dumps(
+        "" if tile_dir is None else os.path.basename(os.path.normpath(tile_dir)) + "/"
+    )
+    layer.buckets_json = json.dumps(payload, separators=(",", ":"))
+
+    layer.add_to(m)
+
+    return layer
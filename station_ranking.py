@@ -0,0 +1,248 @@
+import argparse
+import json
+
+import numpy as np
+
+from instrumentation import stage
+
+# ==============================
+# CONFIG
+# ==============================
+
+STATIONS_FILE = "stations_with_total_energy.json"
+OUTPUT_FILE = "station_ranking.json"
+
+TOP_K = 10
+
+# criterion → +1 if higher is better, -1 if lower is better
+CRITERIA = {
+    "energy": -1,        # total_energy_to_station_kwh
+    "arrival_soc": +1,   # soc_remaining_at_station_pct
+    "detour": -1,        # detour_to_station_km
+    "rating": +1,        # station ratings (0–5, 0 = unrated)
+    "network": +1,       # 1 if the station's network is preferred
+    "progress": +1,      # source_to_detour_km: further along the route
+}
+
+# arrival_soc is 100 − energy / battery × 100, the same signal as energy:
+# weighting both only rescales it, so it is off by default.
+DEFAULT_WEIGHTS = {
+    "energy": 1.0,
+    "arrival_soc": 0.0,
+    "detour": 0.5,
+    "rating": 0.25,
+    "network": 0.0,
+    "progress": 0.0,
+}
+
+
+def _float(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+# ==============================
+# CANDIDATE ARRAYS
+# ==============================
+
+def candidate_arrays(stations):
+    """
+    Every candidate detour of every station flattened into parallel
+    arrays. Built once per result; each ranking request then only does
+    array math on it.
+    """
+    station_pos = []
+    route_idx = []
+    energy = []
+    soc = []
+    detour = []
+    progress = []
+
+    for pos, station in enumerate(stations):
+        for cand in station["candidate_detours"]:
+            station_pos.append(pos)
+            route_idx.append(cand["route_idx"])
+            energy.append(cand["total_energy_to_station_kwh"])
+            soc.append(cand["soc_remaining_at_station_pct"])
+            detour.append(cand["detour_to_station_km"])
+            progress.append(cand["source_to_detour_km"])
+
+    station_pos = np.array(station_pos, dtype=np.int64)
+
+    # Candidates are contiguous per station: segment starts and the
+    # segment number of every candidate, for per-station reductions
+    new_station = np.r_[True, station_pos[1:] != station_pos[:-1]] if len(station_pos) else np.zeros(0, bool)
+
+    rating = np.array([_float(s.get("ratings")) for s in stations])
+    network_id = np.array([str(s.get("network_id", "")) for s in stations])
+
+    return {
+        "station_pos": station_pos,
+        "group_starts": np.flatnonzero(new_station),
+        "group": np.cumsum(new_station) - 1,
+        "route_idx": np.array(route_idx, dtype=np.int64),
+        "energy": np.array(energy, dtype=float),
+        "arrival_soc": np.array(soc, dtype=float),
+        "detour": np.array(detour, dtype=float),
+        "progress": np.array(progress, dtype=float),
+        "rating": rating[station_pos] if len(station_pos) else rating[:0],
+        "network_id": network_id[station_pos] if len(station_pos) else network_id[:0],
+    }
+
+
+# ==============================
+# SCORING
+# ==============================
+
+def parse_weights(text):
+    """"energy=1,rating=0.5" → {"energy": 1.0, "rating": 0.5}"""
+    weights = {}
+
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        name, value = part.split("=")
+        if name not in CRITERIA:
+            raise Exception(f"Unknown criterion '{name}', expected one of {sorted(CRITERIA)}")
+        weights[name] = float(value)
+
+    return weights
+
+
+def candidate_scores(arrays, weights=None, networks=()):
+    """
+    Weighted sum of min-max normalized criteria, oriented so that higher
+    is always better. weights missing from the request keep their default.
+    """
+    weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+    score = np.zeros(len(arrays["station_pos"]))
+
+    for name, direction in CRITERIA.items():
+        w = weights.get(name, 0.0)
+        if not w or len(score) == 0:
+            continue
+
+        if name == "network":
+            values = np.isin(arrays["network_id"], [str(n) for n in networks]).astype(float)
+        else:
+            values = arrays[name]
+
+        lo, hi = values.min(), values.max()
+        if hi == lo:
+            continue  # no spread, no effect on order
+
+        normalized = (values - lo) / (hi - lo)
+        if direction < 0:
+            normalized = 1 - normalized
+
+        score += w * normalized
+
+    return score
+
+
+def best_per_station(arrays, score):
+    """
+    Index of each station's highest-scoring candidate. Candidates are
+    contiguous per station, so this is a segmented max, O(n).
+    """
+    if len(score) == 0:
+        return arrays["station_pos"]
+
+    group = arrays["group"]
+    group_max = np.maximum.reduceat(score, arrays["group_starts"])
+
+    best = np.flatnonzero(score == group_max[group])
+
+    # First best candidate of each station
+    best_group = group[best]
+    return best[np.r_[True, best_group[1:] != best_group[:-1]]]
+
+
+def top_k(score, k=TOP_K, among=None):
+    """
+    Indices of the k highest scores, best first. argpartition selects
+    them in O(n); only those k are then sorted.
+    """
+    idx = np.arange(len(score)) if among is None else np.asarray(among)
+    if len(idx) == 0:
+        return idx
+
+    k = min(k, len(idx))
+    part = np.argpartition(-score[idx], k - 1)[:k]
+    chosen = idx[part]
+
+    # Best first, ties in input order
+    return chosen[np.lexsort((chosen, -score[chosen]))]
+
+
+def rank(arrays, weights=None, k=TOP_K, networks=(), per_station=True):
+    """
+    Global top-k candidates for one request. per_station=True keeps only
+    each station's best candidate, so k distinct stations come back.
+    """
+    with stage("station_ranking", candidates=len(arrays["station_pos"]), k=k):
+        score = candidate_scores(arrays, weights, networks)
+        among = best_per_station(arrays, score) if per_station else None
+
+        return top_k(score, k, among), score
+
+
+def ranked_rows(stations, arrays, chosen, score):
+    rows = []
+
+    for i in chosen:
+        station = stations[arrays["station_pos"][i]]
+        rows.append({
+            "station_id": station["id"],
+            "name": station["name"],
+            "network_id": station.get("network_id"),
+            "ratings": _float(station.get("ratings")),
+            "route_idx": int(arrays["route_idx"][i]),
+            "energy_used_kwh": round(float(arrays["energy"][i]), 3),
+            "arrival_soc": round(float(arrays["arrival_soc"][i]), 2),
+            "detour_km": round(float(arrays["detour"][i]), 3),
+            "source_to_detour_km": round(float(arrays["progress"][i]), 3),
+            "score": round(float(score[i]), 4),
+        })
+
+    return rows
+
+
+# ==============================
+# MAIN
+# ==============================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Weighted station ranking")
+    parser.add_argument("--stations", default=STATIONS_FILE)
+    parser.add_argument("--weights", default="",
+                        help="e.g. energy=1,detour=0.5,rating=0.5 (others keep defaults)")
+    parser.add_argument("--networks", default="", help="preferred network ids, comma separated")
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--all-candidates", action="store_true",
+                        help="rank every candidate, not just each station's best")
+    parser.add_argument("--out", default=OUTPUT_FILE)
+    args = parser.parse_args(argv)
+
+    with open(args.stations) as f:
+        stations = json.load(f)
+
+    arrays = candidate_arrays(stations)
+    networks = [n for n in args.networks.split(",") if n]
+
+    chosen, score = rank(
+        arrays, parse_weights(args.weights), args.k, networks,
+        per_station=not args.all_candidates
+    )
+    rows = ranked_rows(stations, arrays, chosen, score)
+
+    with open(args.out, "w") as f:
+        json.dump(rows, f, indent=2)
+
+    for r in rows[:5]:
+        print(f"   {r['score']:.3f}  {r['name']} (SOC {r['arrival_soc']}%, detour {r['detour_km']} km)")
+    print(f"✅ Top {len(rows)} of {len(arrays['station_pos'])} candidates → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
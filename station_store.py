@@ -0,0 +1,428 @@
+import argparse
+import csv
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import time
+
+from instrumentation import stage
+
+# ==============================
+# CONFIG
+# ==============================
+# Stations live in one SQLite file with a spatial (grid cell) and an
+# attribute (active) index. Delta feeds update rows in place:
+#   python station_store.py init                    (import stations.csv)
+#   python station_store.py apply deltas.ndjson
+#   python station_store.py follow deltas.ndjson    (tail a feed file)
+#
+# Feed lines (NDJSON):
+#   {"op": "upsert", "station": {"id": "5473", "status": "0", "updated_at": "..."}}
+#   {"op": "delete", "id": "5473"}
+
+STATION_STORE_FILE = os.environ.get("EVJ_STATION_STORE", "station_store.sqlite")
+STATIONS_FILE = "stations.csv"
+
+CELL_DEG = 0.05             # ~5.5 km grid cells
+CORRIDOR_BUFFER_KM = 5      # same radius as filter_stations.MAX_DISTANCE_KM
+FOLLOW_INTERVAL_S = 0.5
+
+GEOMETRY_FIELDS = ("latitude", "longitude", "elevation")
+
+
+# ==============================
+# GRID CELLS
+# ==============================
+
+def cell_of(lat, lon):
+    return f"{math.floor(lat / CELL_DEG)}:{math.floor(lon / CELL_DEG)}"
+
+
+def corridor_cells(route_points, buffer_km=CORRIDOR_BUFFER_KM):
+    """
+    Every cell within buffer_km of the route: route cells grown by enough
+    neighbours to cover the buffer at the route's latitude.
+    """
+    cells = set()
+
+    for p in route_points:
+        i = math.floor(p["lat"] / CELL_DEG)
+        j = math.floor(p["lng"] / CELL_DEG)
+
+        span_i = math.ceil(buffer_km / (CELL_DEG * 111.32))
+        span_j = math.ceil(buffer_km / (CELL_DEG * 111.32 * max(math.cos(math.radians(p["lat"])), 0.01)))
+
+        for di in range(-span_i, span_i + 1):
+            for dj in range(-span_j, span_j + 1):
+                cells.add(f"{i + di}:{j + dj}")
+
+    return cells
+
+
+def route_fingerprint(route_points):
+    h = hashlib.sha1()
+    for p in route_points:
+        h.update(f"{p['lat']:.5f},{p['lng']:.5f};".encode())
+    return h.hexdigest()[:16]
+
+
+def is_active(row):
+    return str(row.get("status")) == "1" and row.get("approved_status") == "APPROVED"
+
+
+# ==============================
+# STORE
+# ==============================
+
+class StationStore:
+
+    def __init__(self, filename=STATION_STORE_FILE):
+        self.db = sqlite3.connect(filename)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS stations (
+                id         TEXT PRIMARY KEY,
+                lat        REAL,
+                lon        REAL,
+                cell       TEXT,
+                active     INTEGER NOT NULL,
+                updated_at TEXT,
+                row        TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS stations_cell ON stations (cell);
+            CREATE INDEX IF NOT EXISTS stations_active ON stations (active);
+
+            CREATE TABLE IF NOT EXISTS corridors (
+                corridor_id TEXT PRIMARY KEY,
+                computed_at REAL NOT NULL,
+                stale       INTEGER NOT NULL DEFAULT 0,
+                result      TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS corridor_cells (
+                corridor_id TEXT NOT NULL,
+                cell        TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS corridor_cells_cell ON corridor_cells (cell);
+        """)
+
+    def close(self):
+        self.db.close()
+
+    # -----------------------------
+    # Rows
+    # -----------------------------
+    @staticmethod
+    def _columns(row):
+        try:
+            lat = float(row["latitude"])
+            lon = float(row["longitude"])
+            cell = cell_of(lat, lon)
+        except (KeyError, TypeError, ValueError):
+            lat = lon = cell = None
+
+        return (
+            str(row["id"]), lat, lon, cell,
+            int(is_active(row)), row.get("updated_at"), json.dumps(row)
+        )
+
+    def _write(self, rows):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO stations (id, lat, lon, cell, active, updated_at, row) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [self._columns(r) for r in rows]
+        )
+
+    def import_csv(self, filename=STATIONS_FILE):
+        with open(filename, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+
+        with self.db:
+            self.db.execute("DELETE FROM stations")
+            self._write(rows)
+
+        return len(rows)
+
+    def get(self, station_id):
+        found = self.db.execute("SELECT row FROM stations WHERE id = ?", (str(station_id),)).fetchone()
+        return json.loads(found[0]) if found else None
+
+    def iter_rows(self, active_only=False, cells=None):
+        """
+        Station rows as stations.csv DictReader would give them, one at
+        a time. cells (e.g. corridor_cells(route)) limits them to those
+        grid cells through the cell index.
+        """
+        where = []
+        if active_only:
+            where.append("active = 1")
+
+        if cells is not None:
+            self.db.execute("CREATE TEMP TABLE IF NOT EXISTS query_cells (cell TEXT PRIMARY KEY)")
+            self.db.execute("DELETE FROM query_cells")
+            self.db.executemany("INSERT OR IGNORE INTO query_cells (cell) VALUES (?)", [(c,) for c in cells])
+            where.append("cell IN (SELECT cell FROM query_cells)")
+
+        query = "SELECT row FROM stations"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY rowid"
+
+        for r, in self.db.execute(query):
+            yield json.loads(r)
+
+    def rows(self, active_only=False, cells=None):
+        return list(self.iter_rows(active_only, cells))
+
+    def export_csv(self, filename=STATIONS_FILE):
+        rows = self.rows()
+        if not rows:
+            return 0
+
+        fields = list(rows[0].keys())
+        with open(filename, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore", quoting=csv.QUOTE_ALL)
+            writer.writeheader()
+            writer.writerows(rows)
+
+        return len(rows)
+
+    # -----------------------------
+    # Delta ingestion
+    # -----------------------------
+    def apply(self, ops):
+        """
+        Applies upserts/deletes in one transaction and invalidates only
+        what they touch:
+          - station went offline or was deleted → removed from cached
+            corridor results right away (no recompute needed)
+          - new, moved, re-elevated or reactivated station → corridors
+            around its old and new cell are marked stale
+          - moved/re-elevated/deleted → its cached detours are dropped
+        """
+        summary = {"upserts": 0, "deletes": 0, "removed_from_results": 0, "stale_corridors": 0}
+
+        remove_ids = {}       # station id → cells
+        stale_cells = set()
+        detour_ids = set()
+
+        with stage("station_delta_apply", ops=len(ops)), self.db:
+
+            for op in ops:
+                if op["op"] == "delete":
+                    sid = str(op["id"])
+                    old = self.get(sid)
+                    if old is None:
+                        continue
+
+                    self.db.execute("DELETE FROM stations WHERE id = ?", (sid,))
+                    remove_ids[sid] = self._cells_of(old)
+                    detour_ids.add(sid)
+                    summary["deletes"] += 1
+                    continue
+
+                if op["op"] != "upsert":
+                    raise Exception(f"Unknown delta op: {op['op']}")
+
+                changes = op["station"]
+                sid = str(changes["id"])
+                old = self.get(sid)
+                new = {**(old or {}), **changes}
+
+                self._write([new])
+                summary["upserts"] += 1
+
+                moved = old is None or any(
+                    str(old.get(k)) != str(new.get(k)) for k in GEOMETRY_FIELDS
+                )
+                was_active = old is not None and is_active(old)
+
+                if moved and old is not None:
+                    detour_ids.add(sid)
+
+                if was_active and not is_active(new) and not moved:
+                    remove_ids[sid] = self._cells_of(new)
+                elif moved or (is_active(new) and not was_active):
+                    stale_cells |= self._cells_of(new) | (self._cells_of(old) if old else set())
+                    if old is not None:
+                        remove_ids[sid] = self._cells_of(old)
+
+            summary["removed_from_results"] = self._remove_from_results(remove_ids)
+            summary["stale_corridors"] = self._mark_stale(stale_cells)
+
+        if detour_ids:
+            from detour_cache import DETOUR_CACHE_FILE, DetourCache
+
+            if os.path.exists(DETOUR_CACHE_FILE):
+                cache = DetourCache()
+                cache.invalidate(detour_ids)
+                cache.close()
+
+        return summary
+
+    @staticmethod
+    def _cells_of(row):
+        try:
+            return {cell_of(float(row["latitude"]), float(row["longitude"]))}
+        except (KeyError, TypeError, ValueError):
+            return set()
+
+    def _corridors_in(self, cells):
+        if not cells:
+            return set()
+
+        cells = list(cells)
+        found = set()
+        for i in range(0, len(cells), 500):
+            chunk = cells[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            found |= {c for c, in self.db.execute(
+                f"SELECT DISTINCT corridor_id FROM corridor_cells WHERE cell IN ({marks})", chunk
+            )}
+        return found
+
+    def _remove_from_results(self, remove_ids):
+        removed = 0
+
+        for sid, cells in remove_ids.items():
+            for corridor_id in self._corridors_in(cells):
+                result, = self.db.execute(
+                    "SELECT result FROM corridors WHERE corridor_id = ?", (corridor_id,)
+                ).fetchone()
+
+                entries = json.loads(result)
+                kept = [e for e in entries if str(e.get("station_id")) != sid]
+
+                if len(kept) != len(entries):
+                    self.db.execute(
+                        "UPDATE corridors SET result = ? WHERE corridor_id = ?",
+                        (json.dumps(kept), corridor_id)
+                    )
+                    removed += 1
+
+        return removed
+
+    def _mark_stale(self, cells):
+        corridors = self._corridors_in(cells)
+
+        self.db.executemany(
+            "UPDATE corridors SET stale = 1 WHERE corridor_id = ?",
+            [(c,) for c in corridors]
+        )
+        return len(corridors)
+
+    # -----------------------------
+    # Corridor results
+    # -----------------------------
+    def register_corridor(self, route_points, result, corridor_id=None):
+        """
+        Caches a planning result (e.g. best_station_soc output) for the
+        corridor around route_points. Returns the corridor id.
+        """
+        corridor_id = corridor_id or route_fingerprint(route_points)
+        cells = corridor_cells(route_points)
+
+        with self.db:
+            self.db.execute("DELETE FROM corridor_cells WHERE corridor_id = ?", (corridor_id,))
+            self.db.executemany(
+                "INSERT INTO corridor_cells (corridor_id, cell) VALUES (?, ?)",
+                [(corridor_id, c) for c in cells]
+            )
+            self.db.execute(
+                "INSERT OR REPLACE INTO corridors (corridor_id, computed_at, stale, result) "
+                "VALUES (?, ?, 0, ?)",
+                (corridor_id, time.time(), json.dumps(result))
+            )
+
+        return corridor_id
+
+    def corridor_result(self, corridor_id):
+        """
+        (result, stale) for a registered corridor, or (None, True).
+        """
+        found = self.db.execute(
+            "SELECT result, stale FROM corridors WHERE corridor_id = ?", (corridor_id,)
+        ).fetchone()
+
+        if found is None:
+            return None, True
+        return json.loads(found[0]), bool(found[1])
+
+
+# ==============================
+# FEED (local stand-in)
+# ==============================
+
+def read_deltas(filename, offset=0):
+    """
+    Complete NDJSON lines after byte `offset`. A half-written last line
+    is left for the next read. Returns (ops, new_offset).
+    """
+    ops = []
+
+    with open(filename, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+
+    end = data.rfind(b"\n") + 1
+    for line in data[:end].splitlines():
+        if line.strip():
+            ops.append(json.loads(line))
+
+    return ops, offset + end
+
+
+def follow(store, filename, interval=FOLLOW_INTERVAL_S):
+    offset = 0
+    print(f"👀 Following {filename} (Ctrl+C to stop)")
+
+    while True:
+        if os.path.exists(filename):
+            ops, offset = read_deltas(filename, offset)
+            if ops:
+                print("✅ Applied:", store.apply(ops))
+        time.sleep(interval)
+
+
+# ==============================
+# MAIN
+# ==============================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Station store with delta ingestion")
+    parser.add_argument("--store", default=STATION_STORE_FILE)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    init = sub.add_parser("init", help="(re)import the full stations CSV")
+    init.add_argument("--csv", default=STATIONS_FILE)
+
+    apply_cmd = sub.add_parser("apply", help="apply an NDJSON delta file once")
+    apply_cmd.add_argument("feed")
+
+    follow_cmd = sub.add_parser("follow", help="tail an NDJSON delta file")
+    follow_cmd.add_argument("feed")
+
+    export = sub.add_parser("export", help="write the store back to CSV")
+    export.add_argument("--csv", default=STATIONS_FILE)
+
+    args = parser.parse_args(argv)
+    store = StationStore(args.store)
+
+    if args.command == "init":
+        print("✅ Imported stations:", store.import_csv(args.csv))
+    elif args.command == "apply":
+        ops, _ = read_deltas(args.feed)
+        print("✅ Applied:", store.apply(ops))
+    elif args.command == "follow":
+        try:
+            follow(store, args.feed)
+        except KeyboardInterrupt:
+            pass
+    elif args.command == "export":
+        print("✅ Exported stations:", store.export_csv(args.csv))
+
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import argparse
+import json
+from itertools import islice
+
+from best_station_soc import build_map_ready_output
+from candidates import find_candidates
+from detour_cache import DETOUR_CACHE_FILE, DetourCache
+from detour_energy import ROAD_GRAPH_FILE, apply_detour_energy, load_router, route_cumulative_km
+from energy_to_detour import add_route_energy
+from filter_stations import STATION_STORE_FILE, STATIONS_FILE, filter_stations, iter_station_rows
+from instrumentation import stage
+from route_pyramid import build_route_pyramid
+
+# ==============================
+# CONFIG
+# ==============================
+
+ROUTE_FILE = "sampled_with_elevation_50m.json"
+PREFIX_FILE = "prefix_arrays.json"
+
+OUTPUT_FILE = "stations_with_total_energy.ndjson"
+BEST_FILE = "map_visualization.ndjson"
+
+# Intermediate artifacts written with --keep-intermediate
+INTERMEDIATE_FILES = {
+    "filter": "filtered_stations.ndjson",
+    "candidates": "stations_with_candidates.ndjson",
+    "energy": "stations_with_energy.ndjson",
+}
+
+CHUNK_SIZE = 2000   # raw station rows held in memory at once
+
+
+# ==============================
+# NDJSON RECORDS
+# ==============================
+
+def read_records(filename):
+    """
+    Records of an NDJSON file, one at a time. A plain .json array is
+    accepted too, but has to be loaded whole.
+    """
+    if filename.endswith(".json"):
+        with open(filename) as f:
+            yield from json.load(f)
+        return
+
+    with open(filename) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def chunked(records, size=CHUNK_SIZE):
+    records = iter(records)
+
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def tee_chunks(chunks, filename):
+    """Passes chunks through, appending each one to an NDJSON file first."""
+    with open(filename, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            for record in chunk:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            yield chunk
+
+
+# ==============================
+# STAGES (chunk generators)
+# ==============================
+# Each stage pulls one chunk from the stage before it and hands it on
+# as soon as it's done, so a chunk reaches the last stage before the
+# first stage reads the next one.
+
+def filter_stage(row_chunks, route_points, route_pyramid):
+    for rows in row_chunks:
+        kept = filter_stations(route_points, rows, route_pyramid=route_pyramid)
+        if kept:
+            yield kept
+
+
+def candidates_stage(chunks, route_points, prefix, route_pyramid):
+    for stations in chunks:
+        yield find_candidates(
+            route_points, prefix["cum_distance_m"], stations,
+            route_pyramid=route_pyramid
+        )
+
+
+def energy_stage(chunks, prefix):
+    for stations in chunks:
+        yield add_route_energy(stations, prefix)
+
+
+def detour_stage(chunks, route_points, road_graph_file=ROAD_GRAPH_FILE,
+                 cache_file=DETOUR_CACHE_FILE):
+    # Cumulative distances, cache and router are set up once for all chunks
+    cumulative_km = route_cumulative_km(route_points)
+    router = load_router(road_graph_file)
+    cache = DetourCache(cache_file or ":memory:")
+
+    try:
+        for stations in chunks:
+            yield apply_detour_energy(stations, route_points, cumulative_km, cache, router)
+    finally:
+        cache.close()
+
+
+def stream_stations(route_points, prefix, station_rows, chunk_size=CHUNK_SIZE,
+                    road_graph_file=ROAD_GRAPH_FILE, cache_file=DETOUR_CACHE_FILE,
+                    intermediate=None):
+    """
+    Filter → candidates → route energy → detour energy over an iterable
+    of raw station rows, yielding scored station chunks. Only one chunk
+    of stations is in memory at a time.
+
+    intermediate: {"filter"|"candidates"|"energy": filename} to also
+    write those stages' records as NDJSON.
+    """
+    intermediate = intermediate or {}
+
+    route_pyramid = build_route_pyramid(
+        [p["lat"] for p in route_points],
+        [p["lng"] for p in route_points],
+        prefix["cum_distance_m"]
+    )
+
+    def keep(chunks, name):
+        if name in intermediate:
+            return tee_chunks(chunks, intermediate[name])
+        return chunks
+
+    chunks = chunked(station_rows, chunk_size)
+    chunks = keep(filter_stage(chunks, route_points, route_pyramid), "filter")
+    chunks = keep(candidates_stage(chunks, route_points, prefix, route_pyramid), "candidates")
+    chunks = keep(energy_stage(chunks, prefix), "energy")
+
+    yield from detour_stage(chunks, route_points, road_graph_file, cache_file)
+
+
+# ==============================
+# MAIN
+# ==============================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Streaming station pipeline (NDJSON)")
+    parser.add_argument("--route", default=ROUTE_FILE)
+    parser.add_argument("--prefix", default=PREFIX_FILE)
+    parser.add_argument("--stations", default=STATIONS_FILE,
+                        help="stations CSV, or an NDJSON/JSON file of station rows")
+    parser.add_argument("--store", default=STATION_STORE_FILE,
+                        help="station store used instead of the CSV when present")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--out", default=OUTPUT_FILE)
+    parser.add_argument("--best", default=BEST_FILE)
+    parser.add_argument("--keep-intermediate", action="store_true")
+    args = parser.parse_args(argv)
+
+    with open(args.route) as f:
+        route_points = json.load(f)
+
+    with open(args.prefix) as f:
+        prefix = json.load(f)
+
+    if args.stations.endswith((".ndjson", ".json")):
+        station_rows = read_records(args.stations)
+    else:
+        station_rows = iter_station_rows(args.stations, args.store, route_points)
+
+    chunks = stream_stations(
+        route_points, prefix, station_rows,
+        chunk_size=args.chunk_size,
+        intermediate=INTERMEDIATE_FILES if args.keep_intermediate else None
+    )
+
+    stations = 0
+    best = 0
+
+    with stage("station_stream") as span, \
+            open(args.out, "w", encoding="utf-8") as out, \
+            open(args.best, "w", encoding="utf-8") as best_out:
+
+        for chunk in chunks:
+            for record in chunk:
+                out.write(json.dumps(record) + "\n")
+
+            for row in build_map_ready_output(chunk, route_points):
+                best_out.write(json.dumps(row) + "\n")
+                best += 1
+
+            stations += len(chunk)
+
+        span.set("stations", stations)
+
+    print("✅ Scored stations:", stations, "→", args.out)
+    print("✅ Best detours:", best, "→", args.best)
+
+
+if __name__ == "__main__":
+    main()
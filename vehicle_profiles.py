@@ -0,0 +1,133 @@
+import json
+import os
+
+import numpy as np
+
+# ==============================
+# CONFIG
+# ==============================
+# Extra or overriding profiles can be listed in this file:
+#   {"my_van": {"battery_kwh": 75, "mass_kg": 2900, "base_wh_per_km": 190}}
+# Missing fields fall back to DEFAULT_PROFILE.
+VEHICLES_FILE = os.environ.get("EVJ_VEHICLES", "vehicles.json")
+
+G = 9.81
+RHO = 1.225
+CRUISE_SPEED_MS = 25      # ~90 km/h, speed the physics profiles are quoted at
+
+
+def base_wh_per_km_from_physics(mass_kg, crr, cd, area_m2, speed_ms=CRUISE_SPEED_MS):
+    """
+    Flat-road consumption (Wh/km) from rolling resistance + still-air drag.
+    """
+    force_n = mass_kg * G * crr + 0.5 * RHO * cd * area_m2 * speed_ms ** 2
+    return force_n * 1000 / 3600
+
+
+# ==============================
+# REGISTRY
+# ==============================
+# mass_kg is the loaded mass (vehicle + passengers + luggage); payload_kg
+# is the nominal passengers + luggage share of it.
+
+DEFAULT_PROFILE = "suv_45kwh"
+
+VEHICLE_PROFILES = {
+
+    # Detour pipeline vehicle (energy_to_detour / detour_energy / best_station_soc)
+    "suv_45kwh": {
+        "battery_kwh": 45,
+        "mass_kg": 2000 + 120 + 70,
+        "payload_kg": 120 + 70,
+        "base_wh_per_km": 30200 / 280,   # ≈108 Wh/km
+        "regen_eff": 0.40,
+        "min_soc_pct": 20,
+        "crr": 0.01,
+        "cd": 0.29,
+        "area_m2": 2.2,
+    },
+
+    # Wind model vehicle (energy_model_with_wind); slope energy is fully recovered there
+    "sedan_60kwh": {
+        "battery_kwh": 60,
+        "mass_kg": 1610 + 120 + 70,
+        "payload_kg": 120 + 70,
+        "base_wh_per_km": base_wh_per_km_from_physics(1800, 0.01, 0.29, 2.2),
+        "regen_eff": 1.0,
+        "min_soc_pct": 20,
+        "crr": 0.01,
+        "cd": 0.29,
+        "area_m2": 2.2,
+    },
+
+    "hatchback_30kwh": {
+        "battery_kwh": 30,
+        "mass_kg": 1450 + 120 + 40,
+        "payload_kg": 120 + 40,
+        "base_wh_per_km": base_wh_per_km_from_physics(1610, 0.009, 0.31, 2.1),
+        "regen_eff": 0.45,
+        "min_soc_pct": 15,
+        "crr": 0.009,
+        "cd": 0.31,
+        "area_m2": 2.1,
+    },
+
+    "van_75kwh": {
+        "battery_kwh": 75,
+        "mass_kg": 2600 + 160 + 300,
+        "payload_kg": 160 + 300,
+        "base_wh_per_km": base_wh_per_km_from_physics(3060, 0.011, 0.36, 3.4),
+        "regen_eff": 0.35,
+        "min_soc_pct": 20,
+        "crr": 0.011,
+        "cd": 0.36,
+        "area_m2": 3.4,
+    },
+}
+
+
+def load_profiles(filename=VEHICLES_FILE):
+    """
+    Built-in profiles merged with the ones in `filename`, if it exists.
+    """
+    profiles = {name: dict(p) for name, p in VEHICLE_PROFILES.items()}
+
+    if filename and os.path.exists(filename):
+        with open(filename) as f:
+            for name, fields in json.load(f).items():
+                base = profiles.get(name, VEHICLE_PROFILES[DEFAULT_PROFILE])
+                profiles[name] = {**base, **fields}
+
+    return profiles
+
+
+def get_profile(name=DEFAULT_PROFILE):
+    profiles = load_profiles()
+
+    if name not in profiles:
+        raise Exception(f"Unknown vehicle profile: {name}")
+
+    return profiles[name]
+
+
+# ==============================
+# FLEET → COLUMN VECTORS
+# ==============================
+
+def profile_arrays(names, profiles=None):
+    """
+    One (N, 1) float array per profile field, ready to broadcast against
+    (M,) per-segment route arrays.
+    """
+    profiles = profiles or load_profiles()
+
+    missing = [n for n in names if n not in profiles]
+    if missing:
+        raise Exception(f"Unknown vehicle profiles: {missing}")
+
+    fields = VEHICLE_PROFILES[DEFAULT_PROFILE].keys()
+
+    return {
+        field: np.array([float(profiles[n][field]) for n in names])[:, None]
+        for field in fields
+    }
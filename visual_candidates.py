@@ -1,81 +1,96 @@
 import json
-import folium
+from instrumentation import stage
+
 
 # -----------------------------
-# LOAD ROUTE POINTS
+# BUILD MAP
 # -----------------------------
-with open("sampled_with_elevation_50m.json") as f:
-    route_points = json.load(f)
+def render_station_candidates(route_points, station, output_file="visual_step7.html"):
+    """One station and its candidate detour points on the route, saved as HTML."""
+    import folium
+    from route_render import add_route_layer
 
-route_coords = [(p["lat"], p["lng"]) for p in route_points]
+    route_coords = [(p["lat"], p["lng"]) for p in route_points]
 
-print("✅ Loaded route points:", len(route_coords))
+    station_lat = float(station["latitude"])
+    station_lon = float(station["longitude"])
 
-# -----------------------------
-# LOAD STATIONS WITH CANDIDATES
-# -----------------------------
-with open("stations_with_candidates.json") as f:
-    stations = json.load(f)
+    candidates = station["candidate_detours"]
 
-print("✅ Loaded stations:", len(stations))
+    # -----------------------------
+    # CREATE MAP CENTERED ON STATION
+    # -----------------------------
+    m = folium.Map(location=[station_lat, station_lon], zoom_start=11)
 
-# -----------------------------
-# PICK ONE STATION TO VISUALIZE
-# -----------------------------
-station = stations[0]   # change index if needed
+    # -----------------------------
+    # DRAW ROUTE LINE
+    # -----------------------------
+    add_route_layer(
+        m,
+        route_coords,
+        weight=4,
+        opacity=0.6,
+    )
 
-station_lat = float(station["latitude"])
-station_lon = float(station["longitude"])
+    # -----------------------------
+    # STATION MARKER (RED)
+    # -----------------------------
+    folium.Marker(
+        location=[station_lat, station_lon],
+        popup=f"⚡ Station: {station['name']}",
+        icon=folium.Icon(color="red", icon="flash"),
+    ).add_to(m)
 
-candidates = station["candidate_detours"]
+    # -----------------------------
+    # CANDIDATE ROUTE POINTS (BLUE)
+    # -----------------------------
+    for c in candidates:
+        idx = c["route_idx"]
+        dist = c.get("detour_to_station_km", c.get("distance_km"))
 
-print("\n📍 Visualizing station:", station["name"])
-print("Candidate points:", len(candidates))
+        lat, lon = route_coords[idx]
 
-# -----------------------------
-# CREATE MAP CENTERED ON STATION
-# -----------------------------
-m = folium.Map(location=[station_lat, station_lon], zoom_start=11)
+        folium.CircleMarker(
+            location=[lat, lon],
+            radius=6,
+            popup=f"Candidate idx={idx} ({dist} km)",
+            color="blue",
+            fill=True,
+            fill_opacity=0.8,
+        ).add_to(m)
 
-# -----------------------------
-# DRAW ROUTE LINE
-# -----------------------------
-folium.PolyLine(
-    route_coords,
-    weight=4,
-    opacity=0.6,
-).add_to(m)
+    # -----------------------------
+    # SAVE MAP OUTPUT
+    # -----------------------------
+    with stage("render_save", file=output_file):
+        m.save(output_file)
 
-# -----------------------------
-# STATION MARKER (RED)
-# -----------------------------
-folium.Marker(
-    location=[station_lat, station_lon],
-    popup=f"⚡ Station: {station['name']}",
-    icon=folium.Icon(color="red", icon="flash"),
-).add_to(m)
+    return output_file
 
-# -----------------------------
-# CANDIDATE ROUTE POINTS (BLUE)
-# -----------------------------
-for c in candidates:
-    idx = c["route_idx"]
-    dist = c["distance_km"]
-
-    lat, lon = route_coords[idx]
-
-    folium.CircleMarker(
-        location=[lat, lon],
-        radius=6,
-        popup=f"Candidate idx={idx} ({dist} km)",
-        color="blue",
-        fill=True,
-        fill_opacity=0.8,
-    ).add_to(m)
 
 # -----------------------------
-# SAVE MAP OUTPUT
+# MAIN
 # -----------------------------
-m.save("visual_step7.html")
+if __name__ == "__main__":
+
+    with open("sampled_with_elevation_50m.json") as f:
+        route_points = json.load(f)
+
+    print("✅ Loaded route points:", len(route_points))
+
+    with open("stations_with_candidates.json") as f:
+        stations = json.load(f)
+
+    print("✅ Loaded stations:", len(stations))
+
+    # -----------------------------
+    # PICK ONE STATION TO VISUALIZE
+    # -----------------------------
+    station = stations[0]   # change index if needed
+
+    print("\n📍 Visualizing station:", station["name"])
+    print("Candidate points:", len(station["candidate_detours"]))
+
+    output_file = render_station_candidates(route_points, station)
 
-print("\n✅ DONE: Open visual_step7.html in browser")
+    print("\n✅ DONE: Open", output_file, "in browser")
@@ -1,102 +1,109 @@
 import json
-import folium
+from instrumentation import stage
 
-# -----------------------------
-# LOAD ROUTE + FINAL MAP DATA
-# -----------------------------
-with open("sampled_with_elevation_50m.json") as f:
-    route = json.load(f)
-
-with open("map_visualization.json") as f:
-    stations = json.load(f)
-
-# -----------------------------
-# SOURCE POINT (Route Start)
-# -----------------------------
-SOURCE = (route[0]["lat"], route[0]["lng"])
-
-# Create map
-m = folium.Map(location=SOURCE, zoom_start=9)
-
-# -----------------------------
-# DRAW FULL ROUTE
-# -----------------------------
-route_coords = [(p["lat"], p["lng"]) for p in route]
-
-folium.PolyLine(
-    route_coords,
-    weight=4,
-    tooltip="Main Route"
-).add_to(m)
-
-# -----------------------------
-# MARK SOURCE POINT
-# -----------------------------
-folium.Marker(
-    location=SOURCE,
-    popup="🚩 Source Location",
-    icon=folium.Icon(icon="play")
-).add_to(m)
 
 # -----------------------------
-# PLOT STATIONS + DETOURS
+# BUILD MAP
 # -----------------------------
-for s in stations:
+def render_detour_map(route, stations, output_file="detour_map.html",
+                      tile_dir=None):
+    """
+    Route plus best detour per station (map_visualization rows), saved as HTML.
+    Station tiles go to <output>_tiles/ next to the HTML unless tile_dir
+    says otherwise (tile_dir=False embeds every station in the page).
+    """
+    import folium
+    from route_render import add_route_layer
+    from station_layers import add_station_layer, tile_dir_for
 
-    # Values already computed
-    source_to_detour = s["source_to_detour_km"]
-    total_distance = s["total_distance_km"]
-    soc = s["arrival_soc"]
-    energy = s["energy_used_kwh"]
+    # -----------------------------
+    # SOURCE POINT (Route Start)
+    # -----------------------------
+    SOURCE = (route[0]["lat"], route[0]["lng"])
 
-    # Popup info
-    popup_text = f"""
-    <b>{s['name']}</b><br><br>
+    # Create map
+    m = folium.Map(location=SOURCE, zoom_start=9)
 
-    🚗 <b>Distance Breakdown</b><br>
-    Source → Detour: {source_to_detour:.2f} km<br>
-    Total Trip Distance: {total_distance:.2f} km<br><br>
+    # -----------------------------
+    # DRAW FULL ROUTE
+    # -----------------------------
+    route_coords = [(p["lat"], p["lng"]) for p in route]
 
-    🔋 Arrival SOC: <b>{soc}%</b><br>
-    ⚡ Energy Used: {energy} kWh<br>
-    """
+    add_route_layer(
+        m,
+        route_coords,
+        weight=4,
+        tooltip="Main Route"
+    )
 
     # -----------------------------
-    # STATION MARKER
+    # MARK SOURCE POINT
     # -----------------------------
     folium.Marker(
-        location=[s["station_lat"], s["station_lon"]],
-        popup=popup_text,
-        icon=folium.Icon(icon="flash")
+        location=SOURCE,
+        popup="🚩 Source Location",
+        icon=folium.Icon(icon="play")
     ).add_to(m)
 
     # -----------------------------
-    # DETOUR POINT MARKER
+    # PLOT STATIONS + DETOURS (Clustered, loaded per viewport)
     # -----------------------------
-    folium.CircleMarker(
-        location=[s["detour_lat"], s["detour_lon"]],
-        radius=5,
-        popup=f"📍 Detour Point (idx={s['best_route_idx']})",
-        color="red",
-        fill=True,
-        fill_opacity=0.8
-    ).add_to(m)
+    # Values already computed; popups are rendered in the browser
+    # from these compact rows only when opened.
+    station_rows = [
+        [
+            s["station_lat"],
+            s["station_lon"],
+            None,
+            s["name"],
+            f"{s['source_to_detour_km']:.2f}",
+            f"{s['total_distance_km']:.2f}",
+            s["arrival_soc"],
+            s["energy_used_kwh"],
+            s["detour_lat"],
+            s["detour_lon"],
+            f"📍 Detour Point (idx={s['best_route_idx']})",
+        ]
+        for s in stations
+    ]
+
+    add_station_layer(
+        m,
+        station_rows,
+        popup_template=(
+            "<b>{0}</b><br><br>"
+            "🚗 <b>Distance Breakdown</b><br>"
+            "Source → Detour: {1} km<br>"
+            "Total Trip Distance: {2} km<br><br>"
+            "🔋 Arrival SOC: <b>{3}%</b><br>"
+            "⚡ Energy Used: {4} kWh<br>"
+        ),
+        tile_dir=tile_dir_for(output_file, tile_dir),
+        icon={"icon": "flash", "markerColor": "blue"},
+        with_detours=True,
+    )
 
     # -----------------------------
-    # LINE: Detour → Station
+    # SAVE FINAL MAP
     # -----------------------------
-    folium.PolyLine(
-        [(s["detour_lat"], s["detour_lon"]),
-         (s["station_lat"], s["station_lon"])],
-        weight=2,
-        color="orange",
-        tooltip="Detour Connection"
-    ).add_to(m)
+    with stage("render_save", file=output_file):
+        m.save(output_file)
+
+    return output_file
+
 
 # -----------------------------
-# SAVE FINAL MAP
+# MAIN
 # -----------------------------
-m.save("detour_map.html")
+if __name__ == "__main__":
+
+    with open("sampled_with_elevation_50m.json") as f:
+        route = json.load(f)
+
+    with open("map_visualization.json") as f:
+        stations = json.load(f)
+
+    output_file = render_detour_map(route, stations)
 
-print("✅ Final Detour Map Saved: detour_map.html")
-print("Total Stations Plotted:", len(stations))
+    print("✅ Final Detour Map Saved:", output_file)
+    print("Total Stations Plotted:", len(stations))
@@ -1,11 +1,11 @@
 import json
-import requests
-from config import OPENWEATHER_API_KEY
+from api_endpoints import FORECAST_URL, WEATHER_URL
+from instrumentation import http_call, traced
+from quota import acquire
 
 INPUT_FILE = "sampled_with_elevation_50m.json"
 OUTPUT_FILE = "sampled_with_elevation_wind.json"
-
-WEATHER_URL = "https://api.openweathermap.org/data/2.5/weather"
+FORECAST_FILE = "wind_forecast.json"
 
 
 # -----------------------------
@@ -19,7 +19,11 @@ def load_data(filename):
 # -----------------------------
 # Fetch wind at midpoint
 # -----------------------------
+@traced("fetch_wind")
 def fetch_wind(lat, lon):
+    import requests
+    from config import OPENWEATHER_API_KEY
+
     params = {
         "lat": lat,
         "lon": lon,
@@ -27,8 +31,10 @@ def fetch_wind(lat, lon):
         "units": "metric"
     }
 
-    res = requests.get(WEATHER_URL, params=params)
-    data = res.json()
+    acquire("openweather")
+    with http_call("openweather"):
+        res = requests.get(WEATHER_URL, params=params)
+        data = res.json()
 
     wind_speed = data["wind"]["speed"]   # m/s
     wind_deg = data["wind"]["deg"]       # direction
@@ -39,6 +45,47 @@ def fetch_wind(lat, lon):
     return wind_speed, wind_deg
 
 
+# -----------------------------
+# Wind forecast (time-indexed)
+# -----------------------------
+# {"time": [epoch s, ...], "wind_speed": [m/s, ...], "wind_deg": [deg, ...]}
+# One series for the whole route, like fetch_wind's midpoint reading.
+
+@traced("fetch_wind_forecast")
+def fetch_wind_forecast(lat, lon):
+    import requests
+    from config import OPENWEATHER_API_KEY
+
+    params = {
+        "lat": lat,
+        "lon": lon,
+        "appid": OPENWEATHER_API_KEY,
+        "units": "metric"
+    }
+
+    acquire("openweather_forecast")
+    with http_call("openweather_forecast"):
+        res = requests.get(FORECAST_URL, params=params)
+        data = res.json()
+
+    entries = data["list"]
+
+    return {
+        "time": [e["dt"] for e in entries],
+        "wind_speed": [e["wind"]["speed"] for e in entries],
+        "wind_deg": [e["wind"]["deg"] for e in entries],
+    }
+
+
+def load_forecast(filename=FORECAST_FILE):
+    forecast = load_data(filename)
+
+    if not forecast["time"] or list(forecast["time"]) != sorted(forecast["time"]):
+        raise Exception(f"{filename}: forecast times must be non-empty and ascending")
+
+    return forecast
+
+
 # -----------------------------
 # Attach wind to all points
 # -----------------------------
@@ -69,6 +116,7 @@ def save_output(data, filename):
 # MAIN
 # -----------------------------
 if __name__ == "__main__":
+    import sys
 
     print("Loading elevation route...")
     points = load_data(INPUT_FILE)
@@ -77,6 +125,12 @@ if __name__ == "__main__":
     mid_lat = midpoint["lat"]
     mid_lon = midpoint["lng"]
 
+    # python wind_data.py --forecast → wind_forecast.json for departure_time.py
+    if "--forecast" in sys.argv:
+        print("Fetching wind forecast at route midpoint...")
+        save_output(fetch_wind_forecast(mid_lat, mid_lon), FORECAST_FILE)
+        sys.exit(0)
+
     print("Fetching wind at route midpoint...")
     wind_speed, wind_deg = fetch_wind(mid_lat, mid_lon)
 